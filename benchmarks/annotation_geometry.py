@@ -0,0 +1,66 @@
+"""Size and codec speed of packed annotation geometry against the old JSON column.
+
+For polygons of increasing vertex count this compares, per polygon, the
+stored bytes and the time to encode/decode them with ``json`` (what the
+``JSON`` column did) and with ``services.geometry``. Coordinates are drawn on
+the 1/64 pixel grid the canvas uses, so the packed form is float32; the
+``float64`` column shows arbitrary decimals, which fall back to float64.
+
+    python benchmarks/annotation_geometry.py --vertices 8 100 1000 10000
+"""
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.geometry import decode_points, encode_points  # noqa: E402
+
+
+def polygon(vertices: int, rnd: random.Random, grid: bool) -> list[dict]:
+    def coordinate() -> float:
+        value = rnd.uniform(0, 8000)
+        return round(value * 64) / 64 if grid else round(value, 2)
+
+    return [{"x": coordinate(), "y": coordinate()} for _ in range(vertices)]
+
+
+def per_call_us(fn, repeat: int) -> float:
+    number = max(1, repeat)
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vertices", type=int, nargs="+", default=[8, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    print(
+        f"{'vertices':>8} | {'json B':>9} {'packed B':>9} {'float64 B':>9} | "
+        f"{'json enc':>9} {'pack enc':>9} | {'json dec':>9} {'pack dec':>9}  (us)"
+    )
+    for vertices in args.vertices:
+        points = polygon(vertices, rnd, grid=True)
+        decimals = polygon(vertices, rnd, grid=False)
+        as_json = json.dumps(points)
+        packed = encode_points(points)
+        assert decode_points(packed) == points
+        assert decode_points(encode_points(decimals)) == decimals
+        repeat = max(1, 20000 // vertices)
+        print(
+            f"{vertices:>8} | {len(as_json.encode()):>9} {len(packed):>9} "
+            f"{len(encode_points(decimals)):>9} | "
+            f"{per_call_us(lambda: json.dumps(points), repeat):>9.1f} "
+            f"{per_call_us(lambda: encode_points(points), repeat):>9.1f} | "
+            f"{per_call_us(lambda: json.loads(as_json), repeat):>9.1f} "
+            f"{per_call_us(lambda: decode_points(packed), repeat):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Files per second of the ``mmap`` metadata reader against the Pillow path.
+
+Copies each sample image ``--copies`` times into a scratch directory (so the
+page cache is warm for both readers, as during a re-import) and extracts the
+metadata of every copy with ``extract_exif`` and with
+``extract_exif_pillow``. Without ``--files`` the images in ``image_data/``
+are used, plus a synthetic 4000x3000 DJI frame with GPS and XMP attitude.
+
+    python benchmarks/exif_extraction.py --copies 500 --files /data/DJI_0001.JPG
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, TiffImagePlugin  # noqa: E402
+
+from services.exif import extract_exif, extract_exif_pillow  # noqa: E402
+
+IMAGE_DATA = Path(__file__).resolve().parent.parent / "image_data"
+
+DJI_XMP = (
+    b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+    b'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description '
+    b'xmlns:drone-dji="http://www.dji.com/drone-dji/1.0/" drone-dji:AbsoluteAltitude="+120.52" '
+    b'drone-dji:GimbalRollDegree="+0.00" drone-dji:GimbalYawDegree="+87.30" '
+    b'drone-dji:GimbalPitchDegree="-90.00" drone-dji:FlightRollDegree="+1.20" '
+    b'drone-dji:FlightYawDegree="+86.90" drone-dji:FlightPitchDegree="-2.10"/>'
+    b"</rdf:RDF></x:xmpmeta>"
+)
+
+
+def synthetic_dji(path: Path) -> None:
+    """A DJI-like JPEG: EXIF, GPS and an XMP APP1 segment after the EXIF one."""
+    ratio = TiffImagePlugin.IFDRational
+    exif = Image.Exif()
+    exif[0x010F], exif[0x0110], exif[0x0132] = "DJI", "FC6310", "2024:05:06 07:08:09"
+    exif[0x8769] = {0x829A: ratio(1, 500), 0x829D: ratio(56, 10), 0x8827: 100}
+    exif[0x8825] = {
+        1: "N", 2: (ratio(45), ratio(57), ratio(3211, 100)),
+        3: "E", 4: (ratio(12), ratio(17), ratio(356, 100)), 6: ratio(12052, 100),
+    }
+    Image.effect_noise((4000, 3000), 64).convert("RGB").save(path, exif=exif, quality=85)
+    data = path.read_bytes()
+    segment = b"http://ns.adobe.com/xap/1.0/\x00" + DJI_XMP
+    exif_end = 4 + int.from_bytes(data[4:6], "big")
+    path.write_bytes(
+        data[:exif_end] + b"\xff\xe1" + (len(segment) + 2).to_bytes(2, "big") + segment
+        + data[exif_end:]
+    )
+
+
+def files_per_second(extract, paths: list[Path]) -> float:
+    started = time.perf_counter()
+    for path in paths:
+        extract(path)
+    return len(paths) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=200)
+    parser.add_argument("--files", type=Path, nargs="+")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        samples = args.files
+        if not samples:
+            dji = Path(scratch) / "DJI_0001.JPG"
+            synthetic_dji(dji)
+            samples = sorted(IMAGE_DATA.glob("*.jpg")) + [dji]
+
+        print(f"{'file':>24} {'MiB':>6} | {'pillow/s':>9} {'mmap/s':>9} {'speedup':>7} | fields")
+        for sample in samples:
+            copies = []
+            for index in range(args.copies):
+                copy = Path(scratch) / f"{index}{sample.suffix}"
+                shutil.copyfile(sample, copy)
+                copies.append(copy)
+            pillow = files_per_second(extract_exif_pillow, copies)
+            direct = files_per_second(extract_exif, copies)
+            fields = f"{len(extract_exif_pillow(sample))} -> {len(extract_exif(sample))}"
+            print(
+                f"{sample.name[-24:]:>24} {os.path.getsize(sample) / 2**20:>6.1f} | "
+                f"{pillow:>9.0f} {direct:>9.0f} {direct / pillow:>6.1f}x | {fields}"
+            )
+            for copy in copies:
+                copy.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Peak memory and throughput of the streaming exports as the row count grows.
+
+Seeds a scratch SQLite database with ``--rows`` annotations (and as many
+answers) for each size, consumes every export format without keeping the
+output and reports the ``tracemalloc`` peak: with streaming it stays flat
+instead of growing with the number of rows.
+
+    python benchmarks/export_memory.py --rows 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base, create_database_engine  # noqa: E402
+from models import (  # noqa: E402
+    Annotation,
+    Answer,
+    Image,
+    ImageType,
+    Label,
+    Option,
+    Question,
+    User,
+)
+from services.exports import ExportFilters, export_annotations, export_answers  # noqa: E402
+from services.geometry import points_bbox  # noqa: E402
+
+IMAGES = 1000
+CHUNK = 50_000
+
+
+def seed(engine, rows: int) -> None:
+    Base.metadata.create_all(engine)
+    points = [{"x": i * 8.0, "y": (i % 5) * 8.0} for i in range(12)]
+    min_x, min_y, max_x, max_y = points_bbox(points)
+    with engine.begin() as connection:
+        connection.execute(insert(ImageType), [{"id": 1, "name": "Aerea"}])
+        connection.execute(
+            insert(User), [{"id": 1, "username": "bench", "hashed_password": "-", "role": "Esperto"}]
+        )
+        connection.execute(insert(Label), [{"id": 1, "name": "Albero"}])
+        connection.execute(
+            insert(Question),
+            [{"id": q, "question_text": f"Domanda {q}"} for q in range(1, rows // IMAGES + 2)],
+        )
+        connection.execute(insert(Option), [{"id": 1, "question_id": 1, "option_text": "sì"}])
+        connection.execute(
+            insert(Image),
+            [
+                {"id": i, "filename": f"img{i}.jpg", "path": f"/img{i}.jpg", "image_type_id": 1}
+                for i in range(1, IMAGES + 1)
+            ],
+        )
+        table = Annotation.__table__
+        for start in range(0, rows, CHUNK):
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        "image_id": 1 + i % IMAGES, "label_id": 1, "user_id": 1, "geometry": points,
+                        "min_x": min_x, "min_y": min_y, "max_x": max_x, "max_y": max_y,
+                    }
+                    for i in range(start, min(rows, start + CHUNK))
+                ],
+            )
+        # Answers are unique per (image, user, question): spread them over question ids.
+        for start in range(0, rows, CHUNK):
+            connection.execute(
+                Answer.__table__.insert(),
+                [
+                    {
+                        "image_id": 1 + i % IMAGES, "question_id": 1 + i // IMAGES,
+                        "selected_option_id": 1, "user_id": 1,
+                    }
+                    for i in range(start, min(rows, start + CHUNK))
+                ],
+            )
+
+
+def measure(export) -> tuple[float, float, int]:
+    """Peak traced MiB, untraced seconds and output size of one export."""
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in export())
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    for _ in export():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20, elapsed, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'export':>18} {'peak MiB':>9} {'rows/s':>9} {'MiB out':>8}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as scratch:
+            engine = create_database_engine(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+            seed(engine, rows)
+            session_factory = sessionmaker(bind=engine)
+            runs = [
+                (f"annotations {fmt}", export_annotations, fmt) for fmt in ("jsonl", "csv", "coco")
+            ] + [(f"answers {fmt}", export_answers, fmt) for fmt in ("jsonl", "csv")]
+            for name, export, fmt in runs:
+                peak, elapsed, size = measure(lambda: export(session_factory, fmt, ExportFilters()))
+                print(f"{rows:>9} {name:>18} {peak:>9.1f} {rows / elapsed:>9.0f} {size / 2**20:>8.1f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Query plans and latencies of the hot filters before and after migration 0001.
+
+Seeds a scratch database without the indexes added by
+``migrations._hot_filter_indexes``, times the lookups the API performs on
+every image view, applies the migrations and times them again.
+
+    python benchmarks/hot_filter_indexes.py --answers 1000000
+    python benchmarks/hot_filter_indexes.py --database-url postgresql://... --answers 1000000
+
+Use a throwaway PostgreSQL database: the script drops and recreates the schema.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text  # noqa: E402
+
+from database import Base, create_database_engine  # noqa: E402
+from migrations import MIGRATIONS, run_migrations, schema_migrations  # noqa: E402
+from models import Annotation, Answer, Image  # noqa: E402
+
+QUESTIONS = 10
+USERS = 50
+IMAGE_TYPES = 5
+CHUNK = 50_000
+
+QUERIES = {
+    "answers by image+user": (
+        "SELECT * FROM answers WHERE image_id = :image_id AND user_id = :user_id",
+        lambda rnd, n: {"image_id": rnd.randint(1, n["images"]), "user_id": rnd.randint(1, USERS)},
+    ),
+    "answer by image+question+user": (
+        "SELECT * FROM answers WHERE image_id = :image_id AND question_id = :question_id AND user_id = :user_id",
+        lambda rnd, n: {
+            "image_id": rnd.randint(1, n["images"]),
+            "question_id": rnd.randint(1, QUESTIONS),
+            "user_id": rnd.randint(1, USERS),
+        },
+    ),
+    "annotations by image+user": (
+        "SELECT * FROM annotations WHERE image_id = :image_id AND user_id = :user_id",
+        lambda rnd, n: {"image_id": rnd.randint(1, n["images"]), "user_id": rnd.randint(1, USERS)},
+    ),
+    "images by type (first page)": (
+        "SELECT * FROM images WHERE image_type_id = :image_type_id ORDER BY id LIMIT 100",
+        lambda rnd, n: {"image_type_id": rnd.randint(1, IMAGE_TYPES)},
+    ),
+    "image by path": (
+        "SELECT * FROM images WHERE path = :path",
+        lambda rnd, n: {"path": f"/data/img_{rnd.randint(1, n['images']):07d}.jpg"},
+    ),
+}
+
+
+def seed(engine, answers: int) -> dict:
+    images = max(1, answers // (QUESTIONS * USERS // 2))
+    Base.metadata.drop_all(engine)
+    schema_migrations.drop(engine, checkfirst=True)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Recreate the pre-migration schema: drop what migration 0001 adds.
+        for table in (Image.__table__, Answer.__table__, Annotation.__table__):
+            for index in table.indexes:
+                if index.name in (
+                    "ix_images_path",
+                    "ix_images_image_type_id",
+                    "uq_answers_image_user_question",
+                    "ix_annotations_image_user",
+                ):
+                    index.drop(connection)
+        connection.execute(
+            text("INSERT INTO users (id, username, hashed_password, role) VALUES (:id, :u, 'x', 'Esperto')"),
+            [{"id": i, "u": f"user{i}"} for i in range(1, USERS + 1)],
+        )
+        connection.execute(
+            text("INSERT INTO image_types (id, name) VALUES (:id, :name)"),
+            [{"id": i, "name": f"type{i}"} for i in range(1, IMAGE_TYPES + 1)],
+        )
+        connection.execute(
+            text("INSERT INTO questions (id, question_text) VALUES (:id, :q)"),
+            [{"id": i, "q": f"q{i}"} for i in range(1, QUESTIONS + 1)],
+        )
+        connection.execute(
+            text("INSERT INTO options (id, question_id, option_text) VALUES (:id, :q, 'o')"),
+            [{"id": i, "q": i} for i in range(1, QUESTIONS + 1)],
+        )
+        connection.execute(
+            text("INSERT INTO labels (id, name) VALUES (1, 'label')"),
+        )
+        connection.execute(
+            text(
+                "INSERT INTO images (id, filename, path, image_type_id) "
+                "VALUES (:id, :filename, :path, :image_type_id)"
+            ),
+            [
+                {
+                    "id": i,
+                    "filename": f"img_{i:07d}.jpg",
+                    "path": f"/data/img_{i:07d}.jpg",
+                    "image_type_id": i % IMAGE_TYPES + 1,
+                }
+                for i in range(1, images + 1)
+            ],
+        )
+
+    rnd = random.Random(1)
+    rows = []
+    inserted = 0
+    annotation_rows = []
+    for image_id in range(1, images + 1):
+        for user_id in rnd.sample(range(1, USERS + 1), USERS // 2):
+            if inserted >= answers:
+                break
+            annotation_rows.append({"i": image_id, "u": user_id})
+            for question_id in range(1, min(QUESTIONS, answers - inserted) + 1):
+                rows.append({"i": image_id, "q": question_id, "o": question_id, "u": user_id})
+                inserted += 1
+            if len(rows) >= CHUNK:
+                _insert_answers(engine, rows)
+                rows = []
+    _insert_answers(engine, rows)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO annotations (image_id, label_id, points, user_id) "
+                "VALUES (:i, 1, '[]', :u)"
+            ),
+            annotation_rows,
+        )
+        connection.exec_driver_sql("ANALYZE")
+    return {"images": images, "answers": inserted}
+
+
+def _insert_answers(engine, rows: list[dict]) -> None:
+    if not rows:
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO answers (image_id, question_id, selected_option_id, user_id) "
+                "VALUES (:i, :q, :o, :u)"
+            ),
+            rows,
+        )
+
+
+def plan(connection, sql: str, params: dict) -> str:
+    if connection.dialect.name == "sqlite":
+        rows = connection.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+        return "; ".join(row[-1] for row in rows)
+    rows = connection.execute(text("EXPLAIN " + sql), params).all()
+    return "; ".join(row[0].strip() for row in rows[:2])
+
+
+def measure(engine, sizes: dict, runs: int) -> dict:
+    rnd = random.Random(2)
+    results = {}
+    with engine.connect() as connection:
+        for name, (sql, make_params) in QUERIES.items():
+            timings = []
+            for _ in range(runs):
+                params = make_params(rnd, sizes)
+                started = time.perf_counter()
+                connection.execute(text(sql), params).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan(connection, sql, make_params(rnd, sizes)), statistics.median(timings))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_database_engine(url)
+    started = time.perf_counter()
+    sizes = seed(engine, args.answers)
+    print(
+        f"Seeded {sizes['answers']} answers on {sizes['images']} images "
+        f"in {time.perf_counter() - started:.1f}s ({engine.dialect.name})"
+    )
+
+    before = measure(engine, sizes, args.runs)
+    started = time.perf_counter()
+    applied = run_migrations(engine)
+    print(f"Applied {', '.join(applied) or 'nothing'} in {time.perf_counter() - started:.1f}s")
+    assert [version for version, _ in MIGRATIONS] == applied
+    after = measure(engine, sizes, args.runs)
+
+    for name in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        print(f"\n{name}: {ms_before:.3f} ms -> {ms_after:.3f} ms (median of {args.runs})")
+        print(f"  before: {plan_before}")
+        print(f"  after:  {plan_after}")
+
+
+if __name__ == "__main__":
+    main()
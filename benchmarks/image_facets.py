@@ -0,0 +1,105 @@
+"""Latency of ``/images/search`` facets from the aggregate cube and from ``images``.
+
+Seeds a scratch SQLite database with ``--images`` rows spread over a few
+image types, camera models and two years of dates (the triggers fill
+``image_facet_deltas``, folded once before timing), then times the total
+and facets of a search answered by ``image_facet_counts`` against the same
+counts grouped on ``images``, and the fold after ``--changes`` new images.
+
+    python benchmarks/image_facets.py --images 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import true  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base, create_database_engine  # noqa: E402
+from models import Image  # noqa: E402
+from services.facets import fold_facet_deltas  # noqa: E402
+from services.search import ImageSearch, find_images  # noqa: E402
+
+CHUNK = 50_000
+CAMERA_MODELS = ["FC6310", "FC3170", "M3E", "ZH20T", "L1D-20c", "ILCE-7RM4", None]
+
+SEARCHES = [
+    ("all, by month", ImageSearch()),
+    ("2 models, by day", ImageSearch(camera_models=("FC6310", "M3E"), date_interval="day")),
+    ("type + quarter", ImageSearch(
+        image_type_ids=(2,), date_from=date(2024, 1, 1), date_to=date(2024, 3, 31)
+    )),
+]
+
+
+def rows(rnd: random.Random, start: int, stop: int) -> list[dict]:
+    return [
+        {
+            "filename": f"img{i}.jpg", "path": f"/img{i}.jpg",
+            "image_type_id": rnd.choice([1, 2, 3, None]),
+            "exif_camera_model": rnd.choice(CAMERA_MODELS),
+            "exif_datetime": f"{rnd.choice([2023, 2024])}:{rnd.randint(1, 12):02d}:"
+            f"{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00",
+        }
+        for i in range(start, stop)
+    ]
+
+
+def seed(engine, images: int) -> None:
+    Base.metadata.create_all(engine)
+    rnd = random.Random(0)
+    with engine.begin() as connection:
+        for start in range(0, images, CHUNK):
+            stop = min(images, start + CHUNK)
+            connection.execute(Image.__table__.insert(), rows(rnd, start, stop))
+        fold_facet_deltas(connection)
+
+
+def timed(db, search: ImageSearch) -> tuple[float, int]:
+    """Milliseconds for one page with its total and facets, and the total."""
+    started = time.perf_counter()
+    page = find_images(db, search, None, limit=100)
+    return (time.perf_counter() - started) * 1000, page["total"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--changes", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'images':>9} {'search':>18} {'matches':>8} | {'cube ms':>8} {'images ms':>9}")
+    for images in args.images:
+        with tempfile.TemporaryDirectory() as scratch:
+            engine = create_database_engine(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+            seed(engine, images)
+            with sessionmaker(bind=engine)() as db:
+                for name, search in SEARCHES:
+                    cube_ms, total = timed(db, search)
+                    # A filter outside the cube (always true) makes it count on images.
+                    search.exif_conditions = (true(),)
+                    plain_ms, _ = timed(db, search)
+                    search.exif_conditions = ()
+                    print(f"{images:>9} {name:>18} {total:>8} | {cube_ms:>8.1f} {plain_ms:>9.1f}")
+            with engine.begin() as connection:
+                connection.execute(
+                    Image.__table__.insert(),
+                    rows(random.Random(1), images, images + args.changes),
+                )
+                started = time.perf_counter()
+                fold_facet_deltas(connection)
+                fold_ms = (time.perf_counter() - started) * 1000
+            print(f"{images:>9} fold of {args.changes} new images: {fold_ms:.1f} ms")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
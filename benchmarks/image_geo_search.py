@@ -0,0 +1,97 @@
+"""Latency of the area searches on ``/images`` as the catalogue grows.
+
+Seeds a scratch SQLite database with ``--images`` positions spread over a
+region of about 100 x 100 km (SQLite fills the R*Tree through its triggers),
+then times the first page and the total of a bounding box, radius and
+polygon search of increasing size, with and without the position index.
+
+    python benchmarks/image_geo_search.py --images 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base, create_database_engine  # noqa: E402
+from models import Image  # noqa: E402
+from services.geo import parse_geo_area, within  # noqa: E402
+from services.pagination import page_query  # noqa: E402
+
+CHUNK = 50_000
+REGION = (12.0, 45.5, 13.3, 46.4)
+
+SEARCHES = [
+    ("bbox 1 km", {"bbox": "12.60,45.90,12.613,45.909"}),
+    ("bbox 10 km", {"bbox": "12.60,45.90,12.73,45.99"}),
+    ("radius 500 m", {"near": "12.65,45.95", "radius": 500}),
+    ("radius 5 km", {"near": "12.65,45.95", "radius": 5000}),
+    ("polygon 8 km", {"polygon": "12.60,45.90,12.70,45.91,12.68,45.97,12.62,45.96,12.61,45.93"}),
+    ("polygon 40 km", {"polygon": "12.3,45.7,12.8,45.75,12.7,46.1,12.35,46.05"}),
+]
+
+
+def seed(engine, images: int) -> None:
+    Base.metadata.create_all(engine)
+    rnd = random.Random(0)
+    min_lon, min_lat, max_lon, max_lat = REGION
+    with engine.begin() as connection:
+        for start in range(0, images, CHUNK):
+            connection.execute(
+                Image.__table__.insert(),
+                [
+                    {
+                        "filename": f"img{i}.jpg", "path": f"/img{i}.jpg",
+                        "exif_gps_lon": rnd.uniform(min_lon, max_lon),
+                        "exif_gps_lat": rnd.uniform(min_lat, max_lat),
+                    }
+                    for i in range(start, min(images, start + CHUNK))
+                ],
+            )
+
+
+def timed(db, statement) -> tuple[float, float, int]:
+    """Milliseconds for the first page and for the total, and the total."""
+    started = time.perf_counter()
+    db.scalars(page_query(statement, "id", "asc", 100, None)).all()
+    page = time.perf_counter() - started
+    started = time.perf_counter()
+    total = db.scalar(select(func.count()).select_from(statement.subquery()))
+    return page * 1000, (time.perf_counter() - started) * 1000, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(
+        f"{'images':>9} {'search':>14} {'matches':>8} | {'page ms':>8} {'total ms':>8} | "
+        f"{'no index: page':>14} {'total':>8}"
+    )
+    for images in args.images:
+        with tempfile.TemporaryDirectory() as scratch:
+            engine = create_database_engine(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+            seed(engine, images)
+            with sessionmaker(bind=engine)() as db:
+                for name, params in SEARCHES:
+                    area = parse_geo_area(**params)
+                    page, total_ms, total = timed(db, within(select(Image), "sqlite", area))
+                    plain_page, plain_total, _ = timed(db, within(select(Image), "", area))
+                    print(
+                        f"{images:>9} {name:>14} {total:>8} | {page:>8.1f} {total_ms:>8.1f} | "
+                        f"{plain_page:>14.1f} {plain_total:>8.1f}"
+                    )
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Login throughput and API latency during a login storm.
+
+Starts the application under uvicorn on a scratch database, fires concurrent
+``POST /token`` requests for distinct users and, at the same time, probes
+``GET /users/me`` to see how much the storm slows down ordinary requests.
+Each ``--workers`` value is a separate run with that ``PASSWORD_WORKERS``;
+a value of 40 (the size of the request threadpool) approximates the old
+behaviour of hashing inline on every request thread.
+
+    python benchmarks/login_throughput.py --logins 200 --concurrency 32 --workers 40 4
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(database_url: str, users: int) -> None:
+    """Create ``users`` accounts sharing one password hash."""
+    script = (
+        "import sys; sys.path.insert(0, '.')\n"
+        "from passlib.context import CryptContext\n"
+        "from sqlalchemy import text\n"
+        "import models\n"
+        "from database import Base, engine\n"
+        "Base.metadata.create_all(engine)\n"
+        "hashed = CryptContext(schemes=['bcrypt_sha256']).hash('benchmark')\n"
+        "with engine.begin() as connection:\n"
+        "    connection.execute(text(\"INSERT INTO users (username, hashed_password, role) "
+        "VALUES (:u, :h, 'Esperto')\"),\n"
+        f"        [{{'u': f'user{{i}}', 'h': hashed}} for i in range({users})])\n"
+    )
+    env = {**os.environ, "DATABASE_URL": database_url}
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, check=True)
+
+
+def request(url: str, data: dict | None = None, token: str | None = None) -> tuple[int, float, bytes]:
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body)
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            payload, code = response.read(), response.status
+    except urllib.error.HTTPError as exc:
+        payload, code = exc.read(), exc.code
+    return code, (time.perf_counter() - started) * 1000, payload
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run(workers: int, args, database_url: str, image_dir: str) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "IMAGE_DIR": image_dir,
+        "IMAGE_INDEXER_ENABLED": "false",
+        "PASSWORD_WORKERS": str(workers),
+        "PASSWORD_QUEUE_MAX": str(args.logins),
+        "LOGIN_RATE_LIMIT": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        for _ in range(200):
+            try:
+                urllib.request.urlopen(f"{base}/docs", timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        code, _, payload = request(f"{base}/token", {"username": "user0", "password": "benchmark"})
+        assert code == 200, payload
+        token = json.loads(payload)["access_token"]
+
+        probes: list[float] = []
+        stop = threading.Event()
+
+        def probe() -> None:
+            while not stop.is_set():
+                probes.append(request(f"{base}/users/me", token=token)[1])
+                time.sleep(0.01)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(
+                pool.map(
+                    lambda i: request(
+                        f"{base}/token",
+                        {"username": f"user{i % args.users}", "password": "benchmark"},
+                    ),
+                    range(args.logins),
+                )
+            )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        prober.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [ms for code, ms, _ in results if code == 200]
+    return {
+        "ok": len(latencies),
+        "logins_per_s": len(latencies) / elapsed,
+        "login_p50": statistics.median(latencies) if latencies else 0.0,
+        "login_p95": percentile(latencies, 0.95),
+        "probe_p50": statistics.median(probes) if probes else 0.0,
+        "probe_p95": percentile(probes, 0.95),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[40, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    try:
+        database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        image_dir = os.path.join(scratch, "images")
+        os.mkdir(image_dir)
+        seed(database_url, args.users)
+        print(f"{args.logins} logins, {args.concurrency} concurrent clients, {os.cpu_count()} CPUs")
+        for workers in args.workers:
+            result = run(workers, args, database_url, image_dir)
+            print(
+                f"PASSWORD_WORKERS={workers:>3}: {result['ok']} ok, "
+                f"{result['logins_per_s']:.1f} logins/s, "
+                f"login p50 {result['login_p50']:.0f} ms p95 {result['login_p95']:.0f} ms, "
+                f"/users/me p50 {result['probe_p50']:.1f} ms p95 {result['probe_p95']:.1f} ms"
+            )
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,154 @@
+import logging
+import math
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./annotaria.db")
 
-engine = create_engine(DATABASE_URL)
+# Le route JSON più usate possono girare su un motore asincrono (aiosqlite/asyncpg)
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# Pool dei server database (PostgreSQL e simili)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Pragma SQLite applicati a ogni nuova connessione
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB: -65536 keeps up to 64 MiB of pages per connection.
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+}
+
+# Funzioni usate dalle ricerche per raggio, registrate se SQLite è compilato senza
+SQLITE_MATH_FUNCTIONS = {"sin": math.sin, "cos": math.cos, "radians": math.radians}
+
+
+def create_database_engine(url: str = DATABASE_URL) -> Engine:
+    """Build the engine with the pool or pragma profile matching the backend.
+
+    SQLite runs in WAL mode so readers are not blocked while an import or an
+    answer is being written, and waits ``busy_timeout`` ms for the write lock
+    instead of failing with "database is locked". Server databases get a
+    sized pool with pre-ping and periodic connection recycling.
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_engine(url, **_pool_settings())
+    sqlite_engine = create_engine(url)
+    _install_sqlite_pragmas(sqlite_engine)
+    return sqlite_engine
+
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    """Return ``url`` rewritten for the asyncio driver of its backend."""
+    parsed = make_url(url)
+    if parsed.drivername in _ASYNC_DRIVERS.values():
+        return url
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No asyncio driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_async_database_engine(url: str) -> AsyncEngine:
+    """Asyncio counterpart of ``create_database_engine`` with the same profile."""
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_async_engine(url, **_pool_settings())
+    sqlite_engine = create_async_engine(url)
+    _install_sqlite_pragmas(sqlite_engine.sync_engine)
+    return sqlite_engine
+
+
+def _pool_settings() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _install_sqlite_pragmas(sync_engine: Engine) -> None:
+    @event.listens_for(sync_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            try:
+                cursor.execute("SELECT sin(0)")
+            except Exception:
+                _register_math_functions(dbapi_connection)
+        finally:
+            cursor.close()
+
+
+def _register_math_functions(dbapi_connection) -> None:
+    for name, function in SQLITE_MATH_FUNCTIONS.items():
+        dbapi_connection.create_function(
+            name,
+            1,
+            lambda value, function=function: None if value is None else function(value),
+            deterministic=True,
+        )
+
+
+def describe_engine(bind: Engine) -> dict:
+    """Effective settings of ``bind``, read back from the pool and the database."""
+    settings = {"backend": bind.dialect.name, "pool": type(bind.pool).__name__}
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as connection:
+            for name in SQLITE_PRAGMAS:
+                settings[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    else:
+        settings.update(
+            pool_size=bind.pool.size(),
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return settings
+
+
+def log_engine_settings() -> None:
+    settings = describe_engine(engine)
+    logger.info(
+        "Database engine: %s", ", ".join(f"{name}={value}" for name, value in settings.items())
+    )
+    if async_engine is not None:
+        logger.info("Async database engine enabled: %s", async_engine.url.render_as_string())
+
+
+engine = create_database_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+async_engine = (
+    create_async_database_engine(os.getenv("ASYNC_DATABASE_URL") or async_database_url())
+    if DB_ASYNC_ENABLED
+    else None
+)
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    if async_engine is not None
+    else None
+)
+
 Base = declarative_base()
 
 
@@ -19,3 +158,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def dialect_insert(bind, table):
+    """Return an ``INSERT`` supporting ``ON CONFLICT`` for the bound dialect.
+
+    SQLite and PostgreSQL expose ``on_conflict_do_update``; ``None`` is
+    returned for other backends so callers can fall back to the ORM.
+    """
+    name = bind.dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(table)
@@ -1,3 +1,4 @@
+import logging
 import os
 from datetime import datetime, timedelta
 
@@ -10,10 +11,28 @@ from fastapi.templating import Jinja2Templates
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import Base, engine, get_db
+from database import (
+    Base,
+    SessionLocal,
+    async_engine,
+    engine,
+    get_async_db,
+    get_db,
+    log_engine_settings,
+)
+from migrations import run_migrations
 from models import User as UserModel
+from services.passwords import LoginRateGate, PasswordPool
+from services.principals import Principal, principal_cache
+
+# I logger dei servizi (database, indicizzatore, import) scrivono accanto a quelli di uvicorn
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(levelname)s:     %(name)s - %(message)s",
+)
 
 
 class AppSettings(BaseSettings):
@@ -24,8 +43,13 @@ class AppSettings(BaseSettings):
 settings = AppSettings()
 
 Base.metadata.create_all(bind=engine)
+# Indici e vincoli aggiunti a tabelle già esistenti
+run_migrations(engine)
 
 app = FastAPI()
+app.add_event_handler("startup", log_engine_settings)
+if async_engine is not None:
+    app.add_event_handler("shutdown", async_engine.dispose)
 
 # Monta la cartella 'static' accessibile via /static
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -49,13 +73,28 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt_sha256", "bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt gira su un pool dedicato e limitato; i tentativi di login sono limitati per utente
+password_pool = PasswordPool(pwd_context)
+login_gate = LoginRateGate()
+app.state.password_pool = password_pool
+app.state.login_gate = login_gate
+app.add_event_handler("shutdown", password_pool.shutdown)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.verify(plain_password, hashed_password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.verify_async(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_pool.hash(password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_pool.hash_async(password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -67,30 +106,59 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _username_from_token(token: str) -> str:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    user = db.query(UserModel).filter_by(username=username).first()
+        raise _credentials_exception()
+    return username
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+):
+    """Full user row, for routes that read or change the account itself."""
+    user = db.query(UserModel).filter_by(username=_username_from_token(token)).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+) -> Principal:
+    """Cached authorization view of the caller; no query once the principal is cached."""
+    principal = principal_cache.load(db, _username_from_token(token))
+    if principal is None:
+        raise _credentials_exception()
+    return principal
+
+
+async def get_current_principal_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Async twin of ``get_current_principal`` used by the async route handlers."""
+    principal = await principal_cache.load_async(db, _username_from_token(token))
+    if principal is None:
+        raise _credentials_exception()
+    return principal
+
 from routers import (
     annotations,
     answers,
     expert_types,
+    exports,
     image_types,
     images,
     labels,
@@ -98,7 +166,10 @@ from routers import (
     users,
     ui,
 )
-from routers.images import IMAGE_DIR
+from routers.images import IMAGE_DIR, SUPPORTED_IMAGE_EXTENSIONS, register_image
+from services.import_jobs import ImportJobRunner
+from services.indexer import ImageIndexer
+from services.uploads import UploadRunner
 
 app.include_router(images.router)
 app.include_router(image_types.router)
@@ -106,12 +177,39 @@ app.include_router(expert_types.router)
 app.include_router(questions.router)
 app.include_router(answers.router)
 app.include_router(annotations.router)
+app.include_router(exports.router)
 app.include_router(labels.router)
 app.include_router(users.router)
 app.include_router(ui.router)
 
 app.mount("/image_data", StaticFiles(directory=str(IMAGE_DIR)), name="image_data")
 
+# Il watcher registra in background i file nuovi, modificati o rimossi in IMAGE_DIR
+image_indexer = ImageIndexer(
+    IMAGE_DIR,
+    SessionLocal,
+    register_image,
+    SUPPORTED_IMAGE_EXTENSIONS,
+    interval=float(os.getenv("IMAGE_INDEX_INTERVAL", "10")),
+    recursive=os.getenv("IMAGE_INDEX_RECURSIVE", "false").lower() in ("1", "true", "yes"),
+)
+app.state.image_indexer = image_indexer
+if os.getenv("IMAGE_INDEXER_ENABLED", "true").lower() in ("1", "true", "yes"):
+    app.add_event_handler("startup", image_indexer.start)
+    app.add_event_handler("shutdown", image_indexer.stop)
+
+# Le importazioni massive girano in un worker dedicato e riprendono dal checkpoint al riavvio
+import_jobs = ImportJobRunner(SessionLocal, SUPPORTED_IMAGE_EXTENSIONS)
+app.state.import_jobs = import_jobs
+app.add_event_handler("startup", import_jobs.start)
+app.add_event_handler("shutdown", import_jobs.stop)
+
+# I caricamenti riprendibili completati vengono registrati (EXIF compresi) in background
+uploads = UploadRunner(IMAGE_DIR, SessionLocal, register_image)
+app.state.uploads = uploads
+app.add_event_handler("startup", uploads.start)
+app.add_event_handler("shutdown", uploads.stop)
+
 
 @app.get("/", include_in_schema=False)
 def redirect_root_to_ui() -> RedirectResponse:
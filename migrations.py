@@ -0,0 +1,225 @@
+"""Versioned schema migrations for databases created before a model change.
+
+``Base.metadata.create_all`` only creates missing tables, so indexes and
+constraints added to existing tables are applied here. Every step runs once
+in its own transaction and is recorded in ``schema_migrations``; steps are
+written to be harmless on a fresh database where ``create_all`` already
+built the final schema.
+"""
+
+import logging
+from typing import Callable
+
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from models import Annotation, Answer, Image
+from services.facets import create_facet_triggers, facets_supported, rebuild_facet_counts
+from services.geometry import encode_points, geometry_bbox
+from services.geo import create_geo_index
+from services.spatial import create_spatial_index
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _table_index(table, name: str):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def _hot_filter_indexes(connection: Connection) -> None:
+    """Index the columns every listing filters on and make answers unique per expert."""
+    # Keep the most recent answer of each (image, user, question) before enforcing uniqueness.
+    latest = (
+        select(func.max(Answer.id))
+        .group_by(Answer.image_id, Answer.user_id, Answer.question_id)
+        .scalar_subquery()
+    )
+    removed = connection.execute(Answer.__table__.delete().where(Answer.id.not_in(latest))).rowcount
+    if removed:
+        logger.info("Removed %d duplicated answer(s)", removed)
+    for index in (
+        _table_index(Image.__table__, "ix_images_path"),
+        _table_index(Image.__table__, "ix_images_image_type_id"),
+        _table_index(Answer.__table__, "uq_answers_image_user_question"),
+        _table_index(Annotation.__table__, "ix_annotations_image_user"),
+    ):
+        index.create(connection, checkfirst=True)
+
+
+def _packed_annotation_geometry(connection: Connection) -> None:
+    """Move ``annotations.points`` from JSON to the packed ``geometry`` blob."""
+    columns = {column["name"] for column in inspect(connection).get_columns("annotations")}
+    if "points" not in columns:
+        return
+    if "geometry" not in columns:
+        blob_type = LargeBinary().compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE annotations ADD COLUMN geometry {blob_type}"))
+    legacy = Table(
+        "annotations",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("points", JSON),
+        Column("geometry", LargeBinary),
+    )
+    last_id = 0
+    converted = 0
+    while True:
+        rows = connection.execute(
+            select(legacy.c.id, legacy.c.points)
+            .where(legacy.c.id > last_id)
+            .order_by(legacy.c.id)
+            .limit(1000)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            legacy.update().where(legacy.c.id == bindparam("row_id")),
+            [{"row_id": row.id, "geometry": encode_points(row.points or [])} for row in rows],
+        )
+        last_id = rows[-1].id
+        converted += len(rows)
+    connection.execute(text("ALTER TABLE annotations DROP COLUMN points"))
+    logger.info("Packed the geometry of %d annotation(s)", converted)
+
+
+def _annotation_bbox_index(connection: Connection) -> None:
+    """Add the bounding box columns of annotations, index them and fill them in."""
+    columns = {column["name"] for column in inspect(connection).get_columns("annotations")}
+    float_type = Float().compile(dialect=connection.dialect)
+    for name in ("min_x", "min_y", "max_x", "max_y"):
+        if name not in columns:
+            connection.execute(text(f"ALTER TABLE annotations ADD COLUMN {name} {float_type}"))
+    # Created before the backfill: on SQLite the update trigger fills the R*Tree.
+    create_spatial_index(connection)
+    table = Table(
+        "annotations",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("geometry", LargeBinary),
+        *(Column(name, Float) for name in ("min_x", "min_y", "max_x", "max_y")),
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c.geometry)
+            .where(table.c.id > last_id, table.c.min_x.is_(None))
+            .order_by(table.c.id)
+            .limit(1000)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            min_x, min_y, max_x, max_y = geometry_bbox(row.geometry)
+            updates.append(
+                {"row_id": row.id, "min_x": min_x, "min_y": min_y, "max_x": max_x, "max_y": max_y}
+            )
+        connection.execute(table.update().where(table.c.id == bindparam("row_id")), updates)
+        last_id = rows[-1].id
+
+
+def _image_content_hash(connection: Connection) -> None:
+    """Add ``images.content_hash`` with its unique index and the dedup columns of import jobs.
+
+    Existing rows keep a NULL hash; imports compute it the next time they
+    see the file.
+    """
+    inspector = inspect(connection)
+    string_type = String().compile(dialect=connection.dialect)
+    if "content_hash" not in {column["name"] for column in inspector.get_columns("images")}:
+        connection.execute(text(f"ALTER TABLE images ADD COLUMN content_hash {string_type}"))
+    _table_index(Image.__table__, "ix_images_content_hash").create(connection, checkfirst=True)
+    job_columns = {column["name"] for column in inspector.get_columns("import_jobs")}
+    if "dedup" not in job_columns:
+        boolean_type = Boolean().compile(dialect=connection.dialect)
+        connection.execute(
+            text(f"ALTER TABLE import_jobs ADD COLUMN dedup {boolean_type} NOT NULL DEFAULT FALSE")
+        )
+    if "linked" not in job_columns:
+        connection.execute(
+            text("ALTER TABLE import_jobs ADD COLUMN linked INTEGER NOT NULL DEFAULT 0")
+        )
+
+
+def _image_gps_index(connection: Connection) -> None:
+    """Index image positions and, on SQLite, load the existing ones into the R*Tree."""
+    create_geo_index(connection)
+    if connection.dialect.name == "sqlite":
+        connection.execute(
+            text(
+                "INSERT INTO image_rtree "
+                "SELECT id, exif_gps_lon, exif_gps_lon, exif_gps_lat, exif_gps_lat FROM images "
+                "WHERE exif_gps_lat IS NOT NULL AND exif_gps_lon IS NOT NULL "
+                "AND id NOT IN (SELECT id FROM image_rtree)"
+            )
+        )
+
+
+def _image_facet_counts(connection: Connection) -> None:
+    """Start maintaining the facet cube and count the images already registered."""
+    if facets_supported(connection.dialect.name):
+        create_facet_triggers(connection)
+        rebuild_facet_counts(connection)
+
+
+def _orphan_fingerprints(connection: Connection) -> None:
+    """Drop fingerprints of deleted images, left behind where the cascade was not enforced.
+
+    SQLite reuses the id of a deleted image, so such a fingerprint would end
+    up pointing at an unrelated image and make imports skip its file.
+    """
+    connection.execute(
+        text("DELETE FROM image_fingerprints WHERE image_id NOT IN (SELECT id FROM images)")
+    )
+
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ("0001_hot_filter_indexes", _hot_filter_indexes),
+    ("0002_packed_annotation_geometry", _packed_annotation_geometry),
+    ("0003_annotation_bbox_index", _annotation_bbox_index),
+    ("0004_image_content_hash", _image_content_hash),
+    ("0005_image_gps_index", _image_gps_index),
+    ("0006_image_facet_counts", _image_facet_counts),
+    ("0007_orphan_fingerprints", _orphan_fingerprints),
+]
+
+
+def run_migrations(bind: Engine) -> list[str]:
+    """Apply pending migrations in order and return the versions applied."""
+    _metadata.create_all(bind)
+    with bind.connect() as connection:
+        done = set(connection.execute(select(schema_migrations.c.version)).scalars())
+    applied = []
+    for version, step in MIGRATIONS:
+        if version in done:
+            continue
+        with bind.begin() as connection:
+            step(connection)
+            connection.execute(schema_migrations.insert().values(version=version))
+        logger.info("Applied migration %s", version)
+        applied.append(version)
+    return applied
@@ -1,4 +1,6 @@
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
     Column,
     Integer,
     String,
@@ -6,13 +8,15 @@ from sqlalchemy import (
     Text,
     ForeignKey,
     DateTime,
+    Index,
     Table,
     JSON,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 
 from database import Base
+from services.geometry import PackedPoints, points_bbox
 
 
 user_expert_types = Table(
@@ -132,7 +136,9 @@ class Image(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, unique=True, nullable=False)
-    path = Column(String, nullable=False)
+    path = Column(String, nullable=False, index=True)
+    # SHA-256 of the file: the same content is registered only once
+    content_hash = Column(String, unique=True, index=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     exif_datetime = Column(String)
@@ -155,11 +161,105 @@ class Image(Base):
     exif_roll = Column(Float)
     exif_yaw = Column(Float)
 
-    image_type_id = Column(Integer, ForeignKey("image_types.id"))
+    image_type_id = Column(Integer, ForeignKey("image_types.id"), index=True)
     image_type = relationship("ImageType", back_populates="images")
 
     answers = relationship("Answer", back_populates="image")
     annotations = relationship("Annotation", back_populates="image")
+    # Deleted by the ORM too: SQLite does not enforce the ON DELETE CASCADE and reuses ids.
+    fingerprints = relationship(
+        "ImageFingerprint", back_populates="image", cascade="all, delete-orphan"
+    )
+
+
+class ImageFingerprint(Base):
+    """Size/mtime (and optional quick hash) of a file at the time its EXIF was read."""
+
+    __tablename__ = "image_fingerprints"
+
+    path = Column(String, primary_key=True)
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    quick_hash = Column(String, nullable=True)
+    checked_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    image = relationship("Image", back_populates="fingerprints")
+
+
+class ImageFacetCount(Base):
+    """Number of images per (image type, camera model, day), maintained by ``services.facets``."""
+
+    __tablename__ = "image_facet_counts"
+
+    # 0, '' and '' stand for a missing type, camera model and date
+    image_type_id = Column(Integer, primary_key=True)
+    camera_model = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False)
+
+
+class ImageFacetDelta(Base):
+    """+1/-1 written by the ``images`` triggers, folded into ``image_facet_counts``."""
+
+    __tablename__ = "image_facet_deltas"
+
+    id = Column(Integer, primary_key=True)
+    image_type_id = Column(Integer, nullable=False)
+    camera_model = Column(String, nullable=False)
+    day = Column(String, nullable=False)
+    delta = Column(Integer, nullable=False)
+
+
+class ImportJob(Base):
+    """Background directory import with progress counters and a resume checkpoint."""
+
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    directory = Column(String, nullable=False)
+    image_type_id = Column(Integer, ForeignKey("image_types.id", ondelete="SET NULL"))
+    recursive = Column(Boolean, nullable=False, default=False)
+    dedup = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False, default="queued", index=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+
+    files_total = Column(Integer)
+    files_seen = Column(Integer, nullable=False, default=0)
+    created = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    cache_misses = Column(Integer, nullable=False, default=0)
+    linked = Column(Integer, nullable=False, default=0)
+    errors = Column(JSON, nullable=False, default=list)
+    checkpoint_path = Column(String)
+    error_message = Column(Text)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    image_type = relationship("ImageType")
+
+
+class Upload(Base):
+    """Resumable upload; the bytes live in ``IMAGE_DIR/.uploads/<id>.part`` until complete."""
+
+    __tablename__ = "uploads"
+
+    id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    image_type_id = Column(Integer, ForeignKey("image_types.id", ondelete="SET NULL"))
+    length = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+    status = Column(String, nullable=False, default="receiving", index=True)
+    content_hash = Column(String)
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="SET NULL"))
+    error_message = Column(Text)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
 
 
 class Question(Base):
@@ -213,6 +313,11 @@ class Option(Base):
 
 class Answer(Base):
     __tablename__ = "answers"
+    __table_args__ = (
+        # One answer per expert, image and question: saving again updates it in place.
+        # The (image_id, user_id) prefix also serves the per-expert listings.
+        Index("uq_answers_image_user_question", "image_id", "user_id", "question_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     image_id = Column(Integer, ForeignKey("images.id"), nullable=False)
@@ -241,14 +346,26 @@ class Label(Base):
 
 class Annotation(Base):
     __tablename__ = "annotations"
+    __table_args__ = (Index("ix_annotations_image_user", "image_id", "user_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     image_id = Column(Integer, ForeignKey("images.id"), nullable=False)
     label_id = Column(Integer, ForeignKey("labels.id"), nullable=False)
-    points = Column(JSON, nullable=False)
+    # Packed vertices and bounding box, see services.geometry.
+    points = Column("geometry", PackedPoints, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     annotated_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bounding box of ``points``, indexed for window queries (see services.spatial).
+    min_x = Column(Float)
+    min_y = Column(Float)
+    max_x = Column(Float)
+    max_y = Column(Float)
 
     image = relationship("Image", back_populates="annotations")
     user = relationship("User", back_populates="annotations")
     label = relationship("Label", back_populates="annotations")
+
+    @validates("points")
+    def _store_bbox(self, key, points):
+        self.min_x, self.min_y, self.max_x, self.max_y = points_bbox(points)
+        return points
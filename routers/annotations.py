@@ -1,47 +1,154 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
-from database import get_db
-from models import Annotation as AnnotationModel, Label as LabelModel, User as UserModel
+from database import DB_ASYNC_ENABLED, get_async_db, get_db
+from models import Annotation as AnnotationModel, Label as LabelModel
 from schemas.annotation import (
     Annotation as AnnotationSchema,
+    AnnotationBatch,
+    AnnotationBatchResult,
     AnnotationCreate,
     AnnotationUpdate,
 )
-from main import get_current_user
+from main import get_current_principal, get_current_principal_async
+from services.annotations import apply_annotation_batch, apply_annotation_batch_async
+from services.principals import Principal, filter_images_for_user
+from services.spatial import intersecting, parse_bbox
 
 router = APIRouter()
 
 
-@router.post("/annotations/", response_model=AnnotationSchema)
-def create_annotation(
-    annotation: AnnotationCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user),
-):
-    label = db.query(LabelModel).filter_by(id=annotation.label_id).first()
-    if not label:
-        raise HTTPException(status_code=404, detail="Label not found")
-    db_annotation = AnnotationModel(**annotation.dict(), user_id=current_user.id)
-    db.add(db_annotation)
-    db.commit()
-    db.refresh(db_annotation)
-    return db_annotation
+# Everything the response schema reads: lazy loads are not available on an AsyncSession.
+_ANNOTATION_LOAD = selectinload(AnnotationModel.label).selectinload(LabelModel.image_types)
+
+_BBOX_QUERY = Query(
+    None,
+    description="min_x,min_y,max_x,max_y in image pixels: only polygons whose bounding box meets it",
+)
 
 
-@router.get("/annotations/{image_id}", response_model=List[AnnotationSchema])
-def list_annotations(
-    image_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user),
-):
-    return (
-        db.query(AnnotationModel)
-        .filter_by(image_id=image_id, user_id=current_user.id)
-        .all()
+def _window_query(image_id: int, bbox: str | None, principal: Principal, dialect_name: str):
+    """The principal's annotations on a visible image, optionally limited to a window."""
+    statement = filter_images_for_user(
+        select(AnnotationModel)
+        .join(AnnotationModel.image)
+        .where(AnnotationModel.image_id == image_id, AnnotationModel.user_id == principal.id)
+        .order_by(AnnotationModel.id),
+        principal,
     )
+    if bbox is not None:
+        statement = intersecting(statement, dialect_name, image_id, parse_bbox(bbox))
+    return statement
+
+
+if DB_ASYNC_ENABLED:
+
+    @router.post("/annotations/", response_model=AnnotationSchema)
+    async def create_annotation(
+        annotation: AnnotationCreate,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        if await db.get(LabelModel, annotation.label_id) is None:
+            raise HTTPException(status_code=404, detail="Label not found")
+        db_annotation = AnnotationModel(**annotation.dict(), user_id=current_user.id)
+        db.add(db_annotation)
+        await db.commit()
+        return await db.scalar(
+            select(AnnotationModel)
+            .options(_ANNOTATION_LOAD)
+            .filter_by(id=db_annotation.id)
+            .execution_options(populate_existing=True)
+        )
+
+    @router.post("/images/{image_id}/annotations:batch", response_model=AnnotationBatchResult)
+    async def apply_annotations(
+        image_id: int,
+        batch: AnnotationBatch,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        result = await apply_annotation_batch_async(db, image_id, current_user, batch)
+        await db.commit()
+        return result
+
+    @router.get("/images/{image_id}/annotations", response_model=List[AnnotationSchema])
+    async def list_image_annotations(
+        image_id: int,
+        bbox: str | None = _BBOX_QUERY,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        statement = _window_query(image_id, bbox, current_user, db.bind.dialect.name)
+        return (await db.scalars(statement.options(_ANNOTATION_LOAD))).all()
+
+    @router.get("/annotations/{image_id}", response_model=List[AnnotationSchema])
+    async def list_annotations(
+        image_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        return (
+            await db.scalars(
+                select(AnnotationModel)
+                .options(_ANNOTATION_LOAD)
+                .filter_by(image_id=image_id, user_id=current_user.id)
+            )
+        ).all()
+
+else:
+
+    @router.post("/annotations/", response_model=AnnotationSchema)
+    def create_annotation(
+        annotation: AnnotationCreate,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        label = db.query(LabelModel).filter_by(id=annotation.label_id).first()
+        if not label:
+            raise HTTPException(status_code=404, detail="Label not found")
+        db_annotation = AnnotationModel(**annotation.dict(), user_id=current_user.id)
+        db.add(db_annotation)
+        db.commit()
+        db.refresh(db_annotation)
+        return db_annotation
+
+    @router.post("/images/{image_id}/annotations:batch", response_model=AnnotationBatchResult)
+    def apply_annotations(
+        image_id: int,
+        batch: AnnotationBatch,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        result = apply_annotation_batch(db, image_id, current_user, batch)
+        db.commit()
+        return result
+
+    @router.get("/images/{image_id}/annotations", response_model=List[AnnotationSchema])
+    def list_image_annotations(
+        image_id: int,
+        bbox: str | None = _BBOX_QUERY,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        statement = _window_query(image_id, bbox, current_user, db.get_bind().dialect.name)
+        return db.scalars(statement.options(_ANNOTATION_LOAD)).all()
+
+    @router.get("/annotations/{image_id}", response_model=List[AnnotationSchema])
+    def list_annotations(
+        image_id: int,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        return (
+            db.query(AnnotationModel)
+            .filter_by(image_id=image_id, user_id=current_user.id)
+            .all()
+        )
 
 
 @router.put("/annotations/{annotation_id}", response_model=AnnotationSchema)
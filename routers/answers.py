@@ -1,49 +1,108 @@
 from typing import List
 
 from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import get_db
-from models import Answer as AnswerModel, User as UserModel
-from schemas.answer import Answer as AnswerSchema, AnswerCreate
-from main import get_current_user
+from database import DB_ASYNC_ENABLED, get_async_db, get_db
+from models import Answer as AnswerModel
+from schemas.answer import Answer as AnswerSchema, AnswerBatch, AnswerCreate
+from main import get_current_principal, get_current_principal_async
+from services.answers import (
+    upsert_answer,
+    upsert_answer_async,
+    upsert_answers,
+    upsert_answers_async,
+)
+from services.principals import Principal
 
 router = APIRouter()
 
 
-@router.post("/answers/", response_model=AnswerSchema)
-def create_answer(
-    answer: AnswerCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user),
-):
-    db_answer = (
-        db.query(AnswerModel)
-        .filter_by(
+if DB_ASYNC_ENABLED:
+
+    @router.post("/answers/", response_model=AnswerSchema)
+    async def create_answer(
+        answer: AnswerCreate,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        db_answer = await upsert_answer_async(
+            db,
+            image_id=answer.image_id,
+            question_id=answer.question_id,
+            user_id=current_user.id,
+            selected_option_id=answer.selected_option_id,
+        )
+        await db.commit()
+        return db_answer
+
+    @router.post("/images/{image_id}/answers:batch", response_model=List[AnswerSchema])
+    async def save_answers(
+        image_id: int,
+        batch: AnswerBatch,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        db_answers = await upsert_answers_async(db, image_id, current_user, batch.answers)
+        await db.commit()
+        return db_answers
+
+    @router.get("/answers/{image_id}", response_model=List[AnswerSchema])
+    async def list_answers(
+        image_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        return (
+            await db.scalars(
+                select(AnswerModel).filter_by(image_id=image_id, user_id=current_user.id)
+            )
+        ).all()
+
+else:
+
+    @router.post("/answers/", response_model=AnswerSchema)
+    def create_answer(
+        answer: AnswerCreate,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        db_answer = upsert_answer(
+            db,
             image_id=answer.image_id,
             question_id=answer.question_id,
             user_id=current_user.id,
+            selected_option_id=answer.selected_option_id,
+        )
+        db.commit()
+        db.refresh(db_answer)
+        return db_answer
+
+    @router.post("/images/{image_id}/answers:batch", response_model=List[AnswerSchema])
+    def save_answers(
+        image_id: int,
+        batch: AnswerBatch,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        # Serialise before committing: expired rows would be reloaded one by one.
+        saved = [
+            AnswerSchema.model_validate(answer)
+            for answer in upsert_answers(db, image_id, current_user, batch.answers)
+        ]
+        db.commit()
+        return saved
+
+    @router.get("/answers/{image_id}", response_model=List[AnswerSchema])
+    def list_answers(
+        image_id: int,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        return (
+            db.query(AnswerModel)
+            .filter_by(image_id=image_id, user_id=current_user.id)
+            .all()
         )
-        .first()
-    )
-    if db_answer:
-        db_answer.selected_option_id = answer.selected_option_id
-    else:
-        db_answer = AnswerModel(**answer.dict(), user_id=current_user.id)
-        db.add(db_answer)
-    db.commit()
-    db.refresh(db_answer)
-    return db_answer
-
-
-@router.get("/answers/{image_id}", response_model=List[AnswerSchema])
-def list_answers(
-    image_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user),
-):
-    return (
-        db.query(AnswerModel)
-        .filter_by(image_id=image_id, user_id=current_user.id)
-        .all()
-    )
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from database import SessionLocal
+from main import get_current_principal
+from services.exports import (
+    EXTENSIONS,
+    MEDIA_TYPES,
+    ExportFilters,
+    export_annotations,
+    export_answers,
+)
+from services.principals import Principal
+
+router = APIRouter()
+
+
+def require_admin(current_user: Principal = Depends(get_current_principal)):
+    if current_user.role != "Amministratore":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return current_user
+
+
+def export_response(chunks, dataset: str, fmt: str) -> StreamingResponse:
+    """Stream ``chunks`` as a dated attachment named after ``dataset``."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    filename = f"annotaria-{dataset}-{stamp}.{EXTENSIONS[fmt]}"
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/exports/annotations", dependencies=[Depends(require_admin)])
+def export_annotation_dataset(
+    format: Literal["coco", "jsonl", "csv"] = "jsonl",
+    image_type_id: int | None = None,
+    label_id: int | None = None,
+    user_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """Stream every matching annotation of every user as COCO, JSON Lines or CSV."""
+    filters = ExportFilters(image_type_id, label_id, user_id, since, until)
+    return export_response(export_annotations(SessionLocal, format, filters), "annotations", format)
+
+
+@router.get("/exports/answers", dependencies=[Depends(require_admin)])
+def export_answer_dataset(
+    format: Literal["jsonl", "csv"] = "jsonl",
+    image_type_id: int | None = None,
+    user_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """Stream every matching answer of every user as JSON Lines or CSV."""
+    filters = ExportFilters(image_type_id=image_type_id, user_id=user_id, since=since, until=until)
+    return export_response(export_answers(SessionLocal, format, filters), "answers", format)
@@ -4,14 +4,15 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models import ImageType as ImageTypeModel, User as UserModel
+from models import ImageType as ImageTypeModel
 from schemas import ImageType as ImageTypeSchema, ImageTypeCreate
-from main import get_current_user
+from main import get_current_principal
+from services.principals import Principal
 
 router = APIRouter()
 
 
-def require_admin(current_user: UserModel = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_principal)):
     if current_user.role != "Amministratore":
         raise HTTPException(status_code=403, detail="Forbidden")
     return current_user
@@ -1,26 +1,74 @@
+from datetime import date
 from pathlib import Path
 from typing import List
 import os
-import shutil
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
     HTTPException,
     status,
-    UploadFile,
-    File,
-    Form,
+    Query,
+    Request,
     Response,
 )
-from sqlalchemy import false
+from fastapi.responses import FileResponse
+from PIL import Image as PILImage
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from PIL import Image as PILImage, ExifTags
-
-from database import get_db
-from models import Image as ImageModel, ImageType as ImageTypeModel, User as UserModel
-from schemas import (Image as ImageSchema, ImageDetail, ImageUpdate, ImageBulkImportRequest, ImageBulkImportResult,)
-from main import get_current_user
+from starlette.concurrency import run_in_threadpool
+
+from database import DB_ASYNC_ENABLED, get_async_db, get_db
+from models import (
+    Image as ImageModel,
+    ImageFingerprint as ImageFingerprintModel,
+    ImageType as ImageTypeModel,
+    ImportJob as ImportJobModel,
+    Upload as UploadModel,
+)
+from schemas import (ImageDetail, ImagePage, ImageSearchPage, ImageUpdate, ImageBulkImportRequest, ImageBulkImportResult, ImageIndexerStatus, ImageTileInfo, ImageWorkspace, ImportJob as ImportJobSchema, ImageUpload as ImageUploadSchema,)
+from main import get_current_principal, get_current_principal_async
+from services.derivatives import derivative_cache, source_size
+from services.exif import extract_exif
+from services.fingerprints import (
+    content_hash as file_content_hash,
+    is_unchanged,
+    upsert_fingerprints,
+)
+from services.geo import GeoArea, parse_geo_area, within
+from services.import_jobs import describe_job
+from services.importer import import_directory
+from services.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    cached_count,
+    finish_page,
+    invalidate_counts,
+    lookup_count,
+    page_query,
+    paginate_images,
+    store_count,
+)
+from services.principals import Principal, filter_images_for_user, visible_image_type_ids
+from services.registration import image_with_content, register_images_batch
+from services.search import ImageSearch, find_images, parse_exif_filters
+from services.tiles import deep_zoom_info, get_tile, tile_info
+from services.uploads import (
+    StagedFile,
+    TUS_EXTENSIONS,
+    TUS_VERSION,
+    append_upload,
+    create_upload,
+    current_offset,
+    discard_upload,
+    parse_metadata,
+    receive_multipart,
+    repr_digest,
+    safe_filename,
+)
+from services.workspace import load_workspace, neighbor_ids
 
 router = APIRouter()
 
@@ -29,94 +77,63 @@ IMAGE_DIR.mkdir(parents=True, exist_ok=True)
 
 SUPPORTED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".tif", ".tiff", ".png", ".raw", ".nef", ".cr2", ".arw"}
 
-
-def filter_images_for_user(query, user: UserModel | None):
-    """Limit a SQLAlchemy query to images visible to the given user."""
-    if user is None or user.role == "Amministratore":
-        return query
-    allowed_type_ids = {
-        image_type.id
-        for expert_type in user.expert_types
-        for image_type in expert_type.image_types
-        if image_type.id is not None
-    }
-    if not allowed_type_ids:
-        return query.filter(false())
-    return query.filter(ImageModel.image_type_id.in_(allowed_type_ids))
-
-
-def _ratio_to_float(value):
-    return value[0] / value[1] if isinstance(value, tuple) else float(value)
+# Workspaces the annotation page prefetches ahead of the expert
+WORKSPACE_PREFETCH = int(os.getenv("WORKSPACE_PREFETCH", "3"))
+MAX_WORKSPACE_PREFETCH = 10
 
 
-def _convert_to_degrees(value, ref):
-    d, m, s = value
-    decimal = _ratio_to_float(d) + _ratio_to_float(m) / 60 + _ratio_to_float(s) / 3600
-    return -decimal if ref in ["S", "W"] else decimal
-
-
-def require_admin(current_user: UserModel = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_principal)):
     if current_user.role != "Amministratore":
         raise HTTPException(status_code=403, detail="Forbidden")
     return current_user
 
 
-def extract_exif(path: Path):
-    data = {}
-    try:
-        with PILImage.open(path) as img:
-            exif = img._getexif() or {}
-    except Exception:
-        return data
-
-    gps_info = {}
-    for tag_id, value in exif.items():
-        tag = ExifTags.TAGS.get(tag_id, tag_id)
-        if tag == "DateTime":
-            data["exif_datetime"] = value
-        elif tag == "Make":
-            data["exif_camera_make"] = value
-        elif tag == "Model":
-            data["exif_camera_model"] = value
-        elif tag == "LensModel":
-            data["exif_lens_model"] = value
-        elif tag == "FocalLength":
-            data["exif_focal_length"] = _ratio_to_float(value)
-        elif tag in ("FNumber", "ApertureValue"):
-            data["exif_aperture"] = _ratio_to_float(value)
-        elif tag in ("ISOSpeedRatings", "PhotographicSensitivity"):
-            data["exif_iso"] = int(_ratio_to_float(value))
-        elif tag in ("ShutterSpeedValue", "ExposureTime"):
-            data["exif_shutter_speed"] = str(value)
-        elif tag == "Orientation":
-            data["exif_orientation"] = str(value)
-        elif tag == "ImageWidth":
-            data["exif_image_width"] = int(value)
-        elif tag == "ImageLength":
-            data["exif_image_height"] = int(value)
-        elif tag == "GPSInfo":
-            for t in value:
-                sub_tag = ExifTags.GPSTAGS.get(t, t)
-                gps_info[sub_tag] = value[t]
-
-    if gps_info:
-        lat = gps_info.get("GPSLatitude")
-        lat_ref = gps_info.get("GPSLatitudeRef")
-        lon = gps_info.get("GPSLongitude")
-        lon_ref = gps_info.get("GPSLongitudeRef")
-        alt = gps_info.get("GPSAltitude")
-        alt_ref = gps_info.get("GPSAltitudeRef")
-        if lat and lat_ref:
-            data["exif_gps_lat"] = _convert_to_degrees(lat, lat_ref)
-        if lon and lon_ref:
-            data["exif_gps_lon"] = _convert_to_degrees(lon, lon_ref)
-        if alt:
-            altitude = _ratio_to_float(alt)
-            if alt_ref == 1:
-                altitude = -altitude
-            data["exif_gps_alt"] = altitude
-
-    return data
+def _register_image(
+    path: Path,
+    db: Session,
+    image_type_id: int | None = None,
+    content_hash: str | None = None,
+) -> tuple[ImageModel, str]:
+    """Insert or refresh the row of ``path``.
+
+    The returned status is ``"created"``, ``"updated"``, ``"cached"`` when the
+    stored fingerprint shows the file is unchanged and EXIF was not re-read,
+    or ``"linked"`` when another image already holds the same content: the
+    file is then linked to that image instead of getting a row of its own.
+    """
+    resolved_path = path.resolve()
+    stat = resolved_path.stat()
+    fingerprint = db.get(ImageFingerprintModel, str(resolved_path))
+    if (
+        is_unchanged(fingerprint, resolved_path, stat)
+        and fingerprint.image is not None
+        and fingerprint.image.content_hash is not None
+        and (
+            fingerprint.image.path == str(resolved_path)
+            or Path(fingerprint.image.path).exists()
+        )
+    ):
+        cached = fingerprint.image
+        if fingerprint.mtime_ns != stat.st_mtime_ns:
+            fingerprint.mtime_ns = stat.st_mtime_ns
+        if image_type_id is not None and cached.image_type_id != image_type_id:
+            cached.image_type_id = image_type_id
+        if db.dirty:
+            db.commit()
+        return cached, "cached"
+
+    exif_data = extract_exif(resolved_path)
+    digest = content_hash or file_content_hash(resolved_path)
+    registration = register_images_batch(db, [(resolved_path, exif_data, image_type_id, digest)])
+    image_id = registration.ids.get(str(resolved_path))
+    status_label = "created" if registration.created else "updated"
+    if image_id is None:
+        image_id = registration.duplicates[str(resolved_path)]
+        status_label = "linked"
+    upsert_fingerprints(db, [(resolved_path, image_id, stat)])
+    db.commit()
+    result = db.get(ImageModel, image_id)
+    return result, status_label
 
 
 def register_image(
@@ -124,38 +141,14 @@ def register_image(
     db: Session,
     image_type_id: int | None = None,
     *,
+    content_hash: str | None = None,
     return_created: bool = False,
 ) -> ImageModel | tuple[ImageModel, bool]:
-    resolved_path = path.resolve()
-    filename = resolved_path.name
-    existing = db.query(ImageModel).filter_by(path=str(resolved_path)).first()
-    if not existing:
-        existing = db.query(ImageModel).filter_by(filename=filename).first()
-    exif_data = extract_exif(resolved_path)
-    created = False
-    if existing:
-        for key, value in exif_data.items():
-            setattr(existing, key, value)
-        existing.path = str(resolved_path)
-        if image_type_id is not None:
-            existing.image_type_id = image_type_id
-        db.commit()
-        db.refresh(existing)
-        result = existing
-    else:
-        db_image = ImageModel(
-            filename=filename,
-            path=str(resolved_path),
-            image_type_id=image_type_id,
-            **exif_data,
-        )
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
-        result = db_image
-        created = True
+    result, status_label = _register_image(
+        path, db, image_type_id=image_type_id, content_hash=content_hash
+    )
     if return_created:
-        return result, created
+        return result, status_label == "created"
     return result
 
 
@@ -172,12 +165,8 @@ def _ensure_directory_within_root(directory: Path, root: Path) -> Path:
     return resolved
 
 
-def perform_bulk_import(
-    directory: str,
-    image_type_id: int,
-    recursive: bool,
-    db: Session,
-) -> dict:
+def resolve_import_directory(directory: str, image_type_id: int, db: Session) -> Path:
+    """Validate a bulk import request and return the directory to scan."""
     image_type = db.query(ImageTypeModel).filter_by(id=image_type_id).first()
     if not image_type:
         raise HTTPException(status_code=404, detail="Image type not found")
@@ -190,40 +179,33 @@ def perform_bulk_import(
 
     if not target_dir.exists() or not target_dir.is_dir():
         raise HTTPException(status_code=404, detail="Directory non trovata")
+    return target_dir
+
+
+def perform_bulk_import(
+    directory: str,
+    image_type_id: int,
+    recursive: bool,
+    db: Session,
+    dedup: bool = False,
+) -> dict:
+    target_dir = resolve_import_directory(directory, image_type_id, db)
+    return import_directory(
+        db,
+        target_dir,
+        image_type_id,
+        recursive,
+        SUPPORTED_IMAGE_EXTENSIONS,
+        dedup=dedup,
+    )
 
-    iterator = target_dir.rglob("*") if recursive else target_dir.iterdir()
 
-    created = 0
-    updated = 0
-    skipped = 0
-    errors: list[dict[str, str]] = []
+def get_import_job_runner(request: Request):
+    runner = getattr(request.app.state, "import_jobs", None)
+    if runner is None:
+        raise HTTPException(status_code=503, detail="Import jobs are not available")
+    return runner
 
-    for entry in iterator:
-        if entry.is_dir():
-            continue
-        if entry.suffix.lower() not in SUPPORTED_IMAGE_EXTENSIONS:
-            skipped += 1
-            continue
-        try:
-            _, was_created = register_image(entry, db, image_type_id=image_type_id, return_created=True)
-            if was_created:
-                created += 1
-            else:
-                updated += 1
-        except HTTPException as exc:
-            detail = exc.detail if isinstance(exc.detail, str) else str(exc.detail)
-            errors.append({"path": str(entry), "error": detail})
-            db.rollback()
-        except Exception as exc:
-            errors.append({"path": str(entry), "error": str(exc)})
-            db.rollback()
-
-    return {
-        "created": created,
-        "updated": updated,
-        "skipped": skipped,
-        "errors": errors,
-    }
 
 @router.post(
     "/images/import-directory",
@@ -239,19 +221,212 @@ def import_images_from_directory(
         image_type_id=payload.image_type_id,
         recursive=payload.recursive,
         db=db,
+        dedup=payload.dedup,
     )
     return result
 
-@router.get("/images", response_model=List[ImageSchema])
-def read_images(
+
+@router.post(
+    "/images/import-jobs",
+    response_model=ImportJobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)],
+)
+def create_import_job(
+    payload: ImageBulkImportRequest,
+    db: Session = Depends(get_db),
+    runner=Depends(get_import_job_runner),
+):
+    """Queue a directory import and return immediately; poll the job for progress."""
+    target_dir = resolve_import_directory(payload.directory, payload.image_type_id, db)
+    job = runner.submit(
+        db, target_dir, payload.image_type_id, payload.recursive, payload.dedup
+    )
+    return describe_job(job)
+
+
+@router.get(
+    "/images/import-jobs",
+    response_model=List[ImportJobSchema],
+    dependencies=[Depends(require_admin)],
+)
+def list_import_jobs(limit: int = 20, db: Session = Depends(get_db)):
+    jobs = (
+        db.query(ImportJobModel)
+        .order_by(ImportJobModel.id.desc())
+        .limit(max(1, min(limit, 200)))
+        .all()
+    )
+    return [describe_job(job) for job in jobs]
+
+
+@router.get(
+    "/images/import-jobs/{job_id}",
+    response_model=ImportJobSchema,
+    dependencies=[Depends(require_admin)],
+)
+def read_import_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(ImportJobModel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return describe_job(job)
+
+
+@router.post(
+    "/images/import-jobs/{job_id}/cancel",
+    response_model=ImportJobSchema,
+    dependencies=[Depends(require_admin)],
+)
+def cancel_import_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    runner=Depends(get_import_job_runner),
+):
+    job = db.get(ImportJobModel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return describe_job(runner.cancel(db, job))
+
+
+@router.get(
+    "/images/indexer",
+    response_model=ImageIndexerStatus,
+    dependencies=[Depends(require_admin)],
+)
+def read_indexer_status(request: Request):
+    """Expose lag and queue-depth counters of the background image indexer."""
+    indexer = getattr(request.app.state, "image_indexer", None)
+    if indexer is None:
+        raise HTTPException(status_code=404, detail="Image indexer not configured")
+    return indexer.stats()
+
+
+def image_count_key(user: Principal | None, area: GeoArea | None = None) -> tuple:
+    """Key of the cached total, shared by users who see the same image types."""
+    allowed_type_ids = visible_image_type_ids(user)
+    key = ("images", None if allowed_type_ids is None else tuple(sorted(allowed_type_ids)))
+    return key if area is None else key + (area,)
+
+
+def count_visible_images(query, user: Principal | None, area: GeoArea | None = None) -> int:
+    return cached_count(query, image_count_key(user, area))
+
+
+_GEO_BBOX_QUERY = Query(None, description="min_lon,min_lat,max_lon,max_lat in WGS84 degrees")
+_GEO_NEAR_QUERY = Query(None, description="lon,lat of the centre of a radius search")
+_GEO_RADIUS_QUERY = Query(None, description="Radius in metres around near")
+_GEO_POLYGON_QUERY = Query(
+    None, description="lon,lat,lon,lat,... vertices of the polygon (at least three)"
+)
+
+
+if DB_ASYNC_ENABLED:
+
+    @router.get("/images", response_model=ImagePage)
+    async def read_images(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        sort: str = "id",
+        order: str = "asc",
+        bbox: str | None = _GEO_BBOX_QUERY,
+        near: str | None = _GEO_NEAR_QUERY,
+        radius: float | None = _GEO_RADIUS_QUERY,
+        polygon: str | None = _GEO_POLYGON_QUERY,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Principal = Depends(get_current_principal_async),
+    ):
+        """Return one page of the visible images; follow ``next_cursor`` for the next one.
+
+        ``bbox``, ``near`` with ``radius`` or ``polygon`` keep only the
+        images whose GPS position falls in that area.
+        """
+        area = parse_geo_area(bbox, near, radius, polygon)
+        statement = filter_images_for_user(select(ImageModel), current_user)
+        if area is not None:
+            statement = within(statement, db.bind.dialect.name, area)
+        rows = (await db.scalars(page_query(statement, sort, order, limit, cursor))).all()
+        items, next_cursor = finish_page(rows, sort, limit)
+        key = image_count_key(current_user, area)
+        total = lookup_count(key)
+        if total is None:
+            total = await db.scalar(select(func.count()).select_from(statement.subquery()))
+            store_count(key, total)
+        return {"items": items, "next_cursor": next_cursor, "total": total, "limit": limit}
+
+else:
+
+    @router.get("/images", response_model=ImagePage)
+    def read_images(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        sort: str = "id",
+        order: str = "asc",
+        bbox: str | None = _GEO_BBOX_QUERY,
+        near: str | None = _GEO_NEAR_QUERY,
+        radius: float | None = _GEO_RADIUS_QUERY,
+        polygon: str | None = _GEO_POLYGON_QUERY,
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal),
+    ):
+        """Return one page of the visible images; follow ``next_cursor`` for the next one.
+
+        ``bbox``, ``near`` with ``radius`` or ``polygon`` keep only the
+        images whose GPS position falls in that area.
+        """
+        area = parse_geo_area(bbox, near, radius, polygon)
+        query = filter_images_for_user(db.query(ImageModel), current_user)
+        if area is not None:
+            query = within(query, db.get_bind().dialect.name, area)
+        items, next_cursor = paginate_images(query, sort, order, limit, cursor)
+        return {
+            "items": items,
+            "next_cursor": next_cursor,
+            "total": count_visible_images(query, current_user, area),
+            "limit": limit,
+        }
+
+
+@router.get("/images/search", response_model=ImageSearchPage)
+def search_images(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    sort: str = "id",
+    order: str = "asc",
+    image_type_id: List[int] = Query([]),
+    date_from: date | None = Query(None, description="First day of exif_datetime"),
+    date_to: date | None = Query(None, description="Last day of exif_datetime"),
+    date_interval: str = Query("month", pattern="^(day|month|year)$"),
+    annotated_by: int | None = Query(None, description="Only images this user annotated"),
+    not_annotated_by: int | None = Query(None, description="Only images this user left alone"),
+    bbox: str | None = _GEO_BBOX_QUERY,
+    near: str | None = _GEO_NEAR_QUERY,
+    radius: float | None = _GEO_RADIUS_QUERY,
+    polygon: str | None = _GEO_POLYGON_QUERY,
     db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    for file in IMAGE_DIR.iterdir():
-        if file.is_file():
-            register_image(file, db)
-    query = filter_images_for_user(db.query(ImageModel), current_user)
-    return query.all()
+    """Search the visible images and count them by camera model, image type and date.
+
+    Any ``exif_<column>`` can be filtered by value (repeat it for several)
+    or by range with ``exif_<column>_min``/``exif_<column>_max``.
+    """
+    other_users = {annotated_by, not_annotated_by} - {None, current_user.id}
+    if other_users and current_user.role != "Amministratore":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    camera_models, exif_conditions = parse_exif_filters(request.query_params)
+    search = ImageSearch(
+        image_type_ids=tuple(image_type_id),
+        camera_models=camera_models,
+        date_from=date_from,
+        date_to=date_to,
+        exif_conditions=exif_conditions,
+        annotated_by=annotated_by,
+        not_annotated_by=not_annotated_by,
+        area=parse_geo_area(bbox, near, radius, polygon),
+        date_interval=date_interval,
+    )
+    return find_images(db, search, current_user, sort, order, limit, cursor)
 
 
 @router.get("/images/{image_id}", response_model=ImageDetail)
@@ -262,26 +437,404 @@ def read_image(image_id: int, db: Session = Depends(get_db)):
     return image
 
 
+def _image_source(image_id: int, db: Session) -> Path:
+    image = db.query(ImageModel).filter(ImageModel.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    source = Path(image.path)
+    if not source.exists():
+        raise HTTPException(status_code=404, detail="Image file not found")
+    return source
+
+
+def _derivative_response(image_id: int, variant: str, request: Request, db: Session):
+    source = _image_source(image_id, db)
+    try:
+        entry, key = derivative_cache.get(source, variant)
+    except (OSError, PILImage.DecompressionBombError) as exc:
+        raise HTTPException(status_code=415, detail=f"Cannot render {variant}: {exc}")
+    return _cached_file_response(entry, key, request)
+
+
+def _cached_file_response(entry: Path, key: str, request: Request):
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(entry, media_type="image/jpeg", headers=headers)
+
+
+@router.get("/images/{image_id}/thumbnail", response_class=FileResponse)
+def read_image_thumbnail(image_id: int, request: Request, db: Session = Depends(get_db)):
+    """Small JPEG rendition for listings, generated on first request."""
+    return _derivative_response(image_id, "thumbnail", request, db)
+
+
+@router.get("/images/{image_id}/preview", response_class=FileResponse)
+def read_image_preview(image_id: int, request: Request, db: Session = Depends(get_db)):
+    """Screen-sized JPEG rendition used by the annotation canvas."""
+    return _derivative_response(image_id, "preview", request, db)
+
+
+@router.get("/images/{image_id}/tiles", response_model=ImageTileInfo)
+def read_image_tile_info(image_id: int, db: Session = Depends(get_db)):
+    """Size and level count of the deep-zoom pyramid of an image."""
+    try:
+        return tile_info(_image_source(image_id, db))
+    except (OSError, PILImage.DecompressionBombError) as exc:
+        raise HTTPException(status_code=415, detail=f"Cannot read image: {exc}")
+
+
+@router.get("/images/{image_id}/tiles/{level}/{column}/{row}", response_class=FileResponse)
+def read_image_tile(
+    image_id: int,
+    level: int,
+    column: int,
+    row: int,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """One JPEG tile of the deep-zoom pyramid, cut from the source on first request."""
+    source = _image_source(image_id, db)
+    try:
+        entry, key = get_tile(source, level, column, row)
+    except IndexError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except (OSError, PILImage.DecompressionBombError) as exc:
+        raise HTTPException(status_code=415, detail=f"Cannot render tile: {exc}")
+    return _cached_file_response(entry, key, request)
+
+
+def image_view(image: ImageModel) -> dict:
+    """URL and source geometry the workspace canvas draws ``image`` with.
+
+    The canvas shows the cached preview, or deep-zoom tiles for very large
+    images; coordinates always stay in pixels of the original. Files that
+    cannot be decoded fall back to the original under ``/image_data``.
+    """
+    try:
+        source_width, source_height = source_size(Path(image.path))
+        return {
+            "image_url": f"/images/{image.id}/preview",
+            "source_width": source_width,
+            "source_height": source_height,
+            "tile_info": deep_zoom_info(Path(image.path)),
+        }
+    except Exception:
+        try:
+            relative_path = Path(image.path).resolve().relative_to(IMAGE_DIR.resolve())
+            image_url = f"/image_data/{relative_path.as_posix()}"
+        except Exception:
+            image_url = f"/image_data/{image.filename}"
+        return {"image_url": image_url, "source_width": None, "source_height": None, "tile_info": None}
+
+
+@router.get("/images/{image_id}/workspace", response_model=ImageWorkspace)
+def read_image_workspace(
+    image_id: int,
+    unanswered: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """Image, neighbours, questions, answers, annotations and labels of the annotation workspace."""
+    workspace = load_workspace(db, image_id, current_user, unanswered)
+    if workspace is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return {**workspace, **image_view(workspace["image"])}
+
+
+@router.get("/images/{image_id}/upcoming", response_model=List[ImageWorkspace])
+def read_upcoming_workspaces(
+    image_id: int,
+    background_tasks: BackgroundTasks,
+    count: int = Query(WORKSPACE_PREFETCH, ge=1, le=MAX_WORKSPACE_PREFETCH),
+    direction: str = Query("next", pattern="^(next|prev)$"),
+    unanswered: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """Workspaces of the ``count`` images an expert reaches next from ``image_id``.
+
+    The annotation page keeps them to step through images without reloading;
+    their previews are rendered into the derivative cache after the response.
+    """
+    workspaces = []
+    for neighbor_id in neighbor_ids(db, image_id, current_user, count, direction, unanswered):
+        workspace = load_workspace(db, neighbor_id, current_user, unanswered)
+        if workspace is not None:
+            workspaces.append({**workspace, **image_view(workspace["image"])})
+    background_tasks.add_task(
+        _warm_previews,
+        [Path(workspace["image"].path) for workspace in workspaces if not workspace["tile_info"]],
+    )
+    return workspaces
+
+
+def _warm_previews(paths: list[Path]) -> None:
+    for path in paths:
+        try:
+            derivative_cache.get(path, "preview")
+        except (OSError, PILImage.DecompressionBombError):
+            continue
+
+
+_UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {
+                            "type": "string",
+                            "format": "binary",
+                            "description": "Immagine da caricare",
+                        },
+                        "image_type_id": {"type": "integer"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+def parse_image_type_id(value: str | None, db: Session) -> int | None:
+    """Validate an optional ``image_type_id`` form or metadata value."""
+    if value in (None, ""):
+        return None
+    try:
+        image_type_id = int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="image_type_id must be an integer") from None
+    if not db.query(ImageTypeModel).filter_by(id=image_type_id).first():
+        raise HTTPException(status_code=404, detail="Image type not found")
+    return image_type_id
+
+
+def store_upload(
+    db: Session,
+    fields: dict[str, str],
+    filename: str,
+    staged: StagedFile,
+    replace: bool = False,
+) -> tuple[ImageModel, bool]:
+    """Publish a received upload and register it, EXIF included; return ``(image, created)``.
+
+    Blocking (fsync, Pillow, database): callers on the event loop run it in
+    the threadpool. Content already registered is not stored a second time
+    and the existing image is returned instead.
+    """
+    try:
+        image_type_id = parse_image_type_id(fields.get("image_type_id"), db)
+        existing = image_with_content(db, staged.content_hash)
+        if existing is not None:
+            staged.discard()
+            return existing, False
+        file_path = staged.publish(IMAGE_DIR / filename, replace=replace)
+    except FileExistsError:
+        staged.discard()
+        raise HTTPException(status_code=400, detail="File already exists") from None
+    except BaseException:
+        staged.discard()
+        raise
+    image = register_image(
+        file_path, db, image_type_id=image_type_id, content_hash=staged.content_hash
+    )
+    invalidate_counts()
+    return image, True
+
+
 @router.post(
     "/images/upload",
     response_model=ImageDetail,
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_admin)],
+    openapi_extra=_UPLOAD_FORM,
 )
 async def upload_image(
-    file: UploadFile = File(..., description="Immagine da caricare"),
-    image_type_id: int | None = Form(None),
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    """Carica un'immagine, salva il file ed estrae i metadati EXIF."""
-    file_path = IMAGE_DIR / file.filename
-    if file_path.exists():
-        raise HTTPException(status_code=400, detail="File already exists")
-    if image_type_id is not None and not db.query(ImageTypeModel).filter_by(id=image_type_id).first():
-        raise HTTPException(status_code=404, detail="Image type not found")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return register_image(file_path, db, image_type_id=image_type_id)
+    """Carica un'immagine, salva il file ed estrae i metadati EXIF.
+
+    Il corpo viene scritto su disco mentre arriva e l'hash SHA-256 è restituito
+    nell'header ``Repr-Digest``. Se lo stesso contenuto è già registrato il file
+    non viene salvato una seconda volta e la risposta è l'immagine esistente
+    (``200``).
+    """
+    fields, filename, staged = await receive_multipart(request, IMAGE_DIR)
+    if staged is None:
+        raise HTTPException(status_code=400, detail="Missing file")
+    response.headers["Repr-Digest"] = repr_digest(staged.content_hash)
+    image, created = await run_in_threadpool(store_upload, db, fields, filename, staged)
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    # Serialised in the threadpool too: reading image_type may query the database
+    return await run_in_threadpool(ImageDetail.model_validate, image)
+
+
+def get_upload_runner(request: Request):
+    runner = getattr(request.app.state, "uploads", None)
+    if runner is None:
+        raise HTTPException(status_code=503, detail="Uploads are not available")
+    return runner
+
+
+def _check_tus_version(request: Request) -> None:
+    version = request.headers.get("tus-resumable")
+    if version is not None and version != TUS_VERSION:
+        raise HTTPException(
+            status_code=412,
+            detail="Unsupported Tus-Resumable version",
+            headers={"Tus-Version": TUS_VERSION},
+        )
+
+
+def _header_int(request: Request, name: str) -> int:
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Missing or invalid {name} header") from None
+    if value < 0:
+        raise HTTPException(status_code=400, detail=f"Missing or invalid {name} header")
+    return value
+
+
+def _get_upload(db: Session, upload_id: str) -> UploadModel:
+    upload = db.get(UploadModel, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+@router.options("/images/uploads", status_code=status.HTTP_204_NO_CONTENT)
+def describe_uploads():
+    """Scoperta delle capacità tus del server."""
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Tus-Version": TUS_VERSION,
+            "Tus-Extension": TUS_EXTENSIONS,
+        },
+    )
+
+
+@router.post(
+    "/images/uploads",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require_admin)],
+)
+async def create_upload_session(
+    request: Request,
+    db: Session = Depends(get_db),
+    runner=Depends(get_upload_runner),
+):
+    """Apre un caricamento riprendibile (tus) di ``Upload-Length`` byte."""
+    _check_tus_version(request)
+    length = _header_int(request, "upload-length")
+    metadata = parse_metadata(request.headers.get("upload-metadata"))
+    filename = safe_filename(metadata.get("filename"))
+    image_type_id = await run_in_threadpool(parse_image_type_id, metadata.get("image_type_id"), db)
+    upload = await run_in_threadpool(create_upload, db, IMAGE_DIR, filename, length, image_type_id)
+    if length == 0:
+        await _append(db, upload, 0, _no_chunks(), runner)
+    return Response(
+        status_code=status.HTTP_201_CREATED,
+        headers={
+            "Location": str(request.url_for("read_upload", upload_id=upload.id)),
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Offset": str(upload.received),
+        },
+    )
+
+
+async def _no_chunks():
+    return
+    yield
+
+
+async def _append(db: Session, upload: UploadModel, offset: int, chunks, runner) -> None:
+    await append_upload(db, IMAGE_DIR, upload, offset, chunks)
+    if upload.status == "processing":
+        runner.submit(upload.id)
+
+
+@router.head("/images/uploads/{upload_id}", dependencies=[Depends(require_admin)])
+def read_upload_offset(upload_id: str, request: Request, db: Session = Depends(get_db)):
+    """Byte già ricevuti: il client riprende il caricamento da ``Upload-Offset``."""
+    _check_tus_version(request)
+    upload = _get_upload(db, upload_id)
+    return Response(
+        headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Offset": str(current_offset(IMAGE_DIR, upload)),
+            "Upload-Length": str(upload.length),
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@router.patch(
+    "/images/uploads/{upload_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin)],
+)
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    runner=Depends(get_upload_runner),
+):
+    """Accoda al file i byte del corpo a partire da ``Upload-Offset``.
+
+    Completato l'ultimo byte il file viene pubblicato in ``IMAGE_DIR`` e
+    registrato (EXIF compresi) da un worker in background.
+    """
+    _check_tus_version(request)
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=415, detail="Content-Type must be application/offset+octet-stream"
+        )
+    offset = _header_int(request, "upload-offset")
+    upload = await run_in_threadpool(_get_upload, db, upload_id)
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and offset + int(declared) > upload.length:
+        raise HTTPException(status_code=413, detail="Body exceeds Upload-Length")
+    await _append(db, upload, offset, request.stream(), runner)
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={"Tus-Resumable": TUS_VERSION, "Upload-Offset": str(upload.received)},
+    )
+
+
+@router.get(
+    "/images/uploads/{upload_id}",
+    response_model=ImageUploadSchema,
+    dependencies=[Depends(require_admin)],
+)
+def read_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Stato del caricamento; ``image_id`` è valorizzato a registrazione conclusa."""
+    upload = _get_upload(db, upload_id)
+    return ImageUploadSchema.model_validate(upload).model_copy(
+        update={"received": current_offset(IMAGE_DIR, upload)}
+    )
+
+
+@router.delete(
+    "/images/uploads/{upload_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin)],
+)
+def terminate_upload(upload_id: str, request: Request, db: Session = Depends(get_db)):
+    """Interrompe il caricamento e libera il file parziale."""
+    _check_tus_version(request)
+    discard_upload(db, IMAGE_DIR, _get_upload(db, upload_id))
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"Tus-Resumable": TUS_VERSION})
 
 
 @router.put(
@@ -300,6 +853,7 @@ def update_image(image_id: int, image_data: ImageUpdate, db: Session = Depends(g
     for key, value in data.items():
         setattr(image, key, value)
     db.commit()
+    invalidate_counts()
     db.refresh(image)
     return image
 
@@ -318,6 +872,7 @@ def delete_image(image_id: int, db: Session = Depends(get_db)):
         file_path.unlink()
     db.delete(image)
     db.commit()
+    invalidate_counts()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -7,10 +7,10 @@ from database import get_db
 from models import (
     Question as QuestionModel,
     Option as OptionModel,
-    User as UserModel,
     ImageType as ImageTypeModel,
 )
-from main import get_current_user
+from main import get_current_principal
+from services.principals import Principal
 from schemas import (
     Question as QuestionSchema,
     QuestionCreate,
@@ -22,7 +22,7 @@ from schemas import (
 router = APIRouter()
 
 
-def require_admin(current_user: UserModel = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_principal)):
     if current_user.role != "Amministratore":
         raise HTTPException(status_code=403, detail="Forbidden")
     return current_user
@@ -1,15 +1,16 @@
 from pathlib import Path
 import json
-import shutil
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, UploadFile, File
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from jose import JWTError, jwt
 
-from database import get_db
+from database import SessionLocal, get_db
 from models import (
     Image as ImageModel,
     ImageType as ImageTypeModel,
@@ -19,19 +20,38 @@ from models import (
     Answer as AnswerModel,
     Annotation as AnnotationModel,
     Label as LabelModel,
+    ImportJob as ImportJobModel,
     User as UserModel,
 )
-from routers.images import IMAGE_DIR, register_image, perform_bulk_import, filter_images_for_user
+from routers.images import (
+    IMAGE_DIR,
+    WORKSPACE_PREFETCH,
+    image_view,
+    resolve_import_directory,
+    store_upload,
+    count_visible_images,
+)
+from routers.exports import export_response
+from services.answers import upsert_answer
+from services.exports import ExportFilters, export_annotations, export_answers
+from services.import_jobs import describe_job
+from services.pagination import invalidate_counts, paginate_images
+from services.principals import Principal, filter_images_for_user, principal_cache
+from services.uploads import receive_multipart
+from services.workspace import load_workspace
 from main import (
     create_access_token,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    login_gate,
+    verify_password_async,
     SECRET_KEY,
     ALGORITHM,
 )
 
 templates = Jinja2Templates(directory="templates")
 
+UI_PAGE_SIZE = 50
+
 router = APIRouter(prefix="/ui", tags=["ui"], include_in_schema=False)
 
 
@@ -92,7 +112,7 @@ def get_current_user(request: Request, db: Session):
             return None
     except JWTError:
         return None
-    return db.query(UserModel).filter_by(username=username).first()
+    return principal_cache.load(db, username)
 
 
 def require_user(
@@ -104,13 +124,13 @@ def require_user(
     return user
 
 
-def require_admin(user: UserModel = Depends(require_user)):
+def require_admin(user: Principal = Depends(require_user)):
     if user.role != "Amministratore":
         raise HTTPException(status_code=403, detail="Forbidden")
     return user
 
 
-def require_expert(user: UserModel = Depends(require_user)):
+def require_expert(user: Principal = Depends(require_user)):
     if user.role != "Esperto":
         raise HTTPException(status_code=403, detail="Forbidden")
     return user
@@ -119,17 +139,30 @@ def require_expert(user: UserModel = Depends(require_user)):
 @router.get("/images", response_class=HTMLResponse)
 def list_images(
     request: Request,
-    user: UserModel = Depends(require_user),
+    cursor: str | None = None,
+    sort: str = "id",
+    order: str = "asc",
+    user: Principal = Depends(require_user),
     db: Session = Depends(get_db),
 ):
-    for file in IMAGE_DIR.iterdir():
-        if file.is_file():
-            register_image(file, db)
-    query = db.query(ImageModel).options(joinedload(ImageModel.image_type))
-    images = filter_images_for_user(query, user).all()
+    query = filter_images_for_user(db.query(ImageModel), user)
+    images, next_cursor = paginate_images(
+        query.options(joinedload(ImageModel.image_type)), sort, order, UI_PAGE_SIZE, cursor
+    )
     token = request.cookies.get("access_token")
     return templates.TemplateResponse(
-        "images.html", {"request": request, "images": images, "user": user, "token": token}
+        "images.html",
+        {
+            "request": request,
+            "images": images,
+            "user": user,
+            "token": token,
+            "total": count_visible_images(query, user),
+            "next_cursor": next_cursor,
+            "cursor": cursor,
+            "sort": sort,
+            "order": order,
+        },
     )
 
 
@@ -139,25 +172,32 @@ def register_form(request: Request):
 
 
 @router.post("/register")
-def register_user(
+async def register_user(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
-    existing = db.query(UserModel).filter_by(username=username).first()
+    existing = await run_in_threadpool(
+        lambda: db.query(UserModel).filter_by(username=username).first()
+    )
     if existing:
         return templates.TemplateResponse(
             "register.html",
             {"request": request, "error": "Username already exists"},
         )
-    user = UserModel(
-        username=username,
-        hashed_password=get_password_hash(password),
-        role="Esperto",
-    )
+    try:
+        hashed_password = await get_password_hash_async(password)
+    except HTTPException as exc:
+        return templates.TemplateResponse(
+            "register.html",
+            {"request": request, "error": exc.detail},
+            status_code=exc.status_code,
+            headers=exc.headers,
+        )
+    user = UserModel(username=username, hashed_password=hashed_password, role="Esperto")
     db.add(user)
-    db.commit()
+    await run_in_threadpool(db.commit)
     return RedirectResponse(url="/ui/login", status_code=303)
 
 
@@ -167,14 +207,26 @@ def login_form(request: Request):
 
 
 @router.post("/login")
-def login_user(
+async def login_user(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
-    user = db.query(UserModel).filter_by(username=username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    try:
+        login_gate.check(username)
+        user = await run_in_threadpool(
+            lambda: db.query(UserModel).filter_by(username=username).first()
+        )
+        valid = user is not None and await verify_password_async(password, user.hashed_password)
+    except HTTPException as exc:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": exc.detail},
+            status_code=exc.status_code,
+            headers=exc.headers,
+        )
+    if not valid:
         return templates.TemplateResponse(
             "login.html", {"request": request, "error": "Invalid credentials"}
         )
@@ -189,7 +241,7 @@ def login_user(
 @router.get("/change-password", response_class=HTMLResponse)
 def change_password_form(
     request: Request,
-    user: UserModel = Depends(require_user),
+    user: Principal = Depends(require_user),
 ):
     context = {
         "request": request,
@@ -201,30 +253,37 @@ def change_password_form(
 
 
 @router.post("/change-password", response_class=HTMLResponse)
-def change_password(
+async def change_password(
     request: Request,
     current_password: str = Form(...),
     new_password: str = Form(...),
     confirm_password: str = Form(...),
-    user: UserModel = Depends(require_user),
+    user: Principal = Depends(require_user),
     db: Session = Depends(get_db),
 ):
     error: str | None = None
     success: str | None = None
+    account = await run_in_threadpool(db.get, UserModel, user.id)
 
-    if not verify_password(current_password, user.hashed_password):
+    try:
+        login_gate.check(user.username)
+        current_ok = await verify_password_async(current_password, account.hashed_password)
+    except HTTPException:
+        current_ok = None
+
+    if current_ok is None:
+        error = "Troppi tentativi: riprova tra qualche istante."
+    elif not current_ok:
         error = "La password corrente non e corretta."
     elif new_password != confirm_password:
         error = "La nuova password e la conferma non coincidono."
     elif len(new_password) < 8:
         error = "La nuova password deve contenere almeno 8 caratteri."
-    elif verify_password(new_password, user.hashed_password):
+    elif await verify_password_async(new_password, account.hashed_password):
         error = "La nuova password deve essere diversa da quella attuale."
     else:
-        user.hashed_password = get_password_hash(new_password)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+        account.hashed_password = await get_password_hash_async(new_password)
+        await run_in_threadpool(db.commit)
         success = "Password aggiornata con successo."
 
     context = {
@@ -246,11 +305,11 @@ def logout_user():
 @router.get("/my-expert-types", response_class=HTMLResponse)
 def my_expert_types_form(
     request: Request,
-    user: UserModel = Depends(require_expert),
+    user: Principal = Depends(require_expert),
     db: Session = Depends(get_db),
 ):
     types = db.query(ExpertTypeModel).all()
-    user_type_ids = {t.id for t in user.expert_types}
+    user_type_ids = {t.id for t in db.get(UserModel, user.id).expert_types}
     return templates.TemplateResponse(
         "my_expert_types.html",
         {
@@ -265,7 +324,7 @@ def my_expert_types_form(
 @router.post("/my-expert-types")
 def update_my_expert_types(
     expert_type_ids: list[int] = Form([]),
-    user: UserModel = Depends(require_expert),
+    user: Principal = Depends(require_expert),
     db: Session = Depends(get_db),
 ):
     expert_types = (
@@ -275,7 +334,7 @@ def update_my_expert_types(
         if expert_type_ids
         else []
     )
-    user.expert_types = expert_types
+    db.get(UserModel, user.id).expert_types = expert_types
     db.commit()
     return RedirectResponse(url="/ui", status_code=303)
 
@@ -286,10 +345,12 @@ def update_my_expert_types(
 )
 def upload_image_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    job_id: int | None = None,
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     types = db.query(ImageTypeModel).all()
+    job = db.get(ImportJobModel, job_id) if job_id is not None else None
     context = {
         "request": request,
         "user": user,
@@ -297,9 +358,12 @@ def upload_image_form(
         "image_dir_root": str(IMAGE_DIR.resolve()),
         "import_result": None,
         "import_error": None,
+        "import_job": describe_job(job) if job else None,
+        "token": request.cookies.get("access_token"),
         "directory_value": "",
         "selected_image_type": None,
         "recursive_flag": False,
+        "dedup_flag": False,
     }
     return templates.TemplateResponse("image_form.html", context)
 
@@ -310,14 +374,15 @@ def upload_image_form(
 )
 async def upload_image(
     request: Request,
-    file: UploadFile = File(...),
-    image_type_id: int | None = Form(None),
     db: Session = Depends(get_db),
 ):
-    file_path = IMAGE_DIR / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    register_image(file_path, db, image_type_id=image_type_id)
+    # Il file viene scritto su disco mentre arriva, senza copie temporanee
+    fields, filename, staged = await receive_multipart(request, IMAGE_DIR, replace=True)
+    if staged is None:
+        raise HTTPException(status_code=400, detail="Missing file")
+    # Pubblicazione, EXIF e registrazione girano nel threadpool, non sull'event loop;
+    # un contenuto già registrato non viene salvato una seconda volta
+    await run_in_threadpool(store_upload, db, fields, filename, staged, True)
     return RedirectResponse(url="/ui/images", status_code=303)
 
 
@@ -329,7 +394,8 @@ def bulk_import_images(
     directory: str = Form(...),
     image_type_id: int = Form(...),
     recursive: bool = Form(False),
-    user: UserModel = Depends(require_admin),
+    dedup: bool = Form(False),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     types = db.query(ImageTypeModel).all()
@@ -341,119 +407,54 @@ def bulk_import_images(
         "directory_value": directory,
         "selected_image_type": image_type_id,
         "recursive_flag": recursive,
+        "dedup_flag": dedup,
     }
     try:
-        result = perform_bulk_import(
-            directory=directory,
-            image_type_id=image_type_id,
-            recursive=recursive,
-            db=db,
-        )
-        context.update({"import_result": result, "import_error": None})
-        status_code = 200
+        target_dir = resolve_import_directory(directory, image_type_id, db)
     except HTTPException as exc:
-        context.update({"import_result": None, "import_error": exc.detail})
-        status_code = exc.status_code
-    return templates.TemplateResponse("image_form.html", context, status_code=status_code)
+        context.update(
+            {"import_result": None, "import_error": exc.detail, "import_job": None}
+        )
+        return templates.TemplateResponse(
+            "image_form.html", context, status_code=exc.status_code
+        )
+    job = request.app.state.import_jobs.submit(db, target_dir, image_type_id, recursive, dedup)
+    return RedirectResponse(url=f"/ui/images/upload?job_id={job.id}", status_code=303)
 
 
 @router.get("/images/{image_id}", response_class=HTMLResponse)
 def view_image(
     image_id: int,
     request: Request,
-    user: UserModel = Depends(require_user),
+    unanswered: bool = False,
+    user: Principal = Depends(require_user),
     db: Session = Depends(get_db),
 ):
-    image = (
-        db.query(ImageModel)
-        .options(joinedload(ImageModel.image_type))
-        .filter_by(id=image_id)
-        .first()
-    )
-    if not image:
+    # Stessi dati dell'endpoint JSON /images/{id}/workspace
+    workspace = load_workspace(db, image_id, user, unanswered)
+    if workspace is None:
         raise HTTPException(status_code=404, detail="Image not found")
-    try:
-        relative_path = Path(image.path).resolve().relative_to(IMAGE_DIR.resolve())
-        image_url = f"/image_data/{relative_path.as_posix()}"
-    except Exception:
-        image_url = f"/image_data/{image.filename}"
-    # Determine previous and next image IDs for navigation
-    prev_row = (
-        db.query(ImageModel.id)
-        .filter(ImageModel.id < image_id)
-        .order_by(ImageModel.id.desc())
-        .first()
-    )
-    next_row = (
-        db.query(ImageModel.id)
-        .filter(ImageModel.id > image_id)
-        .order_by(ImageModel.id.asc())
-        .first()
-    )
-    prev_id = prev_row[0] if prev_row else None
-    next_id = next_row[0] if next_row else None
-    questions_query = db.query(QuestionModel).options(joinedload(QuestionModel.options))
-    if image.image_type_id:
-        questions_query = questions_query.join(QuestionModel.image_types).filter(
-            ImageTypeModel.id == image.image_type_id
-        )
-    questions_query = questions_query.order_by(QuestionModel.id.asc())
-    questions = questions_query.all()
-    questions_payload = [
-        {
-            "id": q.id,
-            "text": q.question_text,
-            "options": [
-                {"id": opt.id, "text": opt.option_text}
-                for opt in q.options
-            ],
-            "depends_on_question_id": q.depends_on_question_id,
-            "depends_on_option_id": q.depends_on_option_id,
-            "order": index,
-        }
-        for index, q in enumerate(questions)
-    ]
-    answers = (
-        db.query(AnswerModel)
-        .filter_by(image_id=image_id, user_id=user.id)
-        .all()
-    )
-    answer_map = {a.question_id: a.selected_option_id for a in answers}
-
-    annotations = [
-        {
-            "label": a.label.name,
-            "points": a.points,
-        }
-        for a in (
-            db.query(AnnotationModel)
-            .filter_by(image_id=image_id, user_id=user.id)
-            .all()
-        )
-    ]
-
-
-    # Convert Label ORM objects to plain dictionaries so they can be JSON serialized
-    label_objs = db.query(LabelModel).all()
-    labels = [{"id": l.id, "name": l.name} for l in label_objs]
-
-    
+    view = image_view(workspace["image"])
     token = request.cookies.get("access_token")
     return templates.TemplateResponse(
         "image_detail.html",
         {
             "request": request,
-            "image": image,
-            "image_url": image_url,
-            "questions": questions,
-            "questions_data": questions_payload,
+            "image": workspace["image"],
+            "image_url": view["image_url"],
+            "source_width": view["source_width"],
+            "source_height": view["source_height"],
+            "tile_info": view["tile_info"],
+            "questions_data": workspace["questions"],
             "user": user,
             "token": token,
-            "answer_map": answer_map,
-            "annotations": annotations,
-            "labels": labels,
-            "prev_id": prev_id,
-            "next_id": next_id,
+            "answer_map": workspace["answers"],
+            "annotations": workspace["annotations"],
+            "labels": workspace["labels"],
+            "prev_id": workspace["prev_id"],
+            "next_id": workspace["next_id"],
+            "unanswered": unanswered,
+            "prefetch_count": WORKSPACE_PREFETCH,
         },
     )
 
@@ -465,7 +466,7 @@ def view_image(
 def edit_image_form(
     image_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     image = db.query(ImageModel).filter_by(id=image_id).first()
@@ -494,6 +495,7 @@ def edit_image(
     image.filename = filename
     image.image_type_id = image_type_id
     db.commit()
+    invalidate_counts()
     return RedirectResponse(url="/ui/images", status_code=303)
 
 
@@ -509,6 +511,7 @@ def delete_image(image_id: int, db: Session = Depends(get_db)):
             file_path.unlink()
         db.delete(image)
         db.commit()
+        invalidate_counts()
     return RedirectResponse(url="/ui/images", status_code=303)
 
 
@@ -518,7 +521,7 @@ def delete_image(image_id: int, db: Session = Depends(get_db)):
 )
 def list_image_types(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     types = db.query(ImageTypeModel).all()
@@ -533,7 +536,7 @@ def list_image_types(
 )
 def create_image_type_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
 ):
     return templates.TemplateResponse(
         "image_type_form.html", {"request": request, "user": user}
@@ -561,7 +564,7 @@ def create_image_type(
 def edit_image_type_form(
     type_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     img_type = db.query(ImageTypeModel).filter_by(id=type_id).first()
@@ -608,7 +611,7 @@ def delete_image_type(type_id: int, db: Session = Depends(get_db)):
 )
 def list_expert_types(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     types = db.query(ExpertTypeModel).all()
@@ -623,7 +626,7 @@ def list_expert_types(
 )
 def create_expert_type_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     image_types = db.query(ImageTypeModel).all()
@@ -667,7 +670,7 @@ def create_expert_type(
 def edit_expert_type_form(
     type_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     expert_type = db.query(ExpertTypeModel).filter_by(id=type_id).first()
@@ -731,7 +734,7 @@ def delete_expert_type(type_id: int, db: Session = Depends(get_db)):
 )
 def list_questions(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     questions = db.query(QuestionModel).all()
@@ -749,7 +752,7 @@ def list_questions(
 )
 def create_question_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     types = db.query(ImageTypeModel).all()
@@ -786,7 +789,7 @@ def create_question(
 def edit_question_form(
     question_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     question = db.query(QuestionModel).filter_by(id=question_id).first()
@@ -844,7 +847,7 @@ def delete_question(question_id: int, db: Session = Depends(get_db)):
 def create_option_form(
     question_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     question = db.query(QuestionModel).filter_by(id=question_id).first()
@@ -894,7 +897,7 @@ def create_option(
 def edit_option_form(
     option_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     option = (
@@ -961,7 +964,7 @@ def delete_option(option_id: int, db: Session = Depends(get_db)):
 )
 def list_answers(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     answers = db.query(AnswerModel).all()
@@ -976,7 +979,7 @@ def list_answers(
 )
 def create_answer_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
 ):
     return templates.TemplateResponse(
         "answer_form.html", {"request": request, "user": user}
@@ -994,13 +997,13 @@ def create_answer(
     user_id: int = Form(...),
     db: Session = Depends(get_db),
 ):
-    answer = AnswerModel(
+    upsert_answer(
+        db,
         image_id=image_id,
         question_id=question_id,
-        selected_option_id=selected_option_id,
         user_id=user_id,
+        selected_option_id=selected_option_id,
     )
-    db.add(answer)
     db.commit()
     return RedirectResponse(url="/ui/answers", status_code=303)
 
@@ -1012,7 +1015,7 @@ def create_answer(
 def edit_answer_form(
     answer_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     answer = db.query(AnswerModel).filter_by(id=answer_id).first()
@@ -1042,7 +1045,14 @@ def edit_answer(
     answer.question_id = question_id
     answer.selected_option_id = selected_option_id
     answer.user_id = user_id
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="This user already answered the question for this image",
+        )
     return RedirectResponse(url="/ui/answers", status_code=303)
 
 
@@ -1064,7 +1074,7 @@ def delete_answer(answer_id: int, db: Session = Depends(get_db)):
 )
 def list_annotations(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     annotations = db.query(AnnotationModel).all()
@@ -1073,13 +1083,25 @@ def list_annotations(
     )
 
 
+@router.get("/exports/annotations", dependencies=[Depends(require_admin)])
+def download_annotations(format: Literal["coco", "jsonl", "csv"] = "jsonl"):
+    return export_response(
+        export_annotations(SessionLocal, format, ExportFilters()), "annotations", format
+    )
+
+
+@router.get("/exports/answers", dependencies=[Depends(require_admin)])
+def download_answers(format: Literal["jsonl", "csv"] = "jsonl"):
+    return export_response(export_answers(SessionLocal, format, ExportFilters()), "answers", format)
+
+
 @router.get(
     "/annotations/create",
     response_class=HTMLResponse,
 )
 def create_annotation_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     labels = db.query(LabelModel).all()
@@ -1117,7 +1139,7 @@ def create_annotation(
 def edit_annotation_form(
     annotation_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     annotation = db.query(AnnotationModel).filter_by(id=annotation_id).first()
@@ -1168,7 +1190,7 @@ def delete_annotation(annotation_id: int, db: Session = Depends(get_db)):
 @router.get("/labels", response_class=HTMLResponse)
 def list_labels(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     labels = db.query(LabelModel).all()
@@ -1180,7 +1202,7 @@ def list_labels(
 @router.get("/labels/create", response_class=HTMLResponse)
 def create_label_form(
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     image_types = db.query(ImageTypeModel).all()
@@ -1212,7 +1234,7 @@ def create_label(
 def edit_label_form(
     label_id: int,
     request: Request,
-    user: UserModel = Depends(require_admin),
+    user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     label = db.query(LabelModel).filter_by(id=label_id).first()
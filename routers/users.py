@@ -1,68 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import DB_ASYNC_ENABLED, get_async_db, get_db
 from models import User as UserModel
-from schemas.user import UserCreate, UserResponse, Token, PasswordChangeRequest
+from schemas.user import (
+    UserCreate,
+    UserResponse,
+    Token,
+    PasswordChangeRequest,
+    PasswordPoolStatus,
+)
 from main import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
     create_access_token,
+    get_current_principal,
     get_current_user,
+    login_gate,
 )
+from services.principals import Principal
 
 router = APIRouter()
 
 @router.post("/users/", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(UserModel).filter_by(username=user.username).first()
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+    existing_user = await run_in_threadpool(
+        lambda: db.query(UserModel).filter_by(username=user.username).first()
+    )
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     db_user = UserModel(
         username=user.username,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=await get_password_hash_async(user.password),
         role=user.role,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await run_in_threadpool(db.commit)
+    await run_in_threadpool(db.refresh, db_user)
     return db_user
 
-@router.post("/token", response_model=Token)
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
-):
-    user = db.query(UserModel).filter_by(username=form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(status_code=400, detail="Incorrect username or password")
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+if DB_ASYNC_ENABLED:
+
+    @router.post("/token", response_model=Token)
+    async def login_for_access_token(
+        form_data: OAuth2PasswordRequestForm = Depends(),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        login_gate.check(form_data.username)
+        user = await db.scalar(select(UserModel).filter_by(username=form_data.username))
+        if not user or not await verify_password_async(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Incorrect username or password")
+        access_token = create_access_token(data={"sub": user.username})
+        return {"access_token": access_token, "token_type": "bearer"}
+
+else:
+
+    @router.post("/token", response_model=Token)
+    async def login_for_access_token(
+        form_data: OAuth2PasswordRequestForm = Depends(),
+        db: Session = Depends(get_db),
+    ):
+        # bcrypt is awaited on the password pool, so no request thread waits for it
+        login_gate.check(form_data.username)
+        user = await run_in_threadpool(
+            lambda: db.query(UserModel).filter_by(username=form_data.username).first()
+        )
+        if not user or not await verify_password_async(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Incorrect username or password")
+        access_token = create_access_token(data={"sub": user.username})
+        return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/users/me", response_model=UserResponse)
 def read_users_me(current_user: UserModel = Depends(get_current_user)):
     return current_user
 
 @router.post("/users/me/password")
-def change_password(
+async def change_password(
     payload: PasswordChangeRequest,
     current_user: UserModel = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    if not verify_password(payload.current_password, current_user.hashed_password):
+    login_gate.check(current_user.username)
+    if not await verify_password_async(payload.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect current password")
     if payload.new_password != payload.new_password_confirm:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     if len(payload.new_password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
-    if verify_password(payload.new_password, current_user.hashed_password):
+    if await verify_password_async(payload.new_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="New password must be different from the current password")
 
-    current_user.hashed_password = get_password_hash(payload.new_password)
+    current_user.hashed_password = await get_password_hash_async(payload.new_password)
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await run_in_threadpool(db.commit)
     return {"detail": "Password updated"}
 
 
+
+
+def require_admin(current_user: Principal = Depends(get_current_principal)):
+    if current_user.role != "Amministratore":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return current_user
+
+
+@router.get(
+    "/users/password-pool",
+    response_model=PasswordPoolStatus,
+    dependencies=[Depends(require_admin)],
+)
+def read_password_pool_status(request: Request):
+    """Queueing counters of the password worker pool and the login rate gate."""
+    return {
+        **request.app.state.password_pool.stats(),
+        "rate_gate": request.app.state.login_gate.stats(),
+    }
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List
 
 from pydantic import BaseModel, ConfigDict
@@ -22,11 +23,27 @@ class Image(BaseModel):
     filename: str
     path: str
     image_type_id: int | None = None
+    content_hash: str | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
-class ImageDetail(Image):
+class ImagePage(BaseModel):
+    items: List[Image]
+    next_cursor: str | None = None
+    total: int
+    limit: int
+
+
+class ImageTileInfo(BaseModel):
+    width: int
+    height: int
+    tile_size: int
+    max_level: int
+    format: str
+
+
+class ImageMetadata(Image):
     exif_datetime: str | None = None
     exif_gps_lat: float | None = None
     exif_gps_lon: float | None = None
@@ -46,9 +63,31 @@ class ImageDetail(Image):
     exif_pitch: float | None = None
     exif_roll: float | None = None
     exif_yaw: float | None = None
+
+
+class ImageDetail(ImageMetadata):
     image_type: ImageType | None = None
 
 
+class FacetCount(BaseModel):
+    value: str | int | None = None
+    count: int
+
+
+class ImageFacets(BaseModel):
+    camera_model: List[FacetCount]
+    image_type: List[FacetCount]
+    date: List[FacetCount]
+
+
+class ImageSearchPage(BaseModel):
+    items: List[ImageMetadata]
+    next_cursor: str | None = None
+    total: int
+    limit: int
+    facets: ImageFacets
+
+
 class ImageUpdate(BaseModel):
     filename: str | None = None
     path: str | None = None
@@ -78,6 +117,7 @@ class ImageBulkImportRequest(BaseModel):
     directory: str
     image_type_id: int
     recursive: bool = False
+    dedup: bool = False
 
 
 class ImageBulkImportError(BaseModel):
@@ -89,11 +129,74 @@ class ImageBulkImportResult(BaseModel):
     created: int
     updated: int
     skipped: int
+    cache_hits: int = 0
+    cache_misses: int = 0
+    linked: int = 0
     errors: List[ImageBulkImportError] = []
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class ImportJob(BaseModel):
+    id: int
+    directory: str
+    image_type_id: int | None = None
+    recursive: bool
+    dedup: bool = False
+    status: str
+    cancel_requested: bool = False
+    files_total: int | None = None
+    files_seen: int = 0
+    files_processed: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    linked: int = 0
+    errors: List[ImageBulkImportError] = []
+    checkpoint_path: str | None = None
+    error_message: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    files_per_second: float | None = None
+    eta_seconds: float | None = None
+
+
+class ImageUpload(BaseModel):
+    id: str
+    filename: str
+    image_type_id: int | None = None
+    length: int
+    received: int
+    status: str
+    content_hash: str | None = None
+    image_id: int | None = None
+    error_message: str | None = None
+    created_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ImageIndexerStatus(BaseModel):
+    running: bool
+    directory: str
+    interval: float
+    tracked_files: int
+    queue_depth: int
+    scans: int
+    registered: int
+    removed: int
+    errors: int
+    last_scan_at: float | None = None
+    last_scan_duration: float | None = None
+    seconds_since_last_scan: float | None = None
+    last_lag: float | None = None
+    max_lag: float = 0.0
+
+
 class QuestionBase(BaseModel):
     question_text: str
 
@@ -127,7 +230,17 @@ class Option(OptionBase):
     model_config = ConfigDict(from_attributes=True)
 
 
-from .answer import Answer, AnswerCreate
-from .annotation import Annotation, AnnotationCreate, AnnotationUpdate
+from .answer import Answer, AnswerBatch, AnswerBatchItem, AnswerCreate
+from .annotation import (
+    Annotation,
+    AnnotationBatch,
+    AnnotationBatchCreate,
+    AnnotationBatchCreated,
+    AnnotationBatchResult,
+    AnnotationBatchUpdate,
+    AnnotationCreate,
+    AnnotationUpdate,
+)
 from .expert_type import ExpertType, ExpertTypeBase, ExpertTypeCreate
 from .label import Label, LabelCreate
+from .workspace import ImageWorkspace
@@ -27,6 +27,35 @@ class AnnotationUpdate(BaseModel):
     points: List[Point] | None = None
 
 
+class AnnotationBatchCreate(BaseModel):
+    client_id: str | None = None
+    label_id: int
+    points: List[Point]
+
+
+class AnnotationBatchUpdate(BaseModel):
+    id: int
+    label_id: int | None = None
+    points: List[Point] | None = None
+
+
+class AnnotationBatch(BaseModel):
+    created: List[AnnotationBatchCreate] = []
+    updated: List[AnnotationBatchUpdate] = []
+    deleted: List[int] = []
+
+
+class AnnotationBatchCreated(BaseModel):
+    client_id: str | None = None
+    id: int
+
+
+class AnnotationBatchResult(BaseModel):
+    created: List[AnnotationBatchCreated]
+    updated: List[int]
+    deleted: List[int]
+
+
 class Annotation(AnnotationBase):
     id: int
     user_id: int
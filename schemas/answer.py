@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List
 
 from pydantic import BaseModel, ConfigDict
 
@@ -13,6 +14,15 @@ class AnswerCreate(AnswerBase):
     pass
 
 
+class AnswerBatchItem(BaseModel):
+    question_id: int
+    selected_option_id: int
+
+
+class AnswerBatch(BaseModel):
+    answers: List[AnswerBatchItem]
+
+
 class Answer(AnswerBase):
     id: int
     user_id: int
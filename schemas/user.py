@@ -37,3 +37,24 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str | None = None
+
+
+class LoginRateGateStatus(BaseModel):
+    limit: int
+    window: float
+    tracked_usernames: int
+    throttled: int
+
+
+class PasswordPoolStatus(BaseModel):
+    workers: int
+    queue_max: int
+    running: int
+    queued: int
+    submitted: int
+    completed: int
+    rejected: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    avg_run_ms: float
+    rate_gate: LoginRateGateStatus
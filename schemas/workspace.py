@@ -0,0 +1,50 @@
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+from . import Image, ImageTileInfo, ImageType
+from .annotation import Point
+
+
+class WorkspaceImage(Image):
+    image_type: ImageType | None = None
+
+
+class WorkspaceOption(BaseModel):
+    id: int
+    text: str
+
+
+class WorkspaceQuestion(BaseModel):
+    id: int
+    text: str
+    options: List[WorkspaceOption] = []
+    depends_on_question_id: int | None = None
+    depends_on_option_id: int | None = None
+    order: int
+
+
+class WorkspaceAnnotation(BaseModel):
+    id: int
+    label_id: int
+    label: str
+    points: List[Point]
+
+
+class WorkspaceLabel(BaseModel):
+    id: int
+    name: str
+
+
+class ImageWorkspace(BaseModel):
+    image: WorkspaceImage
+    image_url: str
+    source_width: int | None = None
+    source_height: int | None = None
+    tile_info: ImageTileInfo | None = None
+    prev_id: int | None = None
+    next_id: int | None = None
+    questions: List[WorkspaceQuestion] = []
+    answers: Dict[int, int] = {}
+    annotations: List[WorkspaceAnnotation] = []
+    labels: List[WorkspaceLabel] = []
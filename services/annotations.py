@@ -0,0 +1,137 @@
+"""Atomic application of annotation diffs from the canvas.
+
+A diff lists the polygons the client created, updated and deleted on one
+image since its last sync. Every referenced label is checked with a single
+``IN`` query and every referenced annotation with another; the changes are
+then flushed together (one multi-row ``INSERT``, batched ``UPDATE`` and
+``DELETE``) so the caller commits them as one transaction.
+"""
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Annotation as AnnotationModel, Image as ImageModel, Label as LabelModel
+from services.principals import Principal, filter_images_for_user
+
+
+def _visible_image_query(image_id: int, principal: Principal):
+    return filter_images_for_user(select(ImageModel.id).where(ImageModel.id == image_id), principal)
+
+
+def _check_batch(batch) -> None:
+    """Reject diffs naming the same annotation twice."""
+    seen: set[int] = set()
+    for annotation_id in [item.id for item in batch.updated] + list(batch.deleted):
+        if annotation_id in seen:
+            raise HTTPException(
+                status_code=400, detail=f"Annotation {annotation_id} listed twice"
+            )
+        seen.add(annotation_id)
+
+
+def _label_ids(batch) -> set[int]:
+    return {item.label_id for item in (*batch.created, *batch.updated) if item.label_id is not None}
+
+
+def _labels_query(label_ids: set[int]):
+    return select(LabelModel.id).where(LabelModel.id.in_(label_ids))
+
+
+def _owned_query(image_id: int, principal: Principal, annotation_ids: set[int]):
+    return select(AnnotationModel).where(
+        AnnotationModel.id.in_(annotation_ids),
+        AnnotationModel.image_id == image_id,
+        AnnotationModel.user_id == principal.id,
+    )
+
+
+def _check_found(requested: set[int], found, detail: str) -> None:
+    missing = sorted(requested - set(found))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"{detail}: {missing}")
+
+
+def _stage(db, image_id: int, principal: Principal, batch, owned: dict) -> list[AnnotationModel]:
+    """Apply updates to the loaded rows and add the new ones; return the new rows."""
+    for item in batch.updated:
+        annotation = owned[item.id]
+        changes = item.model_dump(exclude_unset=True, exclude={"id"})
+        for field, value in changes.items():
+            if value is not None:
+                setattr(annotation, field, value)
+    created = [
+        AnnotationModel(
+            image_id=image_id,
+            label_id=item.label_id,
+            points=[point.model_dump() for point in item.points],
+            user_id=principal.id,
+        )
+        for item in batch.created
+    ]
+    db.add_all(created)
+    return created
+
+
+def _delete_statement(batch):
+    return delete(AnnotationModel).where(AnnotationModel.id.in_(batch.deleted))
+
+
+def _result(batch, created: list[AnnotationModel]) -> dict:
+    return {
+        "created": [
+            {"client_id": item.client_id, "id": annotation.id}
+            for item, annotation in zip(batch.created, created)
+        ],
+        "updated": [item.id for item in batch.updated],
+        "deleted": list(batch.deleted),
+    }
+
+
+def apply_annotation_batch(db: Session, image_id: int, principal: Principal, batch) -> dict:
+    """Apply ``batch`` to the principal's annotations on ``image_id``; the caller commits.
+
+    Returns the ids assigned to the created polygons, paired with the
+    ``client_id`` the client sent for each of them.
+    """
+    _check_batch(batch)
+    if db.scalar(_visible_image_query(image_id, principal)) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    label_ids = _label_ids(batch)
+    if label_ids:
+        _check_found(label_ids, db.scalars(_labels_query(label_ids)), "Label not found")
+    annotation_ids = {item.id for item in batch.updated} | set(batch.deleted)
+    owned = {}
+    if annotation_ids:
+        owned = {a.id: a for a in db.scalars(_owned_query(image_id, principal, annotation_ids))}
+        _check_found(annotation_ids, owned, "Annotation not found")
+    created = _stage(db, image_id, principal, batch, owned)
+    if batch.deleted:
+        db.execute(_delete_statement(batch))
+    db.flush()
+    return _result(batch, created)
+
+
+async def apply_annotation_batch_async(
+    db: AsyncSession, image_id: int, principal: Principal, batch
+) -> dict:
+    """``apply_annotation_batch`` for an ``AsyncSession``; the caller commits."""
+    _check_batch(batch)
+    if await db.scalar(_visible_image_query(image_id, principal)) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    label_ids = _label_ids(batch)
+    if label_ids:
+        _check_found(label_ids, await db.scalars(_labels_query(label_ids)), "Label not found")
+    annotation_ids = {item.id for item in batch.updated} | set(batch.deleted)
+    owned = {}
+    if annotation_ids:
+        owned = {
+            a.id: a for a in await db.scalars(_owned_query(image_id, principal, annotation_ids))
+        }
+        _check_found(annotation_ids, owned, "Annotation not found")
+    created = _stage(db, image_id, principal, batch, owned)
+    if batch.deleted:
+        await db.execute(_delete_statement(batch))
+    await db.flush()
+    return _result(batch, created)
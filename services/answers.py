@@ -0,0 +1,170 @@
+"""Atomic saving of expert answers."""
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Answer as AnswerModel, Image as ImageModel, Option as OptionModel
+from services.principals import Principal, filter_images_for_user
+
+
+def _upsert_statement(bind, rows: list[dict]):
+    """``INSERT ... ON CONFLICT`` for ``rows``, or None without dialect support."""
+    table = AnswerModel.__table__
+    statement = dialect_insert(bind, AnswerModel)
+    if statement is None:
+        return None
+    statement = statement.values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.image_id, table.c.user_id, table.c.question_id],
+        set_={
+            "selected_option_id": statement.excluded.selected_option_id,
+            "answered_at": func.now(),
+        },
+    )
+
+
+def _answer_row(image_id: int, question_id: int, user_id: int, selected_option_id: int) -> dict:
+    return {
+        "image_id": image_id,
+        "question_id": question_id,
+        "user_id": user_id,
+        "selected_option_id": selected_option_id,
+    }
+
+
+def upsert_answer(
+    db: Session, image_id: int, question_id: int, user_id: int, selected_option_id: int
+) -> AnswerModel:
+    """Create or replace the answer of ``user_id`` to a question on an image.
+
+    Relies on the unique ``(image_id, user_id, question_id)`` index so two
+    concurrent saves cannot create duplicates; the caller commits.
+    """
+    row = _answer_row(image_id, question_id, user_id, selected_option_id)
+    statement = _upsert_statement(db.get_bind(), [row])
+    if statement is None:
+        answer = (
+            db.query(AnswerModel)
+            .filter_by(image_id=image_id, question_id=question_id, user_id=user_id)
+            .first()
+        )
+        if answer is None:
+            answer = AnswerModel(image_id=image_id, question_id=question_id, user_id=user_id)
+            db.add(answer)
+        answer.selected_option_id = selected_option_id
+        db.flush()
+        return answer
+    answer_id = db.execute(statement.returning(AnswerModel.__table__.c.id)).scalar_one()
+    return db.get(AnswerModel, answer_id, populate_existing=True)
+
+
+async def upsert_answer_async(
+    db: AsyncSession, image_id: int, question_id: int, user_id: int, selected_option_id: int
+) -> AnswerModel:
+    """``upsert_answer`` for an ``AsyncSession``; the caller commits."""
+    row = _answer_row(image_id, question_id, user_id, selected_option_id)
+    statement = _upsert_statement(db.bind, [row])
+    if statement is None:
+        answer = await db.scalar(
+            select(AnswerModel).filter_by(
+                image_id=image_id, question_id=question_id, user_id=user_id
+            )
+        )
+        if answer is None:
+            answer = AnswerModel(image_id=image_id, question_id=question_id, user_id=user_id)
+            db.add(answer)
+        answer.selected_option_id = selected_option_id
+        await db.flush()
+        await db.refresh(answer)
+        return answer
+    answer_id = (await db.execute(statement.returning(AnswerModel.__table__.c.id))).scalar_one()
+    return await db.get(AnswerModel, answer_id, populate_existing=True)
+
+
+def _visible_image_query(image_id: int, principal: Principal):
+    return filter_images_for_user(select(ImageModel.id).where(ImageModel.id == image_id), principal)
+
+
+def _options_query(selections: dict[int, int]):
+    return select(OptionModel.id, OptionModel.question_id).where(
+        OptionModel.id.in_(set(selections.values()))
+    )
+
+
+def _check_options(selections: dict[int, int], option_rows) -> None:
+    """Raise 400 unless every selected option belongs to its question."""
+    question_of_option = dict(option_rows)
+    invalid = sorted(
+        question_id
+        for question_id, option_id in selections.items()
+        if question_of_option.get(option_id) != question_id
+    )
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Selected option does not belong to question(s) {invalid}",
+        )
+
+
+def _selections(answers) -> dict[int, int]:
+    """Map question id to selected option id, rejecting repeated questions."""
+    selections: dict[int, int] = {}
+    for answer in answers:
+        if answer.question_id in selections:
+            raise HTTPException(
+                status_code=400, detail=f"Question {answer.question_id} answered twice"
+            )
+        selections[answer.question_id] = answer.selected_option_id
+    return selections
+
+
+def upsert_answers(
+    db: Session, image_id: int, principal: Principal, answers
+) -> list[AnswerModel]:
+    """Validate and save a whole questionnaire for one image; the caller commits.
+
+    ``answers`` are items with ``question_id`` and ``selected_option_id``.
+    Options are checked against their questions in one query and the
+    answers are written with a single multi-row upsert.
+    """
+    selections = _selections(answers)
+    if db.scalar(_visible_image_query(image_id, principal)) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not selections:
+        return []
+    _check_options(selections, db.execute(_options_query(selections)).all())
+    rows = [_answer_row(image_id, q, principal.id, o) for q, o in selections.items()]
+    statement = _upsert_statement(db.get_bind(), rows)
+    if statement is None:
+        return [upsert_answer(db, **row) for row in rows]
+    return list(
+        db.scalars(
+            statement.returning(AnswerModel),
+            execution_options={"populate_existing": True},
+        )
+    )
+
+
+async def upsert_answers_async(
+    db: AsyncSession, image_id: int, principal: Principal, answers
+) -> list[AnswerModel]:
+    """``upsert_answers`` for an ``AsyncSession``; the caller commits."""
+    selections = _selections(answers)
+    if await db.scalar(_visible_image_query(image_id, principal)) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not selections:
+        return []
+    _check_options(selections, (await db.execute(_options_query(selections))).all())
+    rows = [_answer_row(image_id, q, principal.id, o) for q, o in selections.items()]
+    statement = _upsert_statement(db.bind, rows)
+    if statement is None:
+        return [await upsert_answer_async(db, **row) for row in rows]
+    return list(
+        await db.scalars(
+            statement.returning(AnswerModel),
+            execution_options={"populate_existing": True},
+        )
+    )
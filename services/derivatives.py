@@ -0,0 +1,217 @@
+"""Thumbnails and screen-sized previews kept in a bounded on-disk cache.
+
+Derivatives are decoded at reduced resolution with Pillow's ``draft()`` (JPEG
+DCT scaling) and ``reduce()`` before the final resample, so a preview of a
+large drone frame never materialises the full-size bitmap. Cache entries are
+named after the source path, size, ``mtime_ns`` and variant: a changed source
+gets a new entry and the entry name doubles as a strong ETag. The directory
+is sharded by hash prefix and trimmed least-recently-used first once it grows
+past ``DERIVATIVE_CACHE_MB``.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image as PILImage
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_CACHE_DIR = Path(os.getenv("DERIVATIVE_CACHE_DIR", "./derivative_cache"))
+DERIVATIVE_CACHE_MB = int(os.getenv("DERIVATIVE_CACHE_MB", "1024"))
+DERIVATIVES_ON_IMPORT = os.getenv("DERIVATIVES_ON_IMPORT", "false").lower() in ("1", "true", "yes")
+
+# Orthomosaics from the trusted IMAGE_DIR routinely exceed Pillow's
+# decompression-bomb guard. Only header reads and the tile reader open files
+# through ``open_large_image`` with this limit; everything else keeps Pillow's.
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "4000000000"))
+_large_open_lock = threading.Lock()
+
+VARIANTS = {
+    "thumbnail": {"size": 256, "quality": 80},
+    "preview": {"size": 2048, "quality": 88},
+}
+
+_ORIENTATION_TAG = 0x0112
+_ORIENTATION_TRANSPOSE = {
+    2: PILImage.Transpose.FLIP_LEFT_RIGHT,
+    3: PILImage.Transpose.ROTATE_180,
+    4: PILImage.Transpose.FLIP_TOP_BOTTOM,
+    5: PILImage.Transpose.TRANSPOSE,
+    6: PILImage.Transpose.ROTATE_270,
+    7: PILImage.Transpose.TRANSVERSE,
+    8: PILImage.Transpose.ROTATE_90,
+}
+# EXIF orientations that swap width and height once applied.
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def open_large_image(path: Path) -> PILImage.Image:
+    """Open ``path`` lazily, accepting up to ``IMAGE_MAX_PIXELS`` pixels.
+
+    Pillow reads its limit from a module global when the header is parsed,
+    so the limit is raised only around that call, under a lock, and the
+    size is then checked against ``IMAGE_MAX_PIXELS`` here.
+    """
+    with _large_open_lock:
+        default = PILImage.MAX_IMAGE_PIXELS
+        if default is not None:
+            PILImage.MAX_IMAGE_PIXELS = max(default, IMAGE_MAX_PIXELS)
+        try:
+            img = PILImage.open(path)
+        finally:
+            PILImage.MAX_IMAGE_PIXELS = default
+    pixels = img.size[0] * img.size[1]
+    if pixels > IMAGE_MAX_PIXELS:
+        img.close()
+        raise PILImage.DecompressionBombError(
+            f"Image size ({pixels} pixels) exceeds limit of {IMAGE_MAX_PIXELS} pixels"
+        )
+    return img
+
+
+def source_size(path: Path) -> tuple[int, int]:
+    """Return the displayed (orientation-corrected) size of ``path`` from its header."""
+    with open_large_image(path) as img:
+        width, height = img.size
+        if img.getexif().get(_ORIENTATION_TAG) in _TRANSPOSED_ORIENTATIONS:
+            return height, width
+        return width, height
+
+
+def render(path: Path, variant: str) -> PILImage.Image:
+    """Decode ``path`` scaled to fit the variant's bounding box."""
+    target = VARIANTS[variant]["size"]
+    with PILImage.open(path) as img:
+        transpose = _ORIENTATION_TRANSPOSE.get(img.getexif().get(_ORIENTATION_TAG))
+        img.draft("RGB", (target, target))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        factor = max(img.size) // target
+        img = img.reduce(factor) if factor > 1 else img.copy()
+        if transpose is not None:
+            img = img.transpose(transpose)
+        img.thumbnail((target, target), PILImage.Resampling.LANCZOS)
+        return img
+
+
+class DerivativeCache:
+    """Sharded LRU cache of rendered derivatives under a byte budget."""
+
+    def __init__(self, directory: Path, budget_bytes: int):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._usage: int | None = None
+
+    def key(self, path: Path, stat: os.stat_result, variant: str) -> str:
+        raw = f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / key[2:4] / f"{key}.jpg"
+
+    def get(self, path: Path, variant: str) -> tuple[Path, str]:
+        """Return ``(cached_file, etag_key)``, rendering the derivative if missing."""
+        if variant not in VARIANTS:
+            raise KeyError(variant)
+        return self.fetch(
+            path, variant, lambda: render(path, variant), VARIANTS[variant]["quality"]
+        )
+
+    def fetch(
+        self,
+        path: Path,
+        variant: str,
+        produce: Callable[[], PILImage.Image],
+        quality: int,
+    ) -> tuple[Path, str]:
+        """Return the cached entry for ``(path, variant)``, calling ``produce`` on a miss."""
+        key = self.key(path, path.stat(), variant)
+        entry = self.entry_path(key)
+        if self._touch(entry):
+            return entry, key
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if not self._touch(entry):
+                size = self._write(entry, produce(), quality)
+                self._account(size)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return entry, key
+
+    def warm(self, path: Path) -> None:
+        """Render every variant of ``path``; used by imports running in worker processes."""
+        for variant in VARIANTS:
+            entry = self.entry_path(self.key(path, path.stat(), variant))
+            if not entry.exists():
+                self._write(entry, render(path, variant), VARIANTS[variant]["quality"])
+
+    def _touch(self, entry: Path) -> bool:
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _write(self, entry: Path, image: PILImage.Image, quality: int) -> int:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                image.save(handle, "JPEG", quality=quality, optimize=True)
+            os.replace(tmp_name, entry)
+        except Exception:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return entry.stat().st_size
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".jpg"):
+                    full = os.path.join(root, name)
+                    try:
+                        yield full, os.stat(full)
+                    except FileNotFoundError:
+                        continue
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            if self._usage is None:
+                self._usage = sum(stat.st_size for _, stat in self._entries())
+            else:
+                self._usage += added
+            over_budget = self._usage > self.budget_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until usage is 90% of the budget."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda item: item[1].st_mtime_ns)
+            usage = sum(stat.st_size for _, stat in entries)
+            target = self.budget_bytes * 0.9
+            removed = 0
+            for full, stat in entries:
+                if usage <= target:
+                    break
+                try:
+                    os.unlink(full)
+                except FileNotFoundError:
+                    pass
+                usage -= stat.st_size
+                removed += 1
+            self._usage = usage
+        if removed:
+            logger.info("Evicted %d derivative(s), cache now %d bytes", removed, usage)
+        return removed
+
+
+derivative_cache = DerivativeCache(DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MB * 1024 * 1024)
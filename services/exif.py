@@ -0,0 +1,410 @@
+"""EXIF extraction kept free of FastAPI imports so worker processes can load it.
+
+``extract_exif`` reads the metadata straight from the file through ``mmap``
+without decoding any pixel data:
+
+* JPEG: the markers are walked up to the start of scan, picking the APP1
+  ``Exif`` and XMP segments and the frame size from the SOF marker.
+* TIFF based files (``.tif``, ``.nef``, ``.cr2``, ``.arw``, DNG, BigTIFF):
+  IFD0, the EXIF and GPS IFDs and the XMP tag are followed by offset, so only
+  the pages holding them are read even when the IFDs sit at the end of a
+  large orthophoto.
+* PNG: the ``IHDR``, ``eXIf`` and XMP ``iTXt`` chunks before the first
+  ``IDAT``.
+
+DJI ``drone-dji`` XMP properties fill the drone fields. Other formats, and
+files the reader cannot make sense of, go through ``extract_exif_pillow``.
+"""
+
+import mmap
+import re
+import struct
+from pathlib import Path
+
+from PIL import Image as PILImage, ExifTags
+
+# TIFF field types: (struct code, size in bytes). Rationals are two codes.
+_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1),
+    7: ("B", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8),
+    13: ("I", 4), 16: ("Q", 8), 17: ("q", 8), 18: ("Q", 8),
+}
+MAX_IFD_ENTRIES = 4096
+
+IMAGE_WIDTH, IMAGE_LENGTH = 0x0100, 0x0101
+MAKE, MODEL, ORIENTATION, DATETIME = 0x010F, 0x0110, 0x0112, 0x0132
+SUB_IFDS, XMP_PACKET, EXIF_IFD, GPS_IFD = 0x014A, 0x02BC, 0x8769, 0x8825
+EXPOSURE_TIME, F_NUMBER, ISO_SPEED = 0x829A, 0x829D, 0x8827
+DATETIME_ORIGINAL, SHUTTER_SPEED_VALUE, APERTURE_VALUE = 0x9003, 0x9201, 0x9202
+FOCAL_LENGTH, PIXEL_X, PIXEL_Y, LENS_MODEL = 0x920A, 0xA002, 0xA003, 0xA434
+GPS_LAT_REF, GPS_LAT, GPS_LON_REF, GPS_LON, GPS_ALT_REF, GPS_ALT = range(1, 7)
+
+_IFD0_TAGS = {
+    IMAGE_WIDTH, IMAGE_LENGTH, MAKE, MODEL, ORIENTATION, DATETIME,
+    SUB_IFDS, XMP_PACKET, EXIF_IFD, GPS_IFD,
+}
+_EXIF_TAGS = {
+    EXPOSURE_TIME, F_NUMBER, ISO_SPEED, DATETIME_ORIGINAL, SHUTTER_SPEED_VALUE,
+    APERTURE_VALUE, FOCAL_LENGTH, PIXEL_X, PIXEL_Y, LENS_MODEL,
+}
+_GPS_TAGS = {GPS_LAT_REF, GPS_LAT, GPS_LON_REF, GPS_LON, GPS_ALT_REF, GPS_ALT}
+_SIZE_TAGS = {IMAGE_WIDTH, IMAGE_LENGTH}
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_EXIF_HEADER = b"Exif\x00\x00"
+_XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_XMP_KEYWORD = b"XML:com.adobe.xmp"
+
+# ``prefix:Name="value"`` attributes and ``<prefix:Name>value</prefix:Name>``
+# elements: DJI writes flat properties in either form.
+_XMP_ATTRIBUTE = re.compile(rb'\b[\w.-]+:(\w+)\s*=\s*"([^"]*)"')
+_XMP_ELEMENT = re.compile(rb"<([\w.-]+):(\w+)>([^<]*)</\1:\2>")
+
+# Candidate XMP properties for each drone field, most specific first. The
+# gimbal angles are the camera's orientation; the flight angles are the
+# aircraft's and only stand in for cameras without a gimbal.
+XMP_FIELDS = {
+    "exif_drone_model": ("DroneModel",),
+    "exif_flight_id": ("FlightId", "FlightID"),
+    "exif_pitch": ("GimbalPitchDegree", "FlightPitchDegree", "Pitch"),
+    "exif_roll": ("GimbalRollDegree", "FlightRollDegree", "Roll"),
+    "exif_yaw": ("GimbalYawDegree", "FlightYawDegree", "Yaw"),
+}
+_XMP_FLOAT_FIELDS = {"exif_pitch", "exif_roll", "exif_yaw"}
+
+
+class _Tiff:
+    """IFD reader over a TIFF stream starting at ``base`` inside ``buffer``."""
+
+    def __init__(self, buffer, base: int = 0, end: int | None = None):
+        self.buffer = buffer
+        self.base = base
+        self.end = len(buffer) if end is None else end
+        order = buffer[base:base + 2]
+        if order == b"II":
+            self.order = "<"
+        elif order == b"MM":
+            self.order = ">"
+        else:
+            raise ValueError("Not a TIFF header")
+        (magic,) = struct.unpack_from(self.order + "H", buffer, base + 2)
+        if magic == 43:
+            self.offset_code, self.entry_size = "Q", 20
+            (self.first_ifd,) = struct.unpack_from(self.order + "Q", buffer, base + 8)
+        else:
+            # 42 for TIFF, DNG, NEF and ARW; CR2 adds "CR" after the header.
+            self.offset_code, self.entry_size = "I", 12
+            (self.first_ifd,) = struct.unpack_from(self.order + "I", buffer, base + 4)
+        self.count_code = "Q" if magic == 43 else "H"
+        self.value_size = 8 if magic == 43 else 4
+
+    def _unpack(self, code: str, offset: int):
+        offset += self.base
+        size = struct.calcsize(self.order + code)
+        if offset < self.base or offset + size > self.end:
+            raise ValueError("TIFF offset out of range")
+        return struct.unpack_from(self.order + code, self.buffer, offset)
+
+    def ifd(self, offset: int, wanted: set[int]) -> dict[int, object]:
+        """Decode the ``wanted`` tags of the IFD at ``offset``; other values are not read."""
+        (count,) = self._unpack(self.count_code, offset)
+        if count > MAX_IFD_ENTRIES:
+            raise ValueError("Implausible IFD entry count")
+        values = {}
+        entry = offset + struct.calcsize(self.count_code)
+        entry_code = "HH" + ("Q" if self.value_size == 8 else "I")
+        for _ in range(count):
+            tag, kind, length = self._unpack(entry_code, entry)
+            field = entry + 4 + struct.calcsize(entry_code[2])
+            entry += self.entry_size
+            if tag not in wanted or kind not in _TYPES:
+                continue
+            code, size = _TYPES[kind]
+            if size * length > self.value_size:
+                (field,) = self._unpack(self.offset_code, field)
+            values[tag] = self._value(kind, code, length, field)
+        return values
+
+    def _value(self, kind: int, code: str, length: int, offset: int):
+        if kind in (1, 2, 7):
+            start = self.base + offset
+            if start < self.base or start + length > self.end:
+                raise ValueError("TIFF offset out of range")
+            raw = bytes(self.buffer[start:start + length])
+            return raw.split(b"\x00", 1)[0].decode("utf-8", "replace").strip() if kind == 2 else raw
+        numbers = self._unpack(f"{length * len(code)}{code[0]}", offset)
+        if len(code) == 2:
+            numbers = tuple(
+                numerator / denominator if denominator else None
+                for numerator, denominator in zip(numbers[0::2], numbers[1::2])
+            )
+        return numbers[0] if length == 1 else numbers
+
+
+def _number(value):
+    """First number of a TIFF value (``None`` for empty or undefined)."""
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    return value if isinstance(value, (int, float)) else None
+
+
+def _degrees(value, ref) -> float | None:
+    if not isinstance(value, tuple) or len(value) != 3 or None in value:
+        return None
+    degrees, minutes, seconds = value
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if ref in ("S", "W") else decimal
+
+
+def _read_tiff(tiff: _Tiff) -> tuple[dict, dict, dict, bytes | None]:
+    """IFD0, EXIF IFD, GPS IFD and XMP packet of a TIFF stream."""
+    ifd0 = tiff.ifd(tiff.first_ifd, _IFD0_TAGS)
+    exif = tiff.ifd(ifd0[EXIF_IFD], _EXIF_TAGS) if _number(ifd0.get(EXIF_IFD)) else {}
+    gps = tiff.ifd(ifd0[GPS_IFD], _GPS_TAGS) if _number(ifd0.get(GPS_IFD)) else {}
+    # RAW files keep a thumbnail in IFD0 and the full frame in a sub-IFD.
+    sub_ifds = ifd0.get(SUB_IFDS) or ()
+    for offset in sub_ifds if isinstance(sub_ifds, tuple) else (sub_ifds,):
+        sizes = tiff.ifd(offset, _SIZE_TAGS)
+        if (_number(sizes.get(IMAGE_WIDTH)) or 0) > (_number(ifd0.get(IMAGE_WIDTH)) or 0):
+            ifd0[IMAGE_WIDTH] = sizes.get(IMAGE_WIDTH)
+            ifd0[IMAGE_LENGTH] = sizes.get(IMAGE_LENGTH)
+    xmp = ifd0.get(XMP_PACKET)
+    return ifd0, exif, gps, xmp if isinstance(xmp, bytes) else None
+
+
+def _exif_fields(ifd0: dict, exif: dict, gps: dict) -> dict:
+    data = {}
+    datetime = ifd0.get(DATETIME) or exif.get(DATETIME_ORIGINAL)
+    for key, value in (
+        ("exif_datetime", datetime),
+        ("exif_camera_make", ifd0.get(MAKE)),
+        ("exif_camera_model", ifd0.get(MODEL)),
+        ("exif_lens_model", exif.get(LENS_MODEL)),
+    ):
+        if isinstance(value, str) and value:
+            data[key] = value
+    if (orientation := _number(ifd0.get(ORIENTATION))) is not None:
+        data["exif_orientation"] = str(orientation)
+    if (focal_length := _number(exif.get(FOCAL_LENGTH))) is not None:
+        data["exif_focal_length"] = float(focal_length)
+    if (aperture := _number(exif.get(F_NUMBER))) is not None:
+        data["exif_aperture"] = float(aperture)
+    elif (apex := _number(exif.get(APERTURE_VALUE))) is not None:
+        data["exif_aperture"] = round(2 ** (apex / 2), 2)
+    if (iso := _number(exif.get(ISO_SPEED))) is not None:
+        data["exif_iso"] = int(iso)
+    if (exposure := _number(exif.get(EXPOSURE_TIME))) is not None:
+        data["exif_shutter_speed"] = str(float(exposure))
+    elif (apex := _number(exif.get(SHUTTER_SPEED_VALUE))) is not None:
+        data["exif_shutter_speed"] = f"{2 ** -apex:.6g}"
+    width = _number(ifd0.get(IMAGE_WIDTH)) or _number(exif.get(PIXEL_X))
+    height = _number(ifd0.get(IMAGE_LENGTH)) or _number(exif.get(PIXEL_Y))
+    if width and height:
+        data["exif_image_width"] = int(width)
+        data["exif_image_height"] = int(height)
+
+    latitude = _degrees(gps.get(GPS_LAT), gps.get(GPS_LAT_REF))
+    longitude = _degrees(gps.get(GPS_LON), gps.get(GPS_LON_REF))
+    if latitude is not None and gps.get(GPS_LAT_REF):
+        data["exif_gps_lat"] = latitude
+    if longitude is not None and gps.get(GPS_LON_REF):
+        data["exif_gps_lon"] = longitude
+    if (altitude := _number(gps.get(GPS_ALT))) is not None:
+        below_sea_level = gps.get(GPS_ALT_REF) in (b"\x01", 1)
+        data["exif_gps_alt"] = -altitude if below_sea_level else altitude
+    return data
+
+
+def parse_xmp(packet: bytes) -> dict:
+    """Drone fields found in an XMP packet."""
+    properties = {}
+    for name, value in _XMP_ATTRIBUTE.findall(packet):
+        properties.setdefault(name.decode("ascii"), value)
+    for _, name, value in _XMP_ELEMENT.findall(packet):
+        properties.setdefault(name.decode("ascii"), value)
+
+    data = {}
+    for key, candidates in XMP_FIELDS.items():
+        for name in candidates:
+            value = properties.get(name, b"").decode("utf-8", "replace").strip()
+            if not value:
+                continue
+            if key in _XMP_FLOAT_FIELDS:
+                try:
+                    data[key] = float(value)
+                except ValueError:
+                    continue
+            else:
+                data[key] = value
+            break
+    return data
+
+
+def _scan_jpeg(buffer) -> tuple[_Tiff | None, bytes | None, tuple[int, int] | None]:
+    """EXIF stream, XMP packet and frame size from the markers before the scan data."""
+    tiff = xmp = size = None
+    position, end = 2, len(buffer)
+    while position + 4 <= end:
+        if buffer[position] != 0xFF:
+            break
+        marker = buffer[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        if marker in (0xDA, 0xD9):
+            break
+        (length,) = struct.unpack_from(">H", buffer, position + 2)
+        start, position = position + 4, position + 2 + length
+        if marker == 0xE1:
+            if tiff is None and buffer[start:start + 6] == _EXIF_HEADER:
+                tiff = _Tiff(buffer, start + 6, min(position, end))
+            elif xmp is None and buffer[start:start + len(_XMP_HEADER)] == _XMP_HEADER:
+                xmp = bytes(buffer[start + len(_XMP_HEADER):position])
+        elif marker in _JPEG_SOF and start + 5 <= end:
+            height, width = struct.unpack_from(">HH", buffer, start + 1)
+            size = (width, height)
+    return tiff, xmp, size
+
+
+def _scan_png(buffer) -> tuple[_Tiff | None, bytes | None, tuple[int, int] | None]:
+    """EXIF stream, XMP packet and size from the chunks before the image data."""
+    tiff = xmp = size = None
+    position, end = len(_PNG_SIGNATURE), len(buffer)
+    while position + 8 <= end:
+        length, kind = struct.unpack_from(">I4s", buffer, position)
+        start, position = position + 8, position + 12 + length
+        if kind == b"IDAT" or kind == b"IEND":
+            break
+        if kind == b"IHDR":
+            size = struct.unpack_from(">II", buffer, start)
+        elif kind == b"eXIf":
+            tiff = _Tiff(buffer, start, start + length)
+        elif kind == b"iTXt" and buffer[start:start + len(_PNG_XMP_KEYWORD) + 2] == (
+            _PNG_XMP_KEYWORD + b"\x00\x00"
+        ):
+            # Uncompressed only: keyword, flag, method, language and keyword translation.
+            text = bytes(buffer[start + len(_PNG_XMP_KEYWORD) + 3:start + length])
+            xmp = text.split(b"\x00", 2)[-1]
+    return tiff, xmp, size
+
+
+def read_exif(buffer) -> dict | None:
+    """Metadata of an image held in ``buffer``, or ``None`` for unknown formats."""
+    head = buffer[:8]
+    if head[:2] == b"\xff\xd8":
+        tiff, xmp, size = _scan_jpeg(buffer)
+    elif head == _PNG_SIGNATURE:
+        tiff, xmp, size = _scan_png(buffer)
+    elif head[:2] in (b"II", b"MM"):
+        tiff, xmp, size = _Tiff(buffer), None, None
+    else:
+        return None
+
+    data = {}
+    manufacturer = None
+    if tiff is not None:
+        ifd0, exif, gps, tiff_xmp = _read_tiff(tiff)
+        data = _exif_fields(ifd0, exif, gps)
+        xmp = xmp or tiff_xmp
+        manufacturer = ifd0.get(MAKE)
+    if size is not None:
+        data["exif_image_width"], data["exif_image_height"] = size
+    if xmp:
+        data.update(parse_xmp(xmp))
+    # DJI cameras built into the aircraft report the aircraft as their model.
+    if "exif_drone_model" not in data and manufacturer == "DJI" and "exif_camera_model" in data:
+        data["exif_drone_model"] = data["exif_camera_model"]
+    return data
+
+
+def _ratio_to_float(value):
+    return value[0] / value[1] if isinstance(value, tuple) else float(value)
+
+
+def _convert_to_degrees(value, ref):
+    d, m, s = value
+    decimal = _ratio_to_float(d) + _ratio_to_float(m) / 60 + _ratio_to_float(s) / 3600
+    return -decimal if ref in ["S", "W"] else decimal
+
+
+def extract_exif_pillow(path: Path):
+    """EXIF through Pillow; the fallback for formats ``read_exif`` does not know."""
+    data = {}
+    try:
+        with PILImage.open(path) as img:
+            exif = img._getexif() or {}
+    except Exception:
+        return data
+
+    gps_info = {}
+    for tag_id, value in exif.items():
+        tag = ExifTags.TAGS.get(tag_id, tag_id)
+        if tag == "DateTime":
+            data["exif_datetime"] = value
+        elif tag == "Make":
+            data["exif_camera_make"] = value
+        elif tag == "Model":
+            data["exif_camera_model"] = value
+        elif tag == "LensModel":
+            data["exif_lens_model"] = value
+        elif tag == "FocalLength":
+            data["exif_focal_length"] = _ratio_to_float(value)
+        elif tag in ("FNumber", "ApertureValue"):
+            data["exif_aperture"] = _ratio_to_float(value)
+        elif tag in ("ISOSpeedRatings", "PhotographicSensitivity"):
+            data["exif_iso"] = int(_ratio_to_float(value))
+        elif tag in ("ShutterSpeedValue", "ExposureTime"):
+            data["exif_shutter_speed"] = str(value)
+        elif tag == "Orientation":
+            data["exif_orientation"] = str(value)
+        elif tag == "ImageWidth":
+            data["exif_image_width"] = int(value)
+        elif tag == "ImageLength":
+            data["exif_image_height"] = int(value)
+        elif tag == "GPSInfo":
+            for t in value:
+                sub_tag = ExifTags.GPSTAGS.get(t, t)
+                gps_info[sub_tag] = value[t]
+
+    if gps_info:
+        lat = gps_info.get("GPSLatitude")
+        lat_ref = gps_info.get("GPSLatitudeRef")
+        lon = gps_info.get("GPSLongitude")
+        lon_ref = gps_info.get("GPSLongitudeRef")
+        alt = gps_info.get("GPSAltitude")
+        alt_ref = gps_info.get("GPSAltitudeRef")
+        if lat and lat_ref:
+            data["exif_gps_lat"] = _convert_to_degrees(lat, lat_ref)
+        if lon and lon_ref:
+            data["exif_gps_lon"] = _convert_to_degrees(lon, lon_ref)
+        if alt:
+            altitude = _ratio_to_float(alt)
+            if alt_ref == 1:
+                altitude = -altitude
+            data["exif_gps_alt"] = altitude
+
+    return data
+
+
+def extract_exif(path: Path):
+    """Metadata of ``path`` read through ``mmap``; Pillow for anything else."""
+    try:
+        with open(path, "rb") as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                data = read_exif(buffer)
+    except (OSError, ValueError, struct.error):
+        # Empty, unreadable or malformed: Pillow may still cope.
+        data = None
+    return extract_exif_pillow(path) if data is None else data
+
+
+def read_metadata(path: str) -> tuple[str, dict, str | None]:
+    """Picklable worker entry point returning ``(path, exif, error)``."""
+    try:
+        return path, extract_exif(Path(path)), None
+    except Exception as exc:
+        return path, {}, str(exc)
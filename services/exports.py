@@ -0,0 +1,292 @@
+"""Streaming dataset exports of annotations and answers.
+
+Exports are generators of text chunks meant for a ``StreamingResponse``.
+Each one opens its own session (the request session is closed before the
+body is sent), reads plain column rows with ``yield_per`` so PostgreSQL
+uses a server-side cursor, and emits ``EXPORT_CHUNK_ROWS`` rows at a time:
+memory stays flat however many rows match.
+
+Formats: JSON Lines and CSV for annotations and answers, and COCO
+(instances JSON with polygon segmentations) for annotations.
+"""
+
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterator
+
+from sqlalchemy import exists, select
+from sqlalchemy.orm import Session
+
+from models import (
+    Annotation as AnnotationModel,
+    Answer as AnswerModel,
+    Image as ImageModel,
+    Label as LabelModel,
+    Option as OptionModel,
+    Question as QuestionModel,
+    User as UserModel,
+)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+MEDIA_TYPES = {"coco": "application/json", "jsonl": "application/x-ndjson", "csv": "text/csv"}
+EXTENSIONS = {"coco": "json", "jsonl": "jsonl", "csv": "csv"}
+
+
+@dataclass(frozen=True)
+class ExportFilters:
+    """Row filters shared by every export; ``until`` is exclusive."""
+
+    image_type_id: int | None = None
+    label_id: int | None = None
+    user_id: int | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+
+
+def _filter_annotations(statement, filters: ExportFilters):
+    if filters.image_type_id is not None:
+        statement = statement.where(ImageModel.image_type_id == filters.image_type_id)
+    if filters.label_id is not None:
+        statement = statement.where(AnnotationModel.label_id == filters.label_id)
+    if filters.user_id is not None:
+        statement = statement.where(AnnotationModel.user_id == filters.user_id)
+    if filters.since is not None:
+        statement = statement.where(AnnotationModel.annotated_at >= filters.since)
+    if filters.until is not None:
+        statement = statement.where(AnnotationModel.annotated_at < filters.until)
+    return statement
+
+
+def _filter_answers(statement, filters: ExportFilters):
+    if filters.image_type_id is not None:
+        statement = statement.where(ImageModel.image_type_id == filters.image_type_id)
+    if filters.user_id is not None:
+        statement = statement.where(AnswerModel.user_id == filters.user_id)
+    if filters.since is not None:
+        statement = statement.where(AnswerModel.answered_at >= filters.since)
+    if filters.until is not None:
+        statement = statement.where(AnswerModel.answered_at < filters.until)
+    return statement
+
+
+def _annotation_rows(filters: ExportFilters):
+    return _filter_annotations(
+        select(
+            AnnotationModel.id,
+            AnnotationModel.image_id,
+            ImageModel.filename,
+            ImageModel.image_type_id,
+            AnnotationModel.label_id,
+            LabelModel.name.label("label"),
+            AnnotationModel.user_id,
+            UserModel.username,
+            AnnotationModel.annotated_at,
+            AnnotationModel.min_x,
+            AnnotationModel.min_y,
+            AnnotationModel.max_x,
+            AnnotationModel.max_y,
+            AnnotationModel.points,
+        )
+        .join(ImageModel, AnnotationModel.image_id == ImageModel.id)
+        .join(LabelModel, AnnotationModel.label_id == LabelModel.id)
+        .join(UserModel, AnnotationModel.user_id == UserModel.id)
+        .order_by(AnnotationModel.id),
+        filters,
+    )
+
+
+def _answer_rows(filters: ExportFilters):
+    return _filter_answers(
+        select(
+            AnswerModel.id,
+            AnswerModel.image_id,
+            ImageModel.filename,
+            ImageModel.image_type_id,
+            AnswerModel.question_id,
+            QuestionModel.question_text.label("question"),
+            AnswerModel.selected_option_id,
+            OptionModel.option_text.label("option"),
+            AnswerModel.user_id,
+            UserModel.username,
+            AnswerModel.answered_at,
+        )
+        .join(ImageModel, AnswerModel.image_id == ImageModel.id)
+        .join(QuestionModel, AnswerModel.question_id == QuestionModel.id)
+        .join(OptionModel, AnswerModel.selected_option_id == OptionModel.id)
+        .join(UserModel, AnswerModel.user_id == UserModel.id)
+        .order_by(AnswerModel.id),
+        filters,
+    )
+
+
+def _stream(db: Session, statement) -> Iterator:
+    return db.execute(statement, execution_options={"yield_per": EXPORT_CHUNK_ROWS})
+
+
+def _chunks(lines: Iterator[str]) -> Iterator[str]:
+    """Group lines into ``EXPORT_CHUNK_ROWS`` sized writes."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= EXPORT_CHUNK_ROWS:
+            yield "".join(batch)
+            batch.clear()
+    if batch:
+        yield "".join(batch)
+
+
+def _iso(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+ANNOTATION_COLUMNS = (
+    "id", "image_id", "filename", "image_type_id", "label_id", "label",
+    "user_id", "username", "annotated_at", "bbox", "points",
+)
+ANSWER_COLUMNS = (
+    "id", "image_id", "filename", "image_type_id", "question_id", "question",
+    "selected_option_id", "option", "user_id", "username", "answered_at",
+)
+
+
+def _annotation_record(row) -> dict:
+    return {
+        "id": row.id,
+        "image_id": row.image_id,
+        "filename": row.filename,
+        "image_type_id": row.image_type_id,
+        "label_id": row.label_id,
+        "label": row.label,
+        "user_id": row.user_id,
+        "username": row.username,
+        "annotated_at": _iso(row.annotated_at),
+        "bbox": [row.min_x, row.min_y, row.max_x, row.max_y],
+        "points": row.points,
+    }
+
+
+def _answer_record(row) -> dict:
+    return {
+        "id": row.id,
+        "image_id": row.image_id,
+        "filename": row.filename,
+        "image_type_id": row.image_type_id,
+        "question_id": row.question_id,
+        "question": row.question,
+        "selected_option_id": row.selected_option_id,
+        "option": row.option,
+        "user_id": row.user_id,
+        "username": row.username,
+        "answered_at": _iso(row.answered_at),
+    }
+
+
+def _jsonl(db: Session, statement, record: Callable[..., dict]) -> Iterator[str]:
+    for row in _stream(db, statement):
+        yield json.dumps(record(row), ensure_ascii=False) + "\n"
+
+
+def _csv(
+    db: Session, statement, record: Callable[..., dict], header: tuple[str, ...]
+) -> Iterator[str]:
+    """One CSV row per record; list values (points, bbox) are JSON encoded."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in _stream(db, statement):
+        values = record(row)
+        writer.writerow(
+            json.dumps(values[key]) if isinstance(values[key], list) else values[key]
+            for key in header
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _polygon_area(points: list[dict]) -> float:
+    area = 0.0
+    for current, following in zip(points, points[1:] + points[:1]):
+        area += current["x"] * following["y"] - following["x"] * current["y"]
+    return abs(area) / 2
+
+
+def _coco(db: Session, filters: ExportFilters) -> Iterator[str]:
+    annotated = _filter_annotations(
+        select(AnnotationModel.id).where(AnnotationModel.image_id == ImageModel.id),
+        filters,
+    )
+    images = select(
+        ImageModel.id,
+        ImageModel.filename,
+        ImageModel.exif_image_width,
+        ImageModel.exif_image_height,
+    ).where(exists(annotated)).order_by(ImageModel.id)
+    categories = select(LabelModel.id, LabelModel.name).order_by(LabelModel.id)
+    if filters.label_id is not None:
+        categories = categories.where(LabelModel.id == filters.label_id)
+
+    info = {"description": "Annotaria export", "date_created": datetime.now().isoformat()}
+    yield '{"info": ' + json.dumps(info) + ', "images": ['
+    separator = ""
+    for row in _stream(db, images):
+        image = {
+            "id": row.id,
+            "file_name": row.filename,
+            "width": row.exif_image_width,
+            "height": row.exif_image_height,
+        }
+        yield separator + json.dumps(image, ensure_ascii=False)
+        separator = ", "
+    categories_json = json.dumps(
+        [{"id": row.id, "name": row.name} for row in db.execute(categories)],
+        ensure_ascii=False,
+    )
+    yield '], "categories": ' + categories_json + ', "annotations": ['
+    separator = ""
+    for row in _stream(db, _annotation_rows(filters)):
+        annotation = {
+            "id": row.id,
+            "image_id": row.image_id,
+            "category_id": row.label_id,
+            "segmentation": [[value for point in row.points for value in (point["x"], point["y"])]],
+            "area": _polygon_area(row.points),
+            "bbox": [row.min_x, row.min_y, row.max_x - row.min_x, row.max_y - row.min_y],
+            "iscrowd": 0,
+            "attributes": {"user_id": row.user_id, "annotated_at": _iso(row.annotated_at)},
+        }
+        yield separator + json.dumps(annotation)
+        separator = ", "
+    yield "]}\n"
+
+
+def export_annotations(
+    session_factory: Callable[[], Session], fmt: str, filters: ExportFilters
+) -> Iterator[str]:
+    """Stream the annotations matching ``filters`` as ``coco``, ``jsonl`` or ``csv``."""
+    with session_factory() as db:
+        if fmt == "coco":
+            lines = _coco(db, filters)
+        elif fmt == "csv":
+            lines = _csv(db, _annotation_rows(filters), _annotation_record, ANNOTATION_COLUMNS)
+        else:
+            lines = _jsonl(db, _annotation_rows(filters), _annotation_record)
+        yield from _chunks(lines)
+
+
+def export_answers(
+    session_factory: Callable[[], Session], fmt: str, filters: ExportFilters
+) -> Iterator[str]:
+    """Stream the answers matching ``filters`` as ``jsonl`` or ``csv``."""
+    with session_factory() as db:
+        if fmt == "csv":
+            lines = _csv(db, _answer_rows(filters), _answer_record, ANSWER_COLUMNS)
+        else:
+            lines = _jsonl(db, _answer_rows(filters), _answer_record)
+        yield from _chunks(lines)
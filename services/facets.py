@@ -0,0 +1,179 @@
+"""Precomputed facet counts over the image catalogue.
+
+``image_facet_counts`` holds the number of images per image type, camera
+model and day of ``exif_datetime`` - a small cube whose size depends on the
+number of distinct values, not on the number of images. Triggers on
+``images`` never touch it: every insert, delete or change of one of those
+columns appends ``+1``/``-1`` rows to ``image_facet_deltas``, so concurrent
+writers do not contend for the same counter rows. ``fold_facet_deltas``
+moves the pending deltas into the cube before it is read; its cost depends
+on what changed since the last fold, never on the size of ``images``.
+
+The triggers exist on SQLite and PostgreSQL; other backends count facets on
+``images`` directly (see ``facets_supported``).
+"""
+
+from sqlalchemy import String, case, delete, event, func, select, text
+from sqlalchemy.engine import Connection
+
+from database import Base, dialect_insert
+from models import (
+    Image as ImageModel,
+    ImageFacetCount as ImageFacetCountModel,
+    ImageFacetDelta as ImageFacetDeltaModel,
+)
+
+# Length of the ``day`` prefix that makes up each date histogram bucket
+DATE_BUCKETS = {"day": 10, "month": 7, "year": 4}
+
+_DAY_SQL = (
+    "CASE WHEN length({row}.exif_datetime) >= 10 THEN "
+    "substr({row}.exif_datetime, 1, 4) || '-' || substr({row}.exif_datetime, 6, 2) || '-' || "
+    "substr({row}.exif_datetime, 9, 2) ELSE '' END"
+)
+
+
+def _delta_sql(row: str, delta: int) -> str:
+    return (
+        "INSERT INTO image_facet_deltas (image_type_id, camera_model, day, delta) VALUES ("
+        f"coalesce({row}.image_type_id, 0), coalesce({row}.exif_camera_model, ''), "
+        f"{_DAY_SQL.format(row=row)}, {delta});"
+    )
+
+
+_FACET_COLUMNS = ("image_type_id", "exif_camera_model", "exif_datetime")
+
+
+def _keys_changed(distinct: str) -> str:
+    return " OR ".join(f"old.{column} {distinct} new.{column}" for column in _FACET_COLUMNS)
+
+
+_SQLITE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS images_facets_insert AFTER INSERT ON images "
+    f"BEGIN {_delta_sql('new', 1)} END",
+    "CREATE TRIGGER IF NOT EXISTS images_facets_update "
+    f"AFTER UPDATE OF {', '.join(_FACET_COLUMNS)} ON images WHEN {_keys_changed('IS NOT')} "
+    f"BEGIN {_delta_sql('old', -1)} {_delta_sql('new', 1)} END",
+    "CREATE TRIGGER IF NOT EXISTS images_facets_delete AFTER DELETE ON images "
+    f"BEGIN {_delta_sql('old', -1)} END",
+]
+
+_POSTGRESQL_DDL = [
+    "CREATE OR REPLACE FUNCTION images_facet_deltas() RETURNS trigger AS $$ BEGIN "
+    f"IF TG_OP <> 'INSERT' THEN {_delta_sql('OLD', -1)} END IF; "
+    f"IF TG_OP <> 'DELETE' THEN {_delta_sql('NEW', 1)} END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS images_facets_insert_delete ON images",
+    "CREATE TRIGGER images_facets_insert_delete AFTER INSERT OR DELETE ON images "
+    "FOR EACH ROW EXECUTE FUNCTION images_facet_deltas()",
+    "DROP TRIGGER IF EXISTS images_facets_update ON images",
+    f"CREATE TRIGGER images_facets_update AFTER UPDATE OF {', '.join(_FACET_COLUMNS)} ON images "
+    f"FOR EACH ROW WHEN ({_keys_changed('IS DISTINCT FROM')}) "
+    "EXECUTE FUNCTION images_facet_deltas()",
+]
+
+
+def facets_supported(dialect_name: str) -> bool:
+    return dialect_name in ("sqlite", "postgresql")
+
+
+def create_facet_triggers(connection: Connection) -> None:
+    """Create the triggers feeding ``image_facet_deltas`` for the connection's backend."""
+    statements = {"sqlite": _SQLITE_DDL, "postgresql": _POSTGRESQL_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_on_new_table(metadata, connection, tables=(), **kw) -> None:
+    if ImageModel.__table__ in tables:
+        create_facet_triggers(connection)
+
+
+def _substr(value, start: int, length: int):
+    return func.substr(value, start, length, type_=String)
+
+
+def facet_keys():
+    """``(image_type_id, camera_model, day)`` of an ``images`` row, as the triggers compute them."""
+    datetime = ImageModel.exif_datetime
+    day = case(
+        (
+            func.length(datetime) >= 10,
+            _substr(datetime, 1, 4) + "-" + _substr(datetime, 6, 2) + "-" + _substr(datetime, 9, 2),
+        ),
+        else_="",
+    )
+    return (
+        func.coalesce(ImageModel.image_type_id, 0),
+        func.coalesce(ImageModel.exif_camera_model, ""),
+        day,
+    )
+
+
+def rebuild_facet_counts(connection: Connection) -> None:
+    """Recount the whole cube from ``images``; only needed when the triggers are first created."""
+    connection.execute(delete(ImageFacetDeltaModel))
+    connection.execute(delete(ImageFacetCountModel))
+    keys = facet_keys()
+    connection.execute(
+        ImageFacetCountModel.__table__.insert().from_select(
+            ["image_type_id", "camera_model", "day", "count"],
+            select(*keys, func.count()).group_by(*keys),
+        )
+    )
+
+
+def fold_facet_deltas(connection: Connection) -> None:
+    """Add the pending deltas to ``image_facet_counts`` and drop empty counters."""
+    deltas = ImageFacetDeltaModel.__table__
+    if connection.execute(select(deltas.c.id).limit(1)).first() is None:
+        return
+    counts = ImageFacetCountModel.__table__
+    if connection.dialect.name == "postgresql":
+        # Concurrent folds each take only the delta rows their DELETE removed.
+        connection.execute(
+            text(
+                "WITH moved AS (DELETE FROM image_facet_deltas "
+                "RETURNING image_type_id, camera_model, day, delta) "
+                "INSERT INTO image_facet_counts (image_type_id, camera_model, day, count) "
+                "SELECT image_type_id, camera_model, day, sum(delta) FROM moved "
+                "GROUP BY image_type_id, camera_model, day "
+                "ORDER BY image_type_id, camera_model, day "
+                "ON CONFLICT (image_type_id, camera_model, day) "
+                "DO UPDATE SET count = image_facet_counts.count + excluded.count"
+            )
+        )
+    else:
+        # SQLite holds the write lock from the INSERT on: no delta can slip in before the DELETE.
+        insert = dialect_insert(connection, counts)
+        keys = (deltas.c.image_type_id, deltas.c.camera_model, deltas.c.day)
+        # SQLite needs a WHERE clause to tell ON CONFLICT apart from a join constraint.
+        pending = (
+            select(*keys, func.sum(deltas.c.delta)).where(deltas.c.id.isnot(None)).group_by(*keys)
+        )
+        statement = insert.from_select(["image_type_id", "camera_model", "day", "count"], pending)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["image_type_id", "camera_model", "day"],
+                set_={"count": counts.c.count + statement.excluded["count"]},
+            )
+        )
+        connection.execute(delete(deltas))
+    connection.execute(delete(counts).where(counts.c.count == 0))
+
+
+def cube_counts(connection: Connection, key, conditions: list, limit: int | None = None) -> list:
+    """``(value, count)`` rows of one facet, summed over the cube rows matching ``conditions``."""
+    total = func.sum(ImageFacetCountModel.count)
+    statement = select(key, total).where(*conditions).group_by(key)
+    if limit is not None:
+        statement = statement.order_by(total.desc(), key).limit(limit)
+    else:
+        statement = statement.order_by(key)
+    return connection.execute(statement).all()
+
+
+def cube_total(connection: Connection, conditions: list) -> int:
+    total = func.coalesce(func.sum(ImageFacetCountModel.count), 0)
+    return connection.scalar(select(total).where(*conditions))
@@ -0,0 +1,159 @@
+"""File fingerprints used to skip EXIF extraction for unchanged images.
+
+A fingerprint records the size and ``mtime_ns`` of a file when its metadata
+was last read. When ``IMAGE_FINGERPRINT_HASH`` is enabled a quick hash of the
+head and tail of the file is stored too, so files that were touched or copied
+without changing content are still recognised as unchanged.
+
+A fingerprint may also point at an image whose ``path`` is another file: that
+is a duplicate linked to the image by a deduplicating import.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Image as ImageModel, ImageFingerprint as ImageFingerprintModel
+
+QUICK_HASH_ENABLED = os.getenv("IMAGE_FINGERPRINT_HASH", "false").lower() in ("1", "true", "yes")
+QUICK_HASH_BLOCK = 64 * 1024
+CONTENT_HASH_BLOCK = 1024 * 1024
+
+
+class FingerprintSnapshot(NamedTuple):
+    path: str
+    image_id: int
+    size: int
+    mtime_ns: int
+    quick_hash: str | None
+    image_path: str
+    image_type_id: int | None
+    content_hash: str | None
+
+
+def quick_hash(path: Path, size: int) -> str:
+    """Hash the first and last blocks of a file together with its size."""
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as handle:
+        digest.update(handle.read(QUICK_HASH_BLOCK))
+        if size > QUICK_HASH_BLOCK:
+            handle.seek(max(size - QUICK_HASH_BLOCK, QUICK_HASH_BLOCK))
+            digest.update(handle.read(QUICK_HASH_BLOCK))
+    return digest.hexdigest()
+
+
+def content_hash(path: Path) -> str:
+    """SHA-256 of the whole file, read in ``CONTENT_HASH_BLOCK`` sized blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while block := handle.read(CONTENT_HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_unchanged(fingerprint, path: Path, stat: os.stat_result) -> bool:
+    """Tell whether ``path`` still matches the stored fingerprint.
+
+    The common case costs only the ``stat()`` the caller already did; the quick
+    hash is computed only when size or mtime moved and hashing is enabled.
+    """
+    if fingerprint is None:
+        return False
+    if fingerprint.size == stat.st_size and fingerprint.mtime_ns == stat.st_mtime_ns:
+        return True
+    if not QUICK_HASH_ENABLED or fingerprint.quick_hash is None or fingerprint.size != stat.st_size:
+        return False
+    return quick_hash(path, stat.st_size) == fingerprint.quick_hash
+
+
+def load_fingerprints(db: Session, root: Path) -> dict[str, FingerprintSnapshot]:
+    """Preload every fingerprint stored below ``root`` with a single query.
+
+    Plain tuples are returned instead of ORM instances so that commits issued
+    while importing do not expire them and trigger one reload per file.
+    """
+    prefix = str(root.resolve())
+    rows = db.execute(
+        select(
+            ImageFingerprintModel.path,
+            ImageFingerprintModel.image_id,
+            ImageFingerprintModel.size,
+            ImageFingerprintModel.mtime_ns,
+            ImageFingerprintModel.quick_hash,
+            ImageModel.path,
+            ImageModel.image_type_id,
+            ImageModel.content_hash,
+        )
+        .join(ImageModel, ImageModel.id == ImageFingerprintModel.image_id)
+        .where(ImageFingerprintModel.path.startswith(prefix, autoescape=True))
+    )
+    return {row[0]: FingerprintSnapshot(*row) for row in rows}
+
+
+def touch_fingerprints(db: Session, mtimes: dict[str, int]) -> None:
+    """Store new mtimes for files whose quick hash proved them unchanged."""
+    for path, mtime_ns in mtimes.items():
+        db.execute(
+            update(ImageFingerprintModel)
+            .where(ImageFingerprintModel.path == path)
+            .values(mtime_ns=mtime_ns)
+        )
+
+
+def record_fingerprint(
+    db: Session,
+    path: Path,
+    image_id: int,
+    stat: os.stat_result,
+    existing: ImageFingerprintModel | None = None,
+) -> ImageFingerprintModel:
+    """Create or refresh the fingerprint of ``path``; the caller commits."""
+    fingerprint = existing or db.get(ImageFingerprintModel, str(path))
+    if fingerprint is None:
+        fingerprint = ImageFingerprintModel(path=str(path))
+        db.add(fingerprint)
+    fingerprint.image_id = image_id
+    fingerprint.size = stat.st_size
+    fingerprint.mtime_ns = stat.st_mtime_ns
+    fingerprint.quick_hash = quick_hash(path, stat.st_size) if QUICK_HASH_ENABLED else None
+    return fingerprint
+
+
+def upsert_fingerprints(db: Session, rows: list[tuple[Path, int, os.stat_result]]) -> None:
+    """Store the fingerprints of many ``(path, image_id, stat)`` rows in one statement."""
+    if not rows:
+        return
+    values = [
+        {
+            "path": str(path),
+            "image_id": image_id,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "quick_hash": quick_hash(path, stat.st_size) if QUICK_HASH_ENABLED else None,
+        }
+        for path, image_id, stat in rows
+    ]
+    table = ImageFingerprintModel.__table__
+    statement = dialect_insert(db.get_bind(), table)
+    if statement is None:
+        for path, image_id, stat in rows:
+            record_fingerprint(db, path, image_id, stat)
+        return
+    statement = statement.values(values)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.path],
+            set_={
+                "image_id": statement.excluded.image_id,
+                "size": statement.excluded.size,
+                "mtime_ns": statement.excluded.mtime_ns,
+                "quick_hash": statement.excluded.quick_hash,
+                "checked_at": func.now(),
+            },
+        )
+    )
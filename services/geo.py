@@ -0,0 +1,224 @@
+"""Geographic index and area queries on image GPS positions.
+
+``images.exif_gps_lon/exif_gps_lat`` are indexed as points so an area query
+touches only the images that may fall in it:
+
+* SQLite: an R*Tree virtual table ``image_rtree`` over ``(lon, lat)``, kept
+  in sync by triggers on ``images``, so every registration, import or edit
+  that writes a position updates it.
+* PostgreSQL: a GiST expression index on ``point(exif_gps_lon, exif_gps_lat)``.
+
+Other backends fall back to plain comparisons. Coordinates are WGS84 degrees,
+longitude first. An area is a bounding box, a circle (``near`` and
+``radius`` in metres, tested with the haversine distance) or a polygon
+(even-odd rule); the index narrows circles and polygons to their bounding
+box and the exact test runs in SQL on what is left. Areas crossing the
+antimeridian are clipped at it.
+"""
+
+import math
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    Table,
+    case,
+    event,
+    false,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection
+
+from models import Image as ImageModel
+
+EARTH_RADIUS_M = 6_371_008.8
+MAX_POLYGON_VERTICES = 256
+
+image_rtree = Table(
+    "image_rtree",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("min_lon", Float),
+    Column("max_lon", Float),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+)
+
+_HAS_POSITION = "new.exif_gps_lat IS NOT NULL AND new.exif_gps_lon IS NOT NULL"
+_RTREE_ROW = "new.id, new.exif_gps_lon, new.exif_gps_lon, new.exif_gps_lat, new.exif_gps_lat"
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS image_rtree USING rtree("
+    "id, min_lon, max_lon, min_lat, max_lat)",
+    "CREATE TRIGGER IF NOT EXISTS images_rtree_insert AFTER INSERT ON images "
+    f"WHEN {_HAS_POSITION} BEGIN INSERT INTO image_rtree VALUES ({_RTREE_ROW}); END",
+    # A position may be cleared as well as moved: drop the entry, then re-add it.
+    "CREATE TRIGGER IF NOT EXISTS images_rtree_update "
+    "AFTER UPDATE OF id, exif_gps_lat, exif_gps_lon ON images "
+    "BEGIN DELETE FROM image_rtree WHERE id = old.id; "
+    f"INSERT INTO image_rtree SELECT {_RTREE_ROW} WHERE {_HAS_POSITION}; END",
+    "CREATE TRIGGER IF NOT EXISTS images_rtree_delete AFTER DELETE ON images "
+    "BEGIN DELETE FROM image_rtree WHERE id = old.id; END",
+]
+
+_POSTGRESQL_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_images_gps ON images "
+    "USING gist (point(exif_gps_lon, exif_gps_lat))",
+]
+
+
+def create_geo_index(connection: Connection) -> None:
+    """Create the position index for the connection's backend, if missing."""
+    statements = {"sqlite": _SQLITE_DDL, "postgresql": _POSTGRESQL_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(ImageModel.__table__, "after_create")
+def _create_on_new_table(table, connection, **kw) -> None:
+    create_geo_index(connection)
+
+
+@dataclass(frozen=True)
+class GeoArea:
+    """An area of the globe; ``bbox`` is ``(min_lon, min_lat, max_lon, max_lat)`` and bounds it."""
+
+    bbox: tuple[float, float, float, float]
+    near: tuple[float, float] | None = None
+    radius: float | None = None
+    polygon: tuple[tuple[float, float], ...] | None = None
+
+
+def _coordinates(value: str, name: str) -> list[tuple[float, float]]:
+    try:
+        numbers = [float(part) for part in value.split(",")]
+    except ValueError:
+        numbers = [math.nan]
+    if len(numbers) % 2 or not all(math.isfinite(number) for number in numbers):
+        raise HTTPException(status_code=400, detail=f"{name} must be a list of lon,lat numbers")
+    pairs = list(zip(numbers[0::2], numbers[1::2]))
+    for lon, lat in pairs:
+        if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            raise HTTPException(status_code=400, detail=f"{name} has a coordinate off the globe")
+    return pairs
+
+
+def _circle_bbox(lon: float, lat: float, radius: float) -> tuple[float, float, float, float]:
+    angle = radius / EARTH_RADIUS_M
+    min_lat = lat - math.degrees(angle)
+    max_lat = lat + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90 or math.sin(angle) >= math.cos(math.radians(lat)):
+        # The circle reaches a pole: every longitude is in it.
+        return (-180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0))
+    spread = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    return (max(lon - spread, -180.0), min_lat, min(lon + spread, 180.0), max_lat)
+
+
+def parse_geo_area(
+    bbox: str | None = None,
+    near: str | None = None,
+    radius: float | None = None,
+    polygon: str | None = None,
+) -> GeoArea | None:
+    """Build the area of the ``bbox``, ``near``/``radius`` or ``polygon`` query parameters."""
+    if sum(1 for value in (bbox, near, polygon) if value) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of bbox, near or polygon")
+    if (near is None) != (radius is None):
+        raise HTTPException(status_code=400, detail="near and radius go together")
+    if bbox:
+        corners = _coordinates(bbox, "bbox")
+        if len(corners) != 2:
+            raise HTTPException(
+                status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat"
+            )
+        (min_lon, min_lat), (max_lon, max_lat) = corners
+        if min_lon > max_lon or min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="bbox minimum exceeds its maximum")
+        return GeoArea((min_lon, min_lat, max_lon, max_lat))
+    if near:
+        center = _coordinates(near, "near")
+        if len(center) != 1:
+            raise HTTPException(status_code=400, detail="near must be lon,lat")
+        if not radius > 0:
+            raise HTTPException(status_code=400, detail="radius must be positive")
+        # Beyond half the circumference the circle covers the whole globe.
+        radius = min(radius, math.pi * EARTH_RADIUS_M)
+        return GeoArea(_circle_bbox(*center[0], radius), near=center[0], radius=radius)
+    if polygon:
+        vertices = _coordinates(polygon, "polygon")
+        if len(vertices) > 1 and vertices[0] == vertices[-1]:
+            vertices.pop()
+        if not 3 <= len(vertices) <= MAX_POLYGON_VERTICES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"polygon needs between 3 and {MAX_POLYGON_VERTICES} vertices",
+            )
+        lons = [lon for lon, _ in vertices]
+        lats = [lat for _, lat in vertices]
+        return GeoArea((min(lons), min(lats), max(lons), max(lats)), polygon=tuple(vertices))
+    return None
+
+
+def _haversine_test(near: tuple[float, float], radius: float):
+    """``haversine(position, near) <= sin²(radius / 2R)``, the distance test without asin."""
+    lon, lat = (math.radians(value) for value in near)
+    position_lat = func.radians(ImageModel.exif_gps_lat)
+    sin_dlat = func.sin((position_lat - lat) * 0.5)
+    sin_dlon = func.sin((func.radians(ImageModel.exif_gps_lon) - lon) * 0.5)
+    haversine = sin_dlat * sin_dlat + math.cos(lat) * func.cos(position_lat) * sin_dlon * sin_dlon
+    return haversine <= math.sin(radius / (2 * EARTH_RADIUS_M)) ** 2
+
+
+def _polygon_test(vertices: tuple[tuple[float, float], ...]):
+    """Even-odd test: an odd number of edges crossed by a ray towards -180°."""
+    lon, lat = ImageModel.exif_gps_lon, ImageModel.exif_gps_lat
+    crossings = []
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:] + vertices[:1]):
+        if y1 == y2:
+            continue
+        slope = (x2 - x1) / (y2 - y1)
+        crossed = (lat >= min(y1, y2)) & (lat < max(y1, y2)) & (lon < x1 + (lat - y1) * slope)
+        crossings.append(case((crossed, 1), else_=0))
+    if not crossings:
+        return false()
+    return sum(crossings[1:], crossings[0]) % 2 == 1
+
+
+def within(statement, dialect_name: str, area: GeoArea):
+    """Restrict an images ``statement`` to positions inside ``area``."""
+    min_lon, min_lat, max_lon, max_lat = area.bbox
+    statement = statement.where(
+        ImageModel.exif_gps_lon >= min_lon,
+        ImageModel.exif_gps_lon <= max_lon,
+        ImageModel.exif_gps_lat >= min_lat,
+        ImageModel.exif_gps_lat <= max_lat,
+    )
+    if dialect_name == "sqlite":
+        # R*Tree boxes are rounded outwards to float32: the exact test above stays.
+        rtree = image_rtree.c
+        statement = statement.where(
+            ImageModel.id.in_(
+                select(rtree.id).where(
+                    rtree.min_lon <= max_lon,
+                    rtree.max_lon >= min_lon,
+                    rtree.min_lat <= max_lat,
+                    rtree.max_lat >= min_lat,
+                )
+            )
+        )
+    elif dialect_name == "postgresql":
+        # Same expression as ix_images_gps so the GiST index applies.
+        position = func.point(ImageModel.exif_gps_lon, ImageModel.exif_gps_lat)
+        window = func.box(func.point(min_lon, min_lat), func.point(max_lon, max_lat))
+        statement = statement.where(position.op("<@")(window))
+    if area.radius is not None:
+        statement = statement.where(_haversine_test(area.near, area.radius))
+    elif area.polygon is not None:
+        statement = statement.where(_polygon_test(area.polygon))
+    return statement
@@ -0,0 +1,108 @@
+"""Packed binary storage for annotation polygons.
+
+``Annotation.points`` used to be a JSON list of ``{"x": .., "y": ..}``
+objects. It is now stored as a little-endian blob::
+
+    header  "AP", version, coordinate size (4 or 8), vertex count (uint32)
+    bbox    min_x, min_y, max_x, max_y
+    coords  x0, y0, x1, y1, ...
+
+Coordinates are float32 whenever every value survives the conversion
+exactly (integer and 1/64 pixel positions up to 131072 px, which is what
+the canvas produces) and float64 otherwise, so the API always returns the
+values it was given. The bounding box uses the same precision and can be
+read without decoding the vertices.
+"""
+
+import struct
+import sys
+from array import array
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+MAGIC = b"AP"
+VERSION = 1
+_HEADER = struct.Struct("<2sBBI")
+_BBOX = {4: struct.Struct("<4f"), 8: struct.Struct("<4d")}
+_TYPECODE = {4: "f", 8: "d"}
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _coordinates(points) -> list[float]:
+    coords = []
+    for point in points:
+        coords.append(float(point["x"]))
+        coords.append(float(point["y"]))
+    return coords
+
+
+def _bbox(coords: list[float]) -> tuple[float, float, float, float]:
+    if not coords:
+        return (0.0, 0.0, 0.0, 0.0)
+    xs, ys = coords[0::2], coords[1::2]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def points_bbox(points) -> tuple[float, float, float, float]:
+    """``(min_x, min_y, max_x, max_y)`` of a list of ``{"x", "y"}`` mappings."""
+    return _bbox(_coordinates(points))
+
+
+def encode_points(points) -> bytes:
+    """Pack a list of ``{"x", "y"}`` mappings."""
+    coords = _coordinates(points)
+    packed = array("f", coords)
+    size = 4
+    if packed.tolist() != coords:
+        packed = array("d", coords)
+        size = 8
+    if _BIG_ENDIAN:
+        packed.byteswap()
+    return (
+        _HEADER.pack(MAGIC, VERSION, size, len(coords) // 2)
+        + _BBOX[size].pack(*_bbox(coords))
+        + packed.tobytes()
+    )
+
+
+def _parse_header(blob: bytes) -> tuple[int, int]:
+    magic, version, size, count = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or size not in _BBOX:
+        raise ValueError("Not a packed annotation geometry")
+    return size, count
+
+
+def decode_points(blob: bytes) -> list[dict]:
+    """Inverse of ``encode_points``."""
+    size, count = _parse_header(blob)
+    start = _HEADER.size + _BBOX[size].size
+    coords = array(_TYPECODE[size])
+    coords.frombytes(blob[start:start + count * 2 * size])
+    if _BIG_ENDIAN:
+        coords.byteswap()
+    values = iter(coords.tolist())
+    return [{"x": x, "y": y} for x, y in zip(values, values)]
+
+
+def geometry_bbox(blob: bytes) -> tuple[float, float, float, float]:
+    """``(min_x, min_y, max_x, max_y)`` of a packed geometry, without decoding it."""
+    size, _ = _parse_header(blob)
+    return _BBOX[size].unpack_from(blob, _HEADER.size)
+
+
+def vertex_count(blob: bytes) -> int:
+    return _parse_header(blob)[1]
+
+
+class PackedPoints(TypeDecorator):
+    """Column type exposing a packed geometry blob as a list of point dicts."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else encode_points(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode_points(value)
@@ -0,0 +1,244 @@
+"""In-process queue running directory imports as resumable background jobs.
+
+Jobs are rows of ``import_jobs``: the worker thread stores the counters and
+the last committed path after every chunk, so a restart re-enqueues
+unfinished jobs and resumes them after their checkpoint instead of reading
+EXIF for the whole tree again.
+"""
+
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable
+
+from sqlalchemy.orm import Session
+
+from models import ImportJob as ImportJobModel
+from services.importer import import_directory, new_summary, walk_directory
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _summary_from_job(job: ImportJobModel) -> dict:
+    summary = new_summary()
+    summary.update(
+        created=job.created,
+        updated=job.updated,
+        skipped=job.skipped,
+        cache_hits=job.cache_hits,
+        cache_misses=job.cache_misses,
+        linked=job.linked,
+        errors=list(job.errors or []),
+        files_seen=job.files_seen,
+        checkpoint=job.checkpoint_path,
+    )
+    return summary
+
+
+def _store_summary(job: ImportJobModel, summary: dict) -> None:
+    job.created = summary["created"]
+    job.updated = summary["updated"]
+    job.skipped = summary["skipped"]
+    job.cache_hits = summary["cache_hits"]
+    job.cache_misses = summary["cache_misses"]
+    job.linked = summary["linked"]
+    job.errors = list(summary["errors"])
+    job.files_seen = summary["files_seen"]
+    job.checkpoint_path = summary["checkpoint"]
+
+
+def describe_job(job: ImportJobModel) -> dict:
+    """Serialise a job together with its throughput and ETA."""
+    processed = job.created + job.updated + job.skipped + job.linked + len(job.errors or [])
+    started_at = _as_utc(job.started_at)
+    finished_at = _as_utc(job.finished_at)
+    rate = None
+    eta = None
+    if started_at is not None:
+        elapsed = ((finished_at or _utcnow()) - started_at).total_seconds()
+        if elapsed > 0 and processed:
+            rate = processed / elapsed
+            if job.status in ACTIVE_STATUSES and job.files_total is not None:
+                eta = max(job.files_total - processed, 0) / rate
+    return {
+        "id": job.id,
+        "directory": job.directory,
+        "image_type_id": job.image_type_id,
+        "recursive": job.recursive,
+        "dedup": job.dedup,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "files_total": job.files_total,
+        "files_seen": job.files_seen,
+        "files_processed": processed,
+        "created": job.created,
+        "updated": job.updated,
+        "skipped": job.skipped,
+        "cache_hits": job.cache_hits,
+        "cache_misses": job.cache_misses,
+        "linked": job.linked,
+        "errors": job.errors or [],
+        "checkpoint_path": job.checkpoint_path,
+        "error_message": job.error_message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "files_per_second": rate,
+        "eta_seconds": eta,
+    }
+
+
+class ImportJobRunner:
+    """Single worker thread consuming import jobs one at a time."""
+
+    def __init__(self, session_factory: Callable[[], Session], extensions: Iterable[str]):
+        self.session_factory = session_factory
+        self.extensions = set(extensions)
+        self._queue: queue.Queue[int | None] = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        db = self.session_factory()
+        try:
+            pending = (
+                db.query(ImportJobModel.id)
+                .filter(ImportJobModel.status.in_(ACTIVE_STATUSES))
+                .order_by(ImportJobModel.id.asc())
+                .all()
+            )
+        finally:
+            db.close()
+        for (job_id,) in pending:
+            self._queue.put(job_id)
+        if pending:
+            logger.info("Resuming %d unfinished import job(s)", len(pending))
+        self._thread = threading.Thread(target=self._run, name="import-jobs", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(
+        self,
+        db: Session,
+        directory: Path,
+        image_type_id: int,
+        recursive: bool,
+        dedup: bool = False,
+    ) -> ImportJobModel:
+        job = ImportJobModel(
+            directory=str(directory),
+            image_type_id=image_type_id,
+            recursive=recursive,
+            dedup=dedup,
+            status="queued",
+            errors=[],
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._queue.put(job.id)
+        return job
+
+    def cancel(self, db: Session, job: ImportJobModel) -> ImportJobModel:
+        if job.status == "queued" and job.started_at is None:
+            job.status = "cancelled"
+            job.finished_at = _utcnow()
+        elif job.status in ACTIVE_STATUSES:
+            job.cancel_requested = True
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                break
+            try:
+                self._process(job_id)
+            except Exception:
+                logger.exception("Import job %s crashed", job_id)
+
+    def _process(self, job_id: int) -> None:
+        db = self.session_factory()
+        try:
+            job = db.get(ImportJobModel, job_id)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return
+            if job.cancel_requested:
+                job.status = "cancelled"
+                job.finished_at = _utcnow()
+                db.commit()
+                return
+
+            job.status = "running"
+            job.started_at = job.started_at or _utcnow()
+            if job.files_total is None:
+                job.files_total = sum(
+                    1 for _ in walk_directory(Path(job.directory), job.recursive)
+                )
+            db.commit()
+
+            def on_progress(summary: dict) -> bool:
+                _store_summary(job, summary)
+                db.commit()
+                return not job.cancel_requested and not self._stop.is_set()
+
+            summary = import_directory(
+                db,
+                Path(job.directory),
+                job.image_type_id,
+                job.recursive,
+                self.extensions,
+                summary=_summary_from_job(job),
+                on_progress=on_progress,
+                dedup=job.dedup,
+            )
+            _store_summary(job, summary)
+            if job.cancel_requested:
+                job.status = "cancelled"
+                job.finished_at = _utcnow()
+            elif self._stop.is_set():
+                # Interrupted by shutdown: keep the checkpoint and resume on next start.
+                job.status = "queued"
+            else:
+                job.status = "completed"
+                job.finished_at = _utcnow()
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            job = db.get(ImportJobModel, job_id)
+            if job is not None:
+                job.status = "failed"
+                job.error_message = str(exc)
+                job.finished_at = _utcnow()
+                db.commit()
+            raise
+        finally:
+            db.close()
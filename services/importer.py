@@ -0,0 +1,393 @@
+"""Staged bulk import pipeline.
+
+The directory walker feeds a pool of EXIF extraction processes, so Pillow
+decoding and content hashing run on every core, and a batched writer stores
+the results with one transaction per ``IMPORT_BATCH_SIZE`` files. Files whose
+fingerprint is unchanged never leave the walker stage.
+
+Files with the same content as an image already registered are duplicates:
+with ``dedup`` they are linked to that image through their fingerprint,
+otherwise they are reported as errors. Neither gets a row of its own.
+"""
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy.orm import Session
+
+from models import Image as ImageModel
+from services.derivatives import DERIVATIVES_ON_IMPORT, derivative_cache
+from services.exif import read_metadata
+from services.fingerprints import (
+    FingerprintSnapshot,
+    content_hash,
+    is_unchanged,
+    load_fingerprints,
+    touch_fingerprints,
+    upsert_fingerprints,
+)
+from services.pagination import invalidate_counts
+from services.registration import register_images_batch
+
+logger = logging.getLogger(__name__)
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "0")) or os.cpu_count() or 1
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+
+def walk_directory(root: Path, recursive: bool, after: tuple[str, ...] = ()) -> Iterator[Path]:
+    """Yield the files below ``root`` in a stable depth-first, name-sorted order.
+
+    The order matches comparing relative path parts as tuples, so ``after``
+    (the parts of a checkpoint) prunes every file already handled without
+    listing the directories that precede it.
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        remaining: tuple[str, ...] = ()
+        if after:
+            if entry.name < after[0]:
+                continue
+            if entry.name == after[0]:
+                remaining = after[1:]
+                if not remaining:
+                    continue
+            after = ()
+        if entry.is_dir():
+            if recursive and not entry.is_symlink():
+                yield from walk_directory(Path(entry.path), recursive, remaining)
+            continue
+        if not remaining:
+            yield Path(entry.path)
+
+
+def process_file(path: str) -> tuple[str, dict, str | None, str | None]:
+    """Worker entry point: read EXIF, hash the file and, if enabled, pre-render the derivatives."""
+    _, exif_data, error = read_metadata(path)
+    if error is not None:
+        return path, exif_data, error, None
+    try:
+        digest = content_hash(Path(path))
+    except OSError as exc:
+        return path, exif_data, str(exc), None
+    if DERIVATIVES_ON_IMPORT:
+        try:
+            derivative_cache.warm(Path(path))
+        except Exception as exc:
+            # A file Pillow cannot decode is still imported; it is rendered lazily later.
+            logger.warning("Unable to pre-render derivatives of %s: %s", path, exc)
+    return path, exif_data, None, digest
+
+
+def new_walked() -> dict:
+    return {"files_seen": 0, "skipped": 0, "errors": []}
+
+
+@dataclass
+class ImportItem:
+    path: Path
+    stat: os.stat_result
+    cached: FingerprintSnapshot | None = None
+    content_hash: str | None = None
+    # Walker counters of the files since the previous item, this one included
+    walked: dict = field(default_factory=new_walked)
+
+
+def extract_in_pool(
+    items: Iterable[ImportItem], workers: int
+) -> Iterator[tuple[ImportItem, dict, str | None]]:
+    """Read EXIF for the items that need it, keeping results in input order.
+
+    Items with a matching fingerprint pass straight through. Small imports are
+    processed inline: the pool is only spawned once more than ``workers * 2``
+    items are waiting, so a handful of files does not pay the worker start-up
+    cost.
+    """
+    iterator = iter(items)
+    head = []
+    for item in iterator:
+        head.append(item)
+        if len(head) > workers * 2:
+            break
+    if workers <= 1 or len(head) <= workers * 2:
+        for item in _chain(head, iterator):
+            if item.cached is not None:
+                yield item, {}, None
+            else:
+                _, exif_data, error, item.content_hash = process_file(str(item.path))
+                yield item, exif_data, error
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    pending = deque()
+    try:
+        for item in _chain(head, iterator):
+            future = None if item.cached is not None else pool.submit(process_file, str(item.path))
+            pending.append((item, future))
+            if len(pending) >= workers * 4:
+                yield _result(*pending.popleft())
+        while pending:
+            yield _result(*pending.popleft())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _result(item: ImportItem, future) -> tuple[ImportItem, dict, str | None]:
+    if future is None:
+        return item, {}, None
+    _, exif_data, error, item.content_hash = future.result()
+    return item, exif_data, error
+
+
+def _chain(head: list, rest: Iterator) -> Iterator:
+    yield from head
+    yield from rest
+
+
+def new_summary() -> dict:
+    return {
+        "created": 0,
+        "updated": 0,
+        "skipped": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "linked": 0,
+        "errors": [],
+        "files_seen": 0,
+        "checkpoint": None,
+    }
+
+
+class BatchWriter:
+    """Store extracted metadata ``batch_size`` files per transaction.
+
+    ``summary`` is updated only once a chunk is committed, walker counters
+    (``files_seen``, ``skipped``, unreadable files) included, and its
+    ``checkpoint`` is the relative path of the last file handled. A resumed
+    run therefore never counts a file twice.
+    With ``dedup`` duplicates are linked to the image holding their content.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        root: Path,
+        image_type_id: int | None,
+        batch_size: int,
+        summary: dict,
+        dedup: bool = False,
+    ):
+        self.db = db
+        self.root = root
+        self.image_type_id = image_type_id
+        self.batch_size = max(1, batch_size)
+        self.summary = summary
+        self.dedup = dedup
+        self.batch: list[tuple[ImportItem, dict]] = []
+        self.walked = new_walked()
+        self.last_path: Path | None = None
+
+    def count_walked(self, walked: dict) -> None:
+        """Add walker counters, merged into ``summary`` with the next chunk."""
+        self.walked["files_seen"] += walked["files_seen"]
+        self.walked["skipped"] += walked["skipped"]
+        self.walked["errors"] += walked["errors"]
+
+    def add(self, item: ImportItem, exif_data: dict) -> bool:
+        """Queue a file; return True when this call flushed a chunk."""
+        self.count_walked(item.walked)
+        self.last_path = item.path
+        self.batch.append((item, exif_data))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def reject(self, item: ImportItem, error: str) -> None:
+        """Report a file whose metadata could not be read, with the next chunk."""
+        self.count_walked(item.walked)
+        self.walked["errors"].append({"path": str(item.path), "error": error})
+        self.last_path = item.path
+
+    def flush(self) -> None:
+        batch, self.batch = self.batch, []
+        if batch:
+            try:
+                self._write(batch)
+            except Exception as exc:
+                self.db.rollback()
+                if len(batch) == 1:
+                    self._fail(batch[0][0], exc)
+                else:
+                    # Isolate the failing files so the rest of the chunk is still stored.
+                    for entry in batch:
+                        try:
+                            self._write([entry])
+                        except Exception as item_exc:
+                            self.db.rollback()
+                            self._fail(entry[0], item_exc)
+        walked, self.walked = self.walked, new_walked()
+        self.summary["files_seen"] += walked["files_seen"]
+        self.summary["skipped"] += walked["skipped"]
+        self.summary["errors"] += walked["errors"]
+        if self.last_path is not None:
+            self.summary["checkpoint"] = self.root_relative(self.last_path)
+
+    def _fail(self, item: ImportItem, exc: Exception) -> None:
+        self.summary["errors"].append({"path": str(item.path), "error": str(exc)})
+
+    def root_relative(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.name
+
+    def _write(self, batch: list[tuple[ImportItem, dict]]) -> None:
+        db = self.db
+        misses = [(item, exif_data) for item, exif_data in batch if item.cached is None]
+        hits = [item.cached for item, _ in batch if item.cached is not None]
+
+        created = updated = 0
+        duplicates = []
+        if misses:
+            registration = register_images_batch(
+                db,
+                [
+                    (item.path, exif_data, self.image_type_id, item.content_hash)
+                    for item, exif_data in misses
+                ],
+            )
+            created, updated = registration.created, registration.updated
+            fingerprints = []
+            for item, _ in misses:
+                if str(item.path) in registration.duplicates:
+                    duplicates.append((item, registration.duplicates[str(item.path)]))
+                else:
+                    fingerprints.append((item.path, registration.ids[str(item.path)], item.stat))
+            if self.dedup:
+                # The fingerprint links the copy to the image, so later runs skip it
+                fingerprints += [(item.path, image_id, item.stat) for item, image_id in duplicates]
+            upsert_fingerprints(db, fingerprints)
+
+        if hits:
+            retype_ids = [
+                snapshot.image_id
+                for snapshot in hits
+                if self.image_type_id is not None and snapshot.image_type_id != self.image_type_id
+            ]
+            if retype_ids:
+                db.query(ImageModel).filter(ImageModel.id.in_(retype_ids)).update(
+                    {ImageModel.image_type_id: self.image_type_id}, synchronize_session=False
+                )
+            touch_fingerprints(
+                db,
+                {
+                    item.cached.path: item.stat.st_mtime_ns
+                    for item, _ in batch
+                    if item.cached is not None and item.cached.mtime_ns != item.stat.st_mtime_ns
+                },
+            )
+
+        db.commit()
+        invalidate_counts()
+        self.summary["created"] += created
+        self.summary["updated"] += updated + len(hits)
+        self.summary["cache_hits"] += len(hits)
+        self.summary["cache_misses"] += len(misses)
+        if self.dedup:
+            self.summary["linked"] += len(duplicates)
+        else:
+            self.summary["errors"].extend(
+                {"path": str(item.path), "error": f"Duplicate of image {image_id}"}
+                for item, image_id in duplicates
+            )
+
+
+def import_directory(
+    db: Session,
+    target_dir: Path,
+    image_type_id: int,
+    recursive: bool,
+    extensions: Iterable[str],
+    *,
+    workers: int | None = None,
+    batch_size: int | None = None,
+    summary: dict | None = None,
+    on_progress: Callable[[dict], bool] | None = None,
+    dedup: bool = False,
+) -> dict:
+    """Import every supported file below ``target_dir`` and summarise the run.
+
+    Passing the ``summary`` of an interrupted run resumes after its
+    ``checkpoint``. ``on_progress`` is called after every committed chunk and
+    may return False to stop the import early. ``dedup`` links duplicates
+    instead of reporting them.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    summary = summary if summary is not None else new_summary()
+    checkpoint = summary.get("checkpoint")
+    after = tuple(Path(checkpoint).parts) if checkpoint else ()
+    fingerprints = load_fingerprints(db, target_dir)
+
+    writer = BatchWriter(
+        db, target_dir, image_type_id, batch_size or IMPORT_BATCH_SIZE, summary, dedup
+    )
+    # The walker runs ahead of the writer: its counters travel with the next item.
+    walked = new_walked()
+
+    def candidates() -> Iterator[ImportItem]:
+        nonlocal walked
+        for entry in walk_directory(target_dir, recursive, after):
+            walked["files_seen"] += 1
+            if entry.suffix.lower() not in extensions:
+                walked["skipped"] += 1
+                continue
+            try:
+                resolved = entry.resolve()
+                stat = resolved.stat()
+            except OSError as exc:
+                walked["errors"].append({"path": str(entry), "error": str(exc)})
+                continue
+            snapshot = fingerprints.get(str(resolved))
+            # Rows registered before content hashes are read once more to get one,
+            # and a linked copy takes over the image once its original is gone.
+            if (
+                is_unchanged(snapshot, resolved, stat)
+                and snapshot.content_hash is not None
+                and (snapshot.image_path == str(resolved) or os.path.exists(snapshot.image_path))
+            ):
+                item = ImportItem(resolved, stat, snapshot)
+            else:
+                item = ImportItem(resolved, stat)
+            item.walked, walked = walked, new_walked()
+            yield item
+
+    with closing(extract_in_pool(candidates(), workers or IMPORT_WORKERS)) as results:
+        for item, exif_data, error in results:
+            if error:
+                writer.reject(item, error)
+                continue
+            if writer.add(item, exif_data) and on_progress is not None:
+                if on_progress(summary) is False:
+                    return summary
+    # Files after the last item (unsupported or unreadable) go with the final chunk.
+    writer.count_walked(walked)
+    writer.flush()
+    if DERIVATIVES_ON_IMPORT:
+        # Worker processes write to the cache directly; re-check the budget once.
+        derivative_cache.evict()
+    if on_progress is not None:
+        on_progress(summary)
+    return summary
@@ -0,0 +1,218 @@
+"""Background indexer keeping the ``images`` table in sync with ``IMAGE_DIR``.
+
+The indexer takes a polling snapshot of the watched directory keyed by
+``(mtime_ns, size)`` and only enqueues the files that were added, changed or
+removed since the previous scan, so listing endpoints never touch the
+filesystem.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+from sqlalchemy.orm import Session
+
+from models import Annotation as AnnotationModel, Answer as AnswerModel, Image as ImageModel
+from services.pagination import invalidate_counts
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexEvent:
+    kind: str
+    path: Path
+    detected_at: float
+
+
+class ImageIndexer:
+    """Incrementally register new, changed and deleted files of a directory."""
+
+    def __init__(
+        self,
+        directory: Path,
+        session_factory: Callable[[], Session],
+        register: Callable[[Path, Session], object],
+        extensions: Iterable[str],
+        *,
+        interval: float = 10.0,
+        recursive: bool = False,
+    ):
+        self.directory = directory
+        self.session_factory = session_factory
+        self.register = register
+        self.extensions = {ext.lower() for ext in extensions}
+        self.interval = interval
+        self.recursive = recursive
+
+        self._snapshot: dict[str, tuple[int, int]] = {}
+        self._queue: queue.Queue[IndexEvent] = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.scans = 0
+        self.registered = 0
+        self.removed = 0
+        self.errors = 0
+        self.last_scan_at: float | None = None
+        self.last_scan_duration: float | None = None
+        self.last_lag: float | None = None
+        self.max_lag: float = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="image-indexer", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Image indexer watching %s every %.1fs (recursive=%s)",
+            self.directory,
+            self.interval,
+            self.recursive,
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Image indexer scan failed")
+            self._stop.wait(self.interval)
+
+    def run_once(self) -> None:
+        self.scan()
+        self.drain()
+
+    def _iter_files(self):
+        stack = [self.directory]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        stack.append(Path(entry.path))
+                    continue
+                if not entry.is_file():
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in self.extensions:
+                    continue
+                yield entry
+
+    def scan(self) -> int:
+        """Diff the directory against the last snapshot and enqueue the changes."""
+        started = time.monotonic()
+        detected_at = time.time()
+        current: dict[str, tuple[int, int]] = {}
+        for entry in self._iter_files():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            current[str(Path(entry.path))] = (stat.st_mtime_ns, stat.st_size)
+
+        enqueued = 0
+        for path, signature in current.items():
+            if self._snapshot.get(path) != signature:
+                self._queue.put(IndexEvent("upsert", Path(path), detected_at))
+                enqueued += 1
+        for path in self._snapshot.keys() - current.keys():
+            self._queue.put(IndexEvent("delete", Path(path), detected_at))
+            enqueued += 1
+
+        self._snapshot = current
+        self.scans += 1
+        self.last_scan_at = detected_at
+        self.last_scan_duration = time.monotonic() - started
+        return enqueued
+
+    def drain(self) -> None:
+        """Apply every pending event using a dedicated session."""
+        if self._queue.empty():
+            return
+        db = self.session_factory()
+        try:
+            while not self._stop.is_set():
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if event.kind == "delete":
+                        if self._forget(event.path, db):
+                            self.removed += 1
+                            invalidate_counts()
+                    else:
+                        self.register(event.path, db)
+                        self.registered += 1
+                        invalidate_counts()
+                except Exception:
+                    db.rollback()
+                    self.errors += 1
+                    self._retry(event)
+                    logger.exception("Unable to index %s", event.path)
+                finally:
+                    lag = time.time() - event.detected_at
+                    self.last_lag = lag
+                    self.max_lag = max(self.max_lag, lag)
+                    self._queue.task_done()
+        finally:
+            db.close()
+
+    def _retry(self, event: IndexEvent) -> None:
+        """Make the next scan enqueue a failed event again."""
+        if event.kind == "delete":
+            # No file has this signature: the path is reported as removed once more.
+            self._snapshot[str(event.path)] = (-1, -1)
+        else:
+            self._snapshot.pop(str(event.path), None)
+
+    def _forget(self, path: Path, db: Session) -> bool:
+        """Drop the row of a vanished file unless experts already worked on it."""
+        image = db.query(ImageModel).filter_by(path=str(path.resolve())).first()
+        if not image:
+            return False
+        has_work = (
+            db.query(AnswerModel.id).filter_by(image_id=image.id).first()
+            or db.query(AnnotationModel.id).filter_by(image_id=image.id).first()
+        )
+        if has_work:
+            return False
+        db.delete(image)
+        db.commit()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "directory": str(self.directory),
+            "interval": self.interval,
+            "tracked_files": len(self._snapshot),
+            "queue_depth": self._queue.qsize(),
+            "scans": self.scans,
+            "registered": self.registered,
+            "removed": self.removed,
+            "errors": self.errors,
+            "last_scan_at": self.last_scan_at,
+            "last_scan_duration": self.last_scan_duration,
+            "seconds_since_last_scan": (
+                time.time() - self.last_scan_at if self.last_scan_at is not None else None
+            ),
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+        }
@@ -0,0 +1,143 @@
+"""Keyset pagination over image listings.
+
+Pages are addressed by an opaque cursor holding the sort value and id of the
+last row served, so no page pays an ``OFFSET`` proportional to how deep the
+client has scrolled. Only the ``id`` sort is a bounded primary-key range
+scan; the filename and EXIF sorts (unindexed, with NULLs ordered last)
+still scan and sort the rows past the cursor. Totals come from a short-lived
+count cache instead of a ``COUNT(*)`` per request.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+from models import Image as ImageModel
+
+SORTABLE_COLUMNS = {
+    column.name: column
+    for column in ImageModel.__table__.columns
+    if column.name in ("id", "filename") or column.name.startswith("exif_")
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+COUNT_CACHE_TTL = float(os.getenv("IMAGE_COUNT_TTL", "30"))
+# Area searches add one key per area: past this many keys expired totals are dropped.
+COUNT_CACHE_MAX_KEYS = 1024
+
+_count_cache: dict[tuple, tuple[float, int]] = {}
+_count_lock = threading.Lock()
+
+
+def encode_cursor(value, image_id: int) -> str:
+    raw = json.dumps([value, image_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, image_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(value, (str, int, float, type(None))):
+            raise ValueError(value)
+        return value, int(image_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate_images(query, sort: str = "id", order: str = "asc", limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    """Return ``(rows, next_cursor)`` for one page of an image query.
+
+    Rows are ordered by ``(sort, id)`` with NULL sort values last in both
+    directions; ``next_cursor`` is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = page_query(query, sort, order, limit, cursor).all()
+    return finish_page(rows, sort, limit)
+
+
+def page_query(query, sort: str, order: str, limit: int, cursor: str | None):
+    """Apply the keyset filter, ordering and ``limit + 1`` to a Query or ``select()``."""
+    if sort not in SORTABLE_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    column = getattr(ImageModel, sort)
+    descending = order == "desc"
+
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        after_id = ImageModel.id < last_id if descending else ImageModel.id > last_id
+        if sort == "id":
+            query = query.filter(after_id)
+        elif value is None:
+            query = query.filter(column.is_(None), after_id)
+        else:
+            beyond = column < value if descending else column > value
+            query = query.filter(
+                or_(beyond, and_(column == value, after_id), column.is_(None))
+            )
+
+    if sort == "id":
+        ordering = [ImageModel.id.desc() if descending else ImageModel.id.asc()]
+    else:
+        ordering = [
+            column.is_(None),
+            column.desc() if descending else column.asc(),
+            ImageModel.id.desc() if descending else ImageModel.id.asc(),
+        ]
+    return query.order_by(*ordering).limit(limit + 1)
+
+
+def finish_page(rows: list, sort: str, limit: int):
+    """Trim the look-ahead row of ``page_query`` and build the next cursor."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+    return rows, next_cursor
+
+
+def cached_count(query, key: tuple) -> int:
+    """Count the rows of ``query``, reusing the value for ``IMAGE_COUNT_TTL`` seconds."""
+    total = lookup_count(key)
+    if total is None:
+        total = query.order_by(None).count()
+        store_count(key, total)
+    return total
+
+
+def lookup_count(key: tuple) -> int | None:
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < COUNT_CACHE_TTL:
+            return cached[1]
+    return None
+
+
+def store_count(key: tuple, total: int) -> None:
+    now = time.monotonic()
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX_KEYS:
+            expired = [
+                cached_key
+                for cached_key, (stored, _) in _count_cache.items()
+                if now - stored >= COUNT_CACHE_TTL
+            ]
+            for cached_key in expired:
+                del _count_cache[cached_key]
+            if len(_count_cache) >= COUNT_CACHE_MAX_KEYS:
+                _count_cache.clear()
+        _count_cache[key] = (now, total)
+
+
+def invalidate_counts() -> None:
+    """Drop every cached total; call after any commit that adds, removes or retypes images."""
+    with _count_lock:
+        _count_cache.clear()
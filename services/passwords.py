@@ -0,0 +1,167 @@
+"""Password hashing on a bounded worker pool, plus a per-username login gate.
+
+bcrypt is deliberately slow, and a login burst at shift start used to run it
+on every request thread at once, starving the routes that save answers and
+annotations. Hashes and verifications now go through ``PASSWORD_WORKERS``
+threads (bcrypt releases the GIL while hashing) with at most
+``PASSWORD_QUEUE_MAX`` calls waiting; beyond that callers get a 503 with
+``Retry-After`` instead of piling up. ``LoginRateGate`` additionally caps the
+attempts per username in a sliding window, before any bcrypt work is done.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Sync callers wait in a Starlette threadpool thread (40 by default): workers
+# plus queue stay well below that, so a login storm cannot take every thread.
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", "16"))
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "10"))
+LOGIN_RATE_WINDOW = float(os.getenv("LOGIN_RATE_WINDOW", "60"))
+
+
+class PasswordPool:
+    """Size-limited executor for passlib calls with queueing metrics."""
+
+    def __init__(
+        self,
+        context: CryptContext,
+        workers: int = PASSWORD_WORKERS,
+        queue_max: int = PASSWORD_QUEUE_MAX,
+    ):
+        self.context = context
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="password"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._submit(self.context.verify, plain_password, hashed_password).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        future = self._submit(self.context.verify, plain_password, hashed_password)
+        return await asyncio.wrap_future(future)
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.workers + self.queue_max:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent password checks, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+            self.submitted += 1
+        return self._executor.submit(self._run, time.perf_counter(), fn, *args)
+
+    def _run(self, enqueued_at: float, fn: Callable, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            finished_at = time.perf_counter()
+            wait = started_at - enqueued_at
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self.completed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_run += finished_at - started_at
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self.submitted,
+                "completed": completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": self.total_wait / completed * 1000 if completed else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "avg_run_ms": self.total_run / completed * 1000 if completed else 0.0,
+            }
+
+
+class LoginRateGate:
+    """Sliding-window limit of password attempts per username."""
+
+    def __init__(self, limit: int = LOGIN_RATE_LIMIT, window: float = LOGIN_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._attempts: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.throttled = 0
+
+    def check(self, username: str) -> None:
+        """Record an attempt for ``username`` or raise 429 once the window is full."""
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > self.window:
+                self._sweep(now)
+            attempts = self._attempts.setdefault(username, deque())
+            while attempts and now - attempts[0] >= self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                self.throttled += 1
+                retry_after = max(1, int(self.window - (now - attempts[0])) + 1)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many login attempts, retry later",
+                    headers={"Retry-After": str(retry_after)},
+                )
+            attempts.append(now)
+
+    def _sweep(self, now: float) -> None:
+        """Forget usernames without attempts in the current window."""
+        self._last_sweep = now
+        for username in [
+            name for name, attempts in self._attempts.items()
+            if not attempts or now - attempts[-1] >= self.window
+        ]:
+            del self._attempts[username]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "window": self.window,
+                "tracked_usernames": len(self._attempts),
+                "throttled": self.throttled,
+            }
@@ -0,0 +1,181 @@
+"""In-process cache of authenticated principals.
+
+Every authenticated request used to load its user row and then, to filter
+images, lazily walk ``user.expert_types`` and each expert type's
+``image_types``. A ``Principal`` keeps only what authorization needs (id,
+username, role and the precomputed set of visible image type ids) and is
+cached per username with a TTL and an LRU bound, so the hot path runs no
+query at all.
+
+Entries are dropped as soon as a session commits changes to users, expert
+types or image types (including their association tables), whichever route
+made them. Other processes serving the same database only see such changes
+once ``PRINCIPAL_CACHE_TTL`` expires.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event, false, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from models import (
+    ExpertType as ExpertTypeModel,
+    Image as ImageModel,
+    ImageType as ImageTypeModel,
+    User as UserModel,
+)
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+
+_PENDING_KEY = "principal_invalidations"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Authorization view of a user; ``allowed_image_type_ids`` is None when unrestricted."""
+
+    id: int
+    username: str
+    role: str
+    allowed_image_type_ids: frozenset[int] | None
+
+
+def principal_from_user(user: UserModel) -> Principal:
+    if user.role == "Amministratore":
+        allowed = None
+    else:
+        allowed = frozenset(
+            image_type.id
+            for expert_type in user.expert_types
+            for image_type in expert_type.image_types
+            if image_type.id is not None
+        )
+    return Principal(id=user.id, username=user.username, role=user.role, allowed_image_type_ids=allowed)
+
+
+def _principal_query(username: str):
+    return (
+        select(UserModel)
+        .options(selectinload(UserModel.expert_types).selectinload(ExpertTypeModel.image_types))
+        .filter_by(username=username)
+    )
+
+
+def visible_image_type_ids(user: Principal | None) -> frozenset[int] | None:
+    """Return the image type ids the user may see, or None when unrestricted."""
+    return None if user is None else user.allowed_image_type_ids
+
+
+def filter_images_for_user(query, user: Principal | None):
+    """Limit a SQLAlchemy query to images visible to the given user."""
+    allowed_type_ids = visible_image_type_ids(user)
+    if allowed_type_ids is None:
+        return query
+    if not allowed_type_ids:
+        return query.filter(false())
+    return query.filter(ImageModel.image_type_id.in_(allowed_type_ids))
+
+
+class PrincipalCache:
+    """TTL + LRU map of username to ``Principal``."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Principal | None:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+        return None
+
+    def put(self, principal: Principal) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[principal.username] = (time.monotonic(), principal)
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, usernames=None) -> None:
+        """Drop the given usernames, or every entry when ``usernames`` is None."""
+        with self._lock:
+            if usernames is None:
+                self._entries.clear()
+            else:
+                for username in usernames:
+                    self._entries.pop(username, None)
+
+    def load(self, db: Session, username: str) -> Principal | None:
+        """Return the cached principal of ``username``, querying it on a miss."""
+        principal = self.get(username)
+        if principal is None:
+            user = db.scalar(_principal_query(username))
+            if user is None:
+                return None
+            principal = principal_from_user(user)
+            self.put(principal)
+        return principal
+
+    async def load_async(self, db: AsyncSession, username: str) -> Principal | None:
+        principal = self.get(username)
+        if principal is None:
+            user = await db.scalar(_principal_query(username))
+            if user is None:
+                return None
+            principal = principal_from_user(user)
+            self.put(principal)
+        return principal
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session: Session, _flush_context) -> None:
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, UserModel):
+            pending.add(instance.username)
+        elif isinstance(instance, (ExpertTypeModel, ImageTypeModel)):
+            # A mapping change can affect any expert: forget everybody.
+            pending.add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        principal_cache.invalidate(None if None in pending else pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,204 @@
+"""Batch registration of image rows with a single UPSERT per chunk.
+
+Every import and upload ends here: rows are written with
+``INSERT ... ON CONFLICT (filename) DO UPDATE`` so a chunk costs one lookup
+query and one write statement instead of four round trips per file.
+
+Files are identified by path and then by content hash, never by name alone:
+a copy of an already registered file is reported as a duplicate instead of
+getting a second row (even when it overwrote another registered file in
+place), a file whose content moved to a new path keeps its row, and a
+different file that merely shares a name gets its own row under a name
+suffixed with the start of its hash.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Image as ImageModel
+from services.fingerprints import content_hash as file_content_hash
+
+EXIF_COLUMNS = tuple(
+    column.name for column in ImageModel.__table__.columns if column.name.startswith("exif_")
+)
+# Keeps a multi-row VALUES list well below SQLite's bound parameter limit.
+UPSERT_CHUNK = 500
+
+
+@dataclass
+class BatchRegistration:
+    created: int = 0
+    updated: int = 0
+    ids: dict[str, int] = field(default_factory=dict)
+    # Path -> id of the image that already holds the same content
+    duplicates: dict[str, int] = field(default_factory=dict)
+
+
+def image_with_content(db: Session, digest: str) -> ImageModel | None:
+    """The image registered with ``digest`` whose file is still in place, if any."""
+    image = db.query(ImageModel).filter(ImageModel.content_hash == digest).first()
+    if image is not None and Path(image.path).exists():
+        return image
+    return None
+
+
+def register_images_batch(
+    db: Session,
+    entries: Iterable[tuple[Path, dict, int | None, str | None]],
+) -> BatchRegistration:
+    """Insert or update the rows of many ``(path, exif_data, image_type_id, content_hash)`` tuples.
+
+    Paths must already be resolved. Existing rows are matched by path, then
+    by content hash; files left out of ``ids`` are listed in ``duplicates``.
+    EXIF values that are missing from ``exif_data`` keep their stored value.
+    The caller commits.
+    """
+    result = BatchRegistration()
+    entries = list(entries)
+    for start in range(0, len(entries), UPSERT_CHUNK):
+        _register_chunk(db, entries[start:start + UPSERT_CHUNK], result)
+    return result
+
+
+def _suffixed(name: str, digest: str | None) -> str:
+    path = Path(name)
+    return f"{path.stem}-{(digest or '')[:8]}{path.suffix}"
+
+
+def _file_matches(path: Path, digest: str) -> bool:
+    try:
+        return file_content_hash(path) == digest
+    except OSError:
+        return False
+
+
+def _register_chunk(db: Session, entries: list, result: BatchRegistration) -> None:
+    paths = [str(path) for path, _, _, _ in entries]
+    filenames = [path.name for path, _, _, _ in entries]
+    digests = [digest for _, _, _, digest in entries if digest is not None]
+    existing = db.execute(
+        select(ImageModel.id, ImageModel.filename, ImageModel.path, ImageModel.content_hash).where(
+            or_(
+                ImageModel.path.in_(paths),
+                ImageModel.filename.in_(filenames),
+                ImageModel.content_hash.in_(digests),
+            )
+        )
+    ).all()
+    by_path = {row.path: row for row in existing}
+    by_hash = {row.content_hash: row for row in existing if row.content_hash is not None}
+    by_filename = {row.filename: row for row in existing}
+
+    rows: dict[str, dict] = {}
+    path_by_filename: dict[str, list[str]] = {}
+    first_path_by_hash: dict[str, str] = {}
+    chunk_duplicates: dict[str, str] = {}
+    for path, exif_data, image_type_id, digest in entries:
+        target = by_path.get(str(path))
+        if digest is not None:
+            if digest in first_path_by_hash:
+                chunk_duplicates[str(path)] = first_path_by_hash[digest]
+                continue
+            match = by_hash.get(digest)
+            if target is not None:
+                if match is not None and match.id != target.id:
+                    # Overwritten in place with another image's content, which
+                    # keeps its row: the hash is unique, so link to that image
+                    result.duplicates[str(path)] = match.id
+                    continue
+            elif match is not None:
+                if Path(match.path).exists():
+                    result.duplicates[str(path)] = match.id
+                    continue
+                # Same content, original gone: the file was moved
+                target = match
+        if target is None:
+            clash = by_filename.get(path.name)
+            if clash is not None and (digest is None or clash.content_hash is None):
+                if digest is not None and Path(clash.path).exists():
+                    # Registered before content hashes: compare the files themselves
+                    if _file_matches(Path(clash.path), digest):
+                        result.duplicates[str(path)] = clash.id
+                        continue
+                else:
+                    # Nothing to compare: the name identifies the image, as it always did
+                    target = clash
+
+        if target is not None:
+            filename = target.filename
+        elif digest is not None and (path.name in by_filename or path.name in rows):
+            filename = _suffixed(path.name, digest)
+        else:
+            filename = path.name
+        if target is not None or filename in rows:
+            result.updated += 1
+        else:
+            result.created += 1
+        if digest is not None:
+            first_path_by_hash[digest] = str(path)
+        row = {column: exif_data.get(column) for column in EXIF_COLUMNS}
+        row.update(
+            filename=filename, path=str(path), image_type_id=image_type_id, content_hash=digest
+        )
+        # Later duplicates win, like the former file-by-file loop; PostgreSQL
+        # refuses to update the same row twice within one statement anyway.
+        rows[filename] = row
+        path_by_filename.setdefault(filename, []).append(str(path))
+
+    if rows:
+        table = ImageModel.__table__
+        statement = dialect_insert(db.get_bind(), table)
+        if statement is None:
+            _register_rows_orm(db, list(rows.values()), path_by_filename, result)
+        else:
+            excluded = statement.excluded
+            statement = statement.values(list(rows.values()))
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.filename],
+                set_={
+                    "path": excluded.path,
+                    "image_type_id": func.coalesce(excluded.image_type_id, table.c.image_type_id),
+                    "content_hash": func.coalesce(excluded.content_hash, table.c.content_hash),
+                    **{
+                        column: func.coalesce(excluded[column], table.c[column])
+                        for column in EXIF_COLUMNS
+                    },
+                },
+            ).returning(table.c.id, table.c.filename)
+            for image_id, filename in db.execute(statement):
+                for path in path_by_filename[filename]:
+                    result.ids[path] = image_id
+    for path, first_path in chunk_duplicates.items():
+        result.duplicates[path] = result.ids[first_path]
+
+
+def _register_rows_orm(db, rows, path_by_filename, result) -> None:
+    """Portable fallback for dialects without ``ON CONFLICT``."""
+    existing = {
+        image.filename: image
+        for image in db.query(ImageModel).filter(ImageModel.filename.in_(list(path_by_filename)))
+    }
+    for row in rows:
+        image = existing.get(row["filename"])
+        if image is None:
+            image = ImageModel(**row)
+            db.add(image)
+        else:
+            image.path = row["path"]
+            if row["image_type_id"] is not None:
+                image.image_type_id = row["image_type_id"]
+            if row["content_hash"] is not None:
+                image.content_hash = row["content_hash"]
+            for column in EXIF_COLUMNS:
+                if row[column] is not None:
+                    setattr(image, column, row[column])
+        existing[row["filename"]] = image
+    db.flush()
+    for filename, paths in path_by_filename.items():
+        for path in paths:
+            result.ids[path] = existing[filename].id
@@ -0,0 +1,246 @@
+"""Faceted image search over image type, EXIF columns, annotations and position.
+
+Facets count the matching images by camera model, image type and date
+(``exif_datetime`` by day, month or year). They are disjunctive: each facet
+ignores its own filter, so the other values of that facet stay selectable.
+
+When the only filters are on the cube dimensions (image type, camera model,
+date), totals and facets are read from ``image_facet_counts`` and cost as
+much as the cube is large. Any other filter (an EXIF value or range,
+annotated/unannotated, an area) is counted on the matching ``images`` rows.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import false, func, select
+from sqlalchemy.orm import Session
+from starlette.datastructures import QueryParams
+
+from models import (
+    Annotation as AnnotationModel,
+    Image as ImageModel,
+    ImageFacetCount as ImageFacetCountModel,
+)
+from services.facets import (
+    DATE_BUCKETS,
+    cube_counts,
+    cube_total,
+    facet_keys,
+    facets_supported,
+    fold_facet_deltas,
+)
+from services.geo import GeoArea, within
+from services.pagination import finish_page, page_query
+from services.principals import Principal, filter_images_for_user, visible_image_type_ids
+
+FACET_VALUES_LIMIT = int(os.getenv("IMAGE_FACET_LIMIT", "50"))
+
+EXIF_COLUMNS = {
+    column.name: column
+    for column in ImageModel.__table__.columns
+    if column.name.startswith("exif_")
+}
+# Facet name -> value standing for "missing" in the cube
+FACETS = {"camera_model": "", "image_type": 0, "date": ""}
+
+
+@dataclass
+class ImageSearch:
+    image_type_ids: tuple[int, ...] = ()
+    camera_models: tuple[str, ...] = ()
+    date_from: date | None = None
+    date_to: date | None = None
+    exif_conditions: tuple = ()
+    annotated_by: int | None = None
+    not_annotated_by: int | None = None
+    area: GeoArea | None = None
+    date_interval: str = "month"
+
+    @property
+    def on_cube(self) -> bool:
+        """True when every filter is a cube dimension."""
+        return (
+            not self.exif_conditions
+            and self.annotated_by is None
+            and self.not_annotated_by is None
+            and self.area is None
+        )
+
+
+def _convert(name: str, key: str, value: str):
+    try:
+        return EXIF_COLUMNS[name].type.python_type(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid value for {key}") from None
+
+
+def parse_exif_filters(params: QueryParams) -> tuple[tuple[str, ...], tuple]:
+    """Read ``exif_<column>=value`` (repeatable) and ``exif_<column>_min``/``_max`` parameters.
+
+    Returns the camera models, which the cube can answer, and the
+    conditions on every other column.
+    """
+    camera_models = ()
+    conditions = []
+    for key in params.keys():
+        name, bound = key, None
+        if key.endswith(("_min", "_max")) and key[:-4] in EXIF_COLUMNS:
+            name, bound = key[:-4], key[-3:]
+        if name not in EXIF_COLUMNS:
+            continue
+        column = getattr(ImageModel, name)
+        values = [_convert(name, key, value) for value in params.getlist(key)]
+        if bound == "min":
+            conditions.append(column >= max(values))
+        elif bound == "max":
+            conditions.append(column <= min(values))
+        elif name == "exif_camera_model":
+            camera_models = tuple(values)
+        else:
+            conditions.append(column.in_(values))
+    return camera_models, tuple(conditions)
+
+
+def _date_conditions(day, search: ImageSearch) -> list:
+    conditions = []
+    if search.date_from is not None:
+        conditions.append(day >= search.date_from.isoformat())
+    if search.date_to is not None:
+        conditions.append(day <= search.date_to.isoformat())
+    if conditions:
+        conditions.append(day != "")
+    return conditions
+
+
+def _annotated_by(user_id: int):
+    return (
+        select(AnnotationModel.id)
+        .where(AnnotationModel.image_id == ImageModel.id, AnnotationModel.user_id == user_id)
+        .exists()
+    )
+
+
+def _image_filters(search: ImageSearch) -> tuple[dict[str, list], dict]:
+    """Conditions on ``images`` grouped by the facet they belong to, and the facet keys."""
+    type_key, model_key, day = facet_keys()
+    filters = {
+        "image_type": [],
+        "camera_model": [],
+        "date": _date_conditions(day, search),
+        None: list(search.exif_conditions),
+    }
+    if search.image_type_ids:
+        filters["image_type"].append(ImageModel.image_type_id.in_(search.image_type_ids))
+    if search.camera_models:
+        filters["camera_model"].append(ImageModel.exif_camera_model.in_(search.camera_models))
+    if search.annotated_by is not None:
+        filters[None].append(_annotated_by(search.annotated_by))
+    if search.not_annotated_by is not None:
+        filters[None].append(~_annotated_by(search.not_annotated_by))
+    bucket = func.substr(day, 1, DATE_BUCKETS[search.date_interval])
+    return filters, {"camera_model": model_key, "image_type": type_key, "date": bucket}
+
+
+def _cube_filters(search: ImageSearch, user: Principal | None) -> tuple[dict[str, list], dict]:
+    """The same grouping over ``image_facet_counts``; visibility is a filter of its own."""
+    cube = ImageFacetCountModel
+    allowed_type_ids = visible_image_type_ids(user)
+    filters = {
+        "image_type": [],
+        "camera_model": [],
+        "date": _date_conditions(cube.day, search),
+        None: [],
+    }
+    if allowed_type_ids is not None:
+        filters[None].append(
+            cube.image_type_id.in_(allowed_type_ids) if allowed_type_ids else false()
+        )
+    if search.image_type_ids:
+        filters["image_type"].append(cube.image_type_id.in_(search.image_type_ids))
+    if search.camera_models:
+        filters["camera_model"].append(cube.camera_model.in_(search.camera_models))
+    bucket = func.substr(cube.day, 1, DATE_BUCKETS[search.date_interval])
+    keys = {"camera_model": cube.camera_model, "image_type": cube.image_type_id, "date": bucket}
+    return filters, keys
+
+
+def _except(filters: dict[str, list], facet: str | None = None) -> list:
+    """Every condition but those of ``facet``."""
+    return [
+        condition
+        for name, conditions in filters.items()
+        if name is None or name != facet
+        for condition in conditions
+    ]
+
+
+def _facet_values(rows, missing) -> list[dict]:
+    return [
+        {"value": None if value == missing else value, "count": int(count)} for value, count in rows
+    ]
+
+
+def find_images(
+    db: Session,
+    search: ImageSearch,
+    user: Principal | None,
+    sort: str = "id",
+    order: str = "asc",
+    limit: int = 100,
+    cursor: str | None = None,
+) -> dict:
+    """One page of the images matching ``search``, with their total and facets."""
+    dialect_name = db.get_bind().dialect.name
+    on_cube = search.on_cube and facets_supported(dialect_name)
+    if on_cube:
+        fold_facet_deltas(db.connection())
+        db.commit()
+
+    filters, keys = _image_filters(search)
+
+    def restrict(statement, conditions: list):
+        statement = filter_images_for_user(statement.where(*conditions), user)
+        if search.area is not None:
+            statement = within(statement, dialect_name, search.area)
+        return statement
+
+    rows = db.scalars(
+        page_query(restrict(select(ImageModel), _except(filters)), sort, order, limit, cursor)
+    ).all()
+    items, next_cursor = finish_page(rows, sort, limit)
+
+    facets = {}
+    if on_cube:
+        connection = db.connection()
+        cube_filters, cube_keys = _cube_filters(search, user)
+        total = int(cube_total(connection, _except(cube_filters)))
+        for facet, missing in FACETS.items():
+            rows = cube_counts(
+                connection,
+                cube_keys[facet],
+                _except(cube_filters, facet),
+                None if facet == "date" else FACET_VALUES_LIMIT,
+            )
+            facets[facet] = _facet_values(rows, missing)
+    else:
+        total = db.scalar(restrict(select(func.count()).select_from(ImageModel), _except(filters)))
+        for facet, missing in FACETS.items():
+            key = keys[facet]
+            count = func.count()
+            statement = select(key, count).select_from(ImageModel)
+            statement = restrict(statement, _except(filters, facet)).group_by(key)
+            if facet == "date":
+                statement = statement.order_by(key)
+            else:
+                statement = statement.order_by(count.desc(), key).limit(FACET_VALUES_LIMIT)
+            facets[facet] = _facet_values(db.execute(statement).all(), missing)
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "total": total,
+        "limit": limit,
+        "facets": facets,
+    }
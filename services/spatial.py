@@ -0,0 +1,117 @@
+"""Spatial index on annotation bounding boxes.
+
+``annotations.min_x/min_y/max_x/max_y`` hold the bounding box of each
+polygon (set by ``Annotation._store_bbox``) and are indexed so a window
+query touches only the polygons it may intersect:
+
+* SQLite: an R*Tree virtual table ``annotation_rtree`` over
+  ``(image_id, x, y)``, kept in sync by triggers on ``annotations``. The
+  image id is a degenerate dimension so one lookup is confined to one image.
+* PostgreSQL: a GiST expression index on ``box(point(min_x, min_y),
+  point(max_x, max_y))``, combined with ``ix_annotations_image_user``.
+
+Other backends fall back to plain comparisons on the bounding box columns.
+Matches are by bounding box: a polygon whose box meets the window is
+returned even when its outline does not.
+"""
+
+from fastapi import HTTPException
+from sqlalchemy import Column, Float, Integer, MetaData, Table, event, func, select, text
+from sqlalchemy.engine import Connection
+
+from models import Annotation as AnnotationModel
+
+annotation_rtree = Table(
+    "annotation_rtree",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("min_image", Float),
+    Column("max_image", Float),
+    Column("min_x", Float),
+    Column("max_x", Float),
+    Column("min_y", Float),
+    Column("max_y", Float),
+)
+
+_RTREE_ROW = "new.id, new.image_id, new.image_id, new.min_x, new.max_x, new.min_y, new.max_y"
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS annotation_rtree USING rtree("
+    "id, min_image, max_image, min_x, max_x, min_y, max_y)",
+    "CREATE TRIGGER IF NOT EXISTS annotations_rtree_insert AFTER INSERT ON annotations "
+    f"WHEN new.min_x IS NOT NULL BEGIN INSERT INTO annotation_rtree VALUES ({_RTREE_ROW}); END",
+    "CREATE TRIGGER IF NOT EXISTS annotations_rtree_update "
+    "AFTER UPDATE OF image_id, min_x, min_y, max_x, max_y ON annotations "
+    "WHEN new.min_x IS NOT NULL "
+    f"BEGIN INSERT OR REPLACE INTO annotation_rtree VALUES ({_RTREE_ROW}); END",
+    "CREATE TRIGGER IF NOT EXISTS annotations_rtree_delete AFTER DELETE ON annotations "
+    "BEGIN DELETE FROM annotation_rtree WHERE id = old.id; END",
+]
+
+_POSTGRESQL_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_annotations_bbox ON annotations "
+    "USING gist (box(point(min_x, min_y), point(max_x, max_y)))",
+]
+
+
+def create_spatial_index(connection: Connection) -> None:
+    """Create the bounding box index for the connection's backend, if missing."""
+    statements = {"sqlite": _SQLITE_DDL, "postgresql": _POSTGRESQL_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(AnnotationModel.__table__, "after_create")
+def _create_on_new_table(table, connection, **kw) -> None:
+    create_spatial_index(connection)
+
+
+def parse_bbox(value: str) -> tuple[float, float, float, float]:
+    """Parse ``"min_x,min_y,max_x,max_y"`` or raise 400."""
+    try:
+        min_x, min_y, max_x, max_y = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="bbox must be min_x,min_y,max_x,max_y"
+        ) from None
+    if min_x > max_x or min_y > max_y:
+        raise HTTPException(status_code=400, detail="bbox minimum exceeds its maximum")
+    return min_x, min_y, max_x, max_y
+
+
+def intersecting(
+    statement, dialect_name: str, image_id: int, window: tuple[float, float, float, float]
+):
+    """Restrict an annotations ``statement`` to boxes meeting ``window`` on ``image_id``."""
+    min_x, min_y, max_x, max_y = window
+    statement = statement.where(
+        AnnotationModel.image_id == image_id,
+        AnnotationModel.min_x <= max_x,
+        AnnotationModel.max_x >= min_x,
+        AnnotationModel.min_y <= max_y,
+        AnnotationModel.max_y >= min_y,
+    )
+    if dialect_name == "sqlite":
+        # R*Tree boxes are rounded outwards to float32: the exact test above stays.
+        rtree = annotation_rtree.c
+        statement = statement.where(
+            AnnotationModel.id.in_(
+                select(rtree.id).where(
+                    rtree.min_image <= image_id,
+                    rtree.max_image >= image_id,
+                    rtree.min_x <= max_x,
+                    rtree.max_x >= min_x,
+                    rtree.min_y <= max_y,
+                    rtree.max_y >= min_y,
+                )
+            )
+        )
+    elif dialect_name == "postgresql":
+        # Same expression as ix_annotations_bbox so the GiST index applies.
+        box = func.box(
+            func.point(AnnotationModel.min_x, AnnotationModel.min_y),
+            func.point(AnnotationModel.max_x, AnnotationModel.max_y),
+        )
+        window_box = func.box(func.point(min_x, min_y), func.point(max_x, max_y))
+        statement = statement.where(box.op("&&")(window_box))
+    return statement
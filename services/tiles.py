@@ -0,0 +1,223 @@
+"""Deep-zoom tiles cut lazily from very large source images.
+
+Levels follow the Deep Zoom convention: the top level is the full-resolution
+image and every level below halves it, down to a single pixel at level 0.
+A tile is produced from the smallest source that still has enough
+resolution:
+
+* a lower page of a pyramidal (multi-page) TIFF when one exists;
+* a windowed read of the rows or TIFF tiles it covers when the data is
+  stored uncompressed, so full-resolution tiles never decode the whole
+  orthomosaic;
+* otherwise a decoded (and, for JPEG, DCT-downscaled) copy of the source,
+  kept in a small in-memory LRU so neighbouring tiles reuse one decode.
+
+Rendered tiles go through the derivative cache and are served with ETags.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import PIL
+from PIL import Image as PILImage
+
+from services.derivatives import derivative_cache, open_large_image
+
+TILE_SIZE = int(os.getenv("TILE_SIZE", "256"))
+TILE_QUALITY = 85
+TILE_DECODE_CACHE_MPX = int(os.getenv("TILE_DECODE_CACHE_MPX", "256"))
+DEEP_ZOOM_MIN_PIXELS = int(os.getenv("DEEP_ZOOM_MIN_PIXELS", "60000000"))
+
+# Windowed reads rewrite Pillow internals (``tile``, ``_size``) of an unloaded
+# image; they are used only on the releases they were checked against.
+_WINDOWED_READS = PIL.__version__.split(".")[0] == "10"
+
+# Bytes per pixel of the uncompressed layouts that can be read by window.
+_RAW_BYTES_PER_PIXEL = {"L": 1, "P": 1, "RGB": 3, "RGBA": 4, "RGBX": 4, "CMYK": 4}
+
+_decoded: OrderedDict[tuple, PILImage.Image] = OrderedDict()
+_decoded_pixels = 0
+_decoded_lock = threading.Lock()
+
+
+def tile_info(path: Path) -> dict:
+    """Describe the tile pyramid of ``path``."""
+    with open_large_image(path) as img:
+        width, height = img.size
+    return {
+        "width": width,
+        "height": height,
+        "tile_size": TILE_SIZE,
+        "max_level": max_level(width, height),
+        "format": "jpeg",
+    }
+
+
+def deep_zoom_info(path: Path) -> dict | None:
+    """Return ``tile_info`` when ``path`` is big enough to be viewed as tiles.
+
+    Rotated images (EXIF orientation other than 1) keep the preview view:
+    tiles are cut in stored pixel order and would not match oriented points.
+    """
+    with open_large_image(path) as img:
+        width, height = img.size
+        if width * height < DEEP_ZOOM_MIN_PIXELS or img.getexif().get(0x0112, 1) != 1:
+            return None
+    return tile_info(path)
+
+
+def max_level(width: int, height: int) -> int:
+    return max(0, math.ceil(math.log2(max(width, height, 1))))
+
+
+def level_size(width: int, height: int, level: int) -> tuple[int, int]:
+    factor = 2 ** (max_level(width, height) - level)
+    return max(1, math.ceil(width / factor)), max(1, math.ceil(height / factor))
+
+
+def get_tile(path: Path, level: int, column: int, row: int) -> tuple[Path, str]:
+    """Return ``(cached_file, etag_key)`` of one tile, cutting it on first request."""
+    with open_large_image(path) as img:
+        width, height = img.size
+    top = max_level(width, height)
+    if not 0 <= level <= top:
+        raise IndexError("level out of range")
+    level_width, level_height = level_size(width, height, level)
+    if not (0 <= column * TILE_SIZE < level_width and 0 <= row * TILE_SIZE < level_height):
+        raise IndexError("tile out of range")
+
+    factor = 2 ** (top - level)
+    left, upper = column * TILE_SIZE, row * TILE_SIZE
+    right = min(left + TILE_SIZE, level_width)
+    lower = min(upper + TILE_SIZE, level_height)
+    box = (
+        left * factor,
+        upper * factor,
+        min(right * factor, width),
+        min(lower * factor, height),
+    )
+    out_size = (right - left, lower - upper)
+    variant = f"tile-{TILE_SIZE}-{level}-{column}-{row}"
+    return derivative_cache.fetch(
+        path, variant, lambda: read_region(path, box, out_size), TILE_QUALITY
+    )
+
+
+def read_region(path: Path, box: tuple[int, int, int, int], size: tuple[int, int]) -> PILImage.Image:
+    """Read the full-resolution ``box`` of ``path`` scaled down to ``size``."""
+    with open_large_image(path) as img:
+        full_width = img.size[0]
+        page = _pick_page(img, (box[2] - box[0]) / size[0])
+        if page:
+            img.seek(page)
+        scale = img.size[0] / full_width
+        if img.format == "JPEG":
+            target = max(1, math.ceil(full_width * size[0] / (box[2] - box[0])))
+            img.draft("RGB", (target, math.ceil(img.size[1] * target / img.size[0])))
+            scale = img.size[0] / full_width
+        local = (
+            int(box[0] * scale),
+            int(box[1] * scale),
+            max(int(box[0] * scale) + 1, math.ceil(box[2] * scale)),
+            max(int(box[1] * scale) + 1, math.ceil(box[3] * scale)),
+        )
+        region = _read_window(img, local)
+        if region is None:
+            region = _decode(path, page, img).crop(local)
+    if region.mode not in ("RGB", "L"):
+        region = region.convert("RGB")
+    if region.size != size:
+        region = region.resize(size, PILImage.Resampling.LANCZOS)
+    return region
+
+
+def _pick_page(img: PILImage.Image, downscale: float) -> int:
+    """Choose the smallest pyramid page whose resolution is still sufficient."""
+    frames = getattr(img, "n_frames", 1)
+    if img.format != "TIFF" or frames < 2 or downscale <= 1:
+        return 0
+    full_width = img.size[0]
+    best = 0
+    for page in range(1, frames):
+        img.seek(page)
+        ratio = full_width / img.size[0]
+        if ratio <= downscale:
+            best = page
+    img.seek(0)
+    return best
+
+
+def _read_window(img: PILImage.Image, box: tuple[int, int, int, int]) -> PILImage.Image | None:
+    """Decode only the uncompressed strips or tiles intersecting ``box``.
+
+    Rewrites the pending tile list of a not-yet-loaded image so Pillow reads
+    the bytes of the window and nothing else; returns None for layouts where
+    that is not possible (compressed data, bottom-up rows, exotic modes) or
+    on Pillow releases other than the one this relies on.
+    """
+    tiles = img.tile
+    if not _WINDOWED_READS or not tiles or any(tile[0] != "raw" for tile in tiles):
+        return None
+    if len(tiles) == 1:
+        codec, extents, offset, args = tiles[0]
+        rawmode = args[0] if isinstance(args, tuple) else args
+        stride = args[1] if isinstance(args, tuple) and len(args) > 1 else 0
+        orientation = args[2] if isinstance(args, tuple) and len(args) > 2 else 1
+        if (
+            orientation != 1
+            or tuple(extents) != (0, 0, *img.size)
+            or rawmode not in _RAW_BYTES_PER_PIXEL
+        ):
+            return None
+        row_bytes = stride or img.size[0] * _RAW_BYTES_PER_PIXEL[rawmode]
+        rows = box[3] - box[1]
+        img.tile = [(codec, (0, 0, img.size[0], rows), offset + box[1] * row_bytes, args)]
+        img._size = (img.size[0], rows)
+        img.load()
+        return img.crop((box[0], 0, box[2], rows))
+
+    selected = [
+        tile
+        for tile in tiles
+        if tile[1][0] < box[2] and tile[1][2] > box[0] and tile[1][1] < box[3] and tile[1][3] > box[1]
+    ]
+    if not selected:
+        return None
+    left = min(tile[1][0] for tile in selected)
+    upper = min(tile[1][1] for tile in selected)
+    right = max(tile[1][2] for tile in selected)
+    lower = max(tile[1][3] for tile in selected)
+    img.tile = [
+        (codec, (e[0] - left, e[1] - upper, e[2] - left, e[3] - upper), offset, args)
+        for codec, e, offset, args in selected
+    ]
+    img._size = (right - left, lower - upper)
+    img.load()
+    return img.crop((box[0] - left, box[1] - upper, box[2] - left, box[3] - upper))
+
+
+def _decode(path: Path, page: int, img: PILImage.Image) -> PILImage.Image:
+    """Fully decode ``img``, sharing the result with the next tiles of the same level."""
+    global _decoded_pixels
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, page, img.size)
+    with _decoded_lock:
+        cached = _decoded.get(key)
+        if cached is not None:
+            _decoded.move_to_end(key)
+            return cached
+    img.load()
+    decoded = img.copy()
+    pixels = decoded.size[0] * decoded.size[1]
+    budget = TILE_DECODE_CACHE_MPX * 1_000_000
+    if pixels <= budget:
+        with _decoded_lock:
+            _decoded[key] = decoded
+            _decoded_pixels += pixels
+            while _decoded_pixels > budget and _decoded:
+                _, evicted = _decoded.popitem(last=False)
+                _decoded_pixels -= evicted.size[0] * evicted.size[1]
+    return decoded
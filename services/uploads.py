@@ -0,0 +1,471 @@
+"""Streaming and resumable image uploads.
+
+Request bodies are written straight from the ASGI stream to a part file in
+``IMAGE_DIR/.uploads`` and hashed (SHA-256) in the same pass, then renamed
+into ``IMAGE_DIR`` atomically: nothing is spooled to a temporary file first
+and a half written image never appears under its final name.
+
+* ``receive_multipart`` parses a ``multipart/form-data`` body chunk by chunk
+  for ``POST /images/upload`` and the UI form.
+* ``/images/uploads`` implements the tus 1.0 core protocol with the creation
+  and termination extensions. The client creates an upload, ``PATCH``es bytes
+  at ``Upload-Offset`` and after a dropped connection asks the offset with
+  ``HEAD`` and carries on from there. The part file is the source of truth
+  for the offset, so uploads also resume across restarts. Once the last byte
+  arrives the file is published and ``UploadRunner`` registers it (EXIF
+  included) in a background thread.
+
+Content that is already registered is not stored twice: the part file is
+dropped and the upload points at the existing image.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+import multipart
+from fastapi import HTTPException, Request
+from multipart.multipart import parse_options_header
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from models import Upload as UploadModel
+from services.pagination import invalidate_counts
+from services.registration import image_with_content
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,termination"
+STAGING_DIRNAME = ".uploads"
+HASH_BLOCK = 1024 * 1024
+MAX_FIELD_SIZE = 64 * 1024
+
+# Hash state of uploads being received, keyed by id: (bytes hashed, sha256)
+_hashers: dict[str, tuple[int, object]] = {}
+_active: set[str] = set()
+_lock = threading.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def staging_dir(root: Path) -> Path:
+    directory = root / STAGING_DIRNAME
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def part_path(root: Path, upload_id: str) -> Path:
+    return staging_dir(root) / f"{upload_id}.part"
+
+
+def safe_filename(filename: str | None) -> str:
+    """Strip directories from a client supplied name or raise 400."""
+    name = Path((filename or "").replace("\\", "/")).name
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    return name
+
+
+def repr_digest(content_hash: str) -> str:
+    """``Repr-Digest`` header value (RFC 9530) of a hex SHA-256."""
+    return "sha-256=:" + base64.b64encode(bytes.fromhex(content_hash)).decode() + ":"
+
+
+class StagedFile:
+    """Part file written and hashed in a single pass."""
+
+    def __init__(self, path: Path, hasher=None, append: bool = False):
+        self.path = path
+        self.hasher = hasher or hashlib.sha256()
+        self._handle = open(path, "ab" if append else "wb")
+        self.size = self._handle.tell()
+
+    def write(self, chunks: list) -> None:
+        for chunk in chunks:
+            self._handle.write(chunk)
+            self.hasher.update(chunk)
+            self.size += len(chunk)
+
+    def close(self, sync: bool = False) -> None:
+        if self._handle.closed:
+            return
+        self._handle.flush()
+        if sync:
+            os.fsync(self._handle.fileno())
+        self._handle.close()
+
+    def discard(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    @property
+    def content_hash(self) -> str:
+        return self.hasher.hexdigest()
+
+    def publish(self, target: Path, replace: bool = False) -> Path:
+        """Move the part file to ``target`` atomically.
+
+        Unless ``replace`` is set an existing ``target`` is left alone and
+        ``FileExistsError`` is raised: the hard link fails instead of racing
+        a separate existence check.
+        """
+        self.close(sync=True)
+        if replace:
+            os.replace(self.path, target)
+            return target
+        try:
+            os.link(self.path, target)
+        except FileExistsError:
+            raise
+        except OSError:
+            # Filesystems without hard links
+            if target.exists():
+                raise FileExistsError(target) from None
+            os.replace(self.path, target)
+            return target
+        self.path.unlink()
+        return target
+
+
+async def receive_multipart(
+    request: Request, root: Path, replace: bool = False
+) -> tuple[dict[str, str], str | None, StagedFile | None]:
+    """Stream a ``multipart/form-data`` body to a part file.
+
+    Returns the plain form fields, the sanitised name of the ``file`` part and
+    its staged file (``None`` when the form has no file). Unless ``replace``
+    is set, an upload whose target already exists is refused as soon as the
+    part headers arrive, before any byte is written.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    fields: dict[str, str] = {}
+    state = {"headers": {}, "header": b"", "value": b"", "name": None, "file": False, "data": bytearray()}
+    filename = None
+    staged = None
+    pending: list = []
+
+    def on_part_begin():
+        state.update(headers={}, name=None, file=False, data=bytearray())
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header"].lower()] = state["value"]
+        state.update(header=b"", value=b"")
+
+    def on_headers_finished():
+        nonlocal filename, staged
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["name"] = options.get(b"name", b"").decode()
+        if b"filename" not in options:
+            return
+        if state["name"] != "file" or staged is not None:
+            raise HTTPException(status_code=400, detail="Expected a single file field named 'file'")
+        state["file"] = True
+        filename = safe_filename(options[b"filename"].decode())
+        if not replace and (root / filename).exists():
+            raise HTTPException(status_code=400, detail="File already exists")
+        staged = StagedFile(part_path(root, uuid.uuid4().hex))
+
+    def on_part_data(data, start, end):
+        if state["file"]:
+            # The chunk stays alive until written: keep a view instead of a copy
+            pending.append(memoryview(data)[start:end])
+            return
+        state["data"] += data[start:end]
+        if len(state["data"]) > MAX_FIELD_SIZE:
+            raise HTTPException(status_code=400, detail="Form field too large")
+
+    def on_part_end():
+        if state["name"] and not state["file"]:
+            fields[state["name"]] = state["data"].decode("utf-8", "replace")
+
+    parser = multipart.MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                await run_in_threadpool(staged.write, pending)
+                pending.clear()
+        parser.finalize()
+    except BaseException:
+        if staged is not None:
+            staged.discard()
+        raise
+    return fields, filename, staged
+
+
+def parse_metadata(header: str | None) -> dict[str, str]:
+    """Decode a tus ``Upload-Metadata`` header (``key base64,key base64``)."""
+    metadata = {}
+    for pair in (header or "").split(","):
+        if not pair.strip():
+            continue
+        key, _, value = pair.strip().partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ""
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for {key}") from None
+    return metadata
+
+
+def create_upload(
+    db: Session, root: Path, filename: str, length: int, image_type_id: int | None
+) -> UploadModel:
+    """Reserve an upload and its empty part file."""
+    if (root / filename).exists():
+        raise HTTPException(status_code=400, detail="File already exists")
+    upload = UploadModel(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        image_type_id=image_type_id,
+        length=length,
+        received=0,
+        status="receiving",
+    )
+    part_path(root, upload.id).touch()
+    db.add(upload)
+    _commit(db, upload)
+    return upload
+
+
+def _commit(db: Session, upload: UploadModel) -> None:
+    """Commit and reload ``upload``, so the async handlers never lazy-load it on the loop."""
+    db.commit()
+    db.refresh(upload)
+
+
+def current_offset(root: Path, upload: UploadModel) -> int:
+    """Bytes received so far; the part file wins over a stale row after a crash."""
+    if upload.status != "receiving":
+        return upload.received
+    try:
+        return min(part_path(root, upload.id).stat().st_size, upload.length)
+    except FileNotFoundError:
+        return upload.received
+
+
+def _resume(root: Path, upload: UploadModel, offset: int):
+    """Check that a ``PATCH`` continues the part file and return its hash state."""
+    path = part_path(root, upload.id)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Upload data no longer available")
+    if offset != current_offset(root, upload):
+        raise HTTPException(status_code=409, detail="Upload-Offset does not match")
+    return _resume_hasher(upload.id, path, offset)
+
+
+def _resume_hasher(upload_id: str, path: Path, offset: int):
+    """Hash state at ``offset``, re-reading the part file when it is not cached."""
+    with _lock:
+        cached = _hashers.get(upload_id)
+    if cached is not None and cached[0] == offset:
+        return cached[1].copy()
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        remaining = offset
+        while remaining:
+            block = handle.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+async def append_upload(
+    db: Session,
+    root: Path,
+    upload: UploadModel,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+) -> UploadModel:
+    """Write one ``PATCH`` body at ``offset`` and publish the file when complete.
+
+    Bytes that arrived before a client disconnect are kept, so the next
+    ``HEAD`` reports them and the client resumes after them.
+    """
+    if upload.status != "receiving":
+        raise HTTPException(status_code=409, detail="Upload already complete")
+    with _lock:
+        if upload.id in _active:
+            raise HTTPException(status_code=409, detail="Upload already in progress")
+        _active.add(upload.id)
+    try:
+        path = part_path(root, upload.id)
+        hasher = await run_in_threadpool(_resume, root, upload, offset)
+        staged = await run_in_threadpool(StagedFile, path, hasher, True)
+        too_large = False
+        try:
+            async for chunk in chunks:
+                if staged.size + len(chunk) > upload.length:
+                    too_large = True
+                    break
+                await run_in_threadpool(staged.write, [chunk])
+        except ClientDisconnect:
+            logger.info("Upload %s interrupted at %d bytes", upload.id, staged.size)
+        finally:
+            await run_in_threadpool(staged.close)
+            with _lock:
+                _hashers[upload.id] = (staged.size, staged.hasher.copy())
+            upload.received = staged.size
+            await run_in_threadpool(_commit, db, upload)
+        if staged.size == upload.length:
+            await run_in_threadpool(_complete, db, root, upload, staged)
+        if too_large:
+            raise HTTPException(status_code=413, detail="Body exceeds Upload-Length")
+        return upload
+    finally:
+        with _lock:
+            _active.discard(upload.id)
+
+
+def _complete(db: Session, root: Path, upload: UploadModel, staged: StagedFile) -> None:
+    with _lock:
+        _hashers.pop(upload.id, None)
+    upload.content_hash = staged.content_hash
+    existing = image_with_content(db, staged.content_hash)
+    if existing is not None:
+        # Already registered: keep the existing file instead of a second copy
+        staged.discard()
+        upload.image_id = existing.id
+        upload.status = "completed"
+        upload.finished_at = _utcnow()
+        _commit(db, upload)
+        return
+    try:
+        staged.publish(root / upload.filename)
+    except FileExistsError:
+        staged.discard()
+        upload.status = "failed"
+        upload.error_message = "File already exists"
+        upload.finished_at = _utcnow()
+    else:
+        upload.status = "processing"
+    _commit(db, upload)
+
+
+def discard_upload(db: Session, root: Path, upload: UploadModel) -> None:
+    """Terminate an unfinished upload and free its part file."""
+    with _lock:
+        if upload.id in _active:
+            raise HTTPException(status_code=409, detail="Upload already in progress")
+        _hashers.pop(upload.id, None)
+    part_path(root, upload.id).unlink(missing_ok=True)
+    db.delete(upload)
+    db.commit()
+
+
+class UploadRunner:
+    """Worker thread registering completed uploads (EXIF extraction included)."""
+
+    def __init__(
+        self,
+        root: Path,
+        session_factory: Callable[[], Session],
+        register: Callable[..., object],
+    ):
+        self.root = root
+        self.session_factory = session_factory
+        self.register = register
+        self._queue: queue.Queue[str | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        db = self.session_factory()
+        try:
+            pending = [
+                upload_id
+                for (upload_id,) in db.query(UploadModel.id)
+                .filter(UploadModel.status == "processing")
+                .order_by(UploadModel.created_at.asc())
+            ]
+        finally:
+            db.close()
+        for upload_id in pending:
+            self._queue.put(upload_id)
+        if pending:
+            logger.info("Registering %d pending upload(s)", len(pending))
+        self._thread = threading.Thread(target=self._run, name="uploads", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def submit(self, upload_id: str) -> None:
+        self._queue.put(upload_id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            upload_id = self._queue.get()
+            if upload_id is None:
+                break
+            try:
+                self._process(upload_id)
+            except Exception:
+                logger.exception("Registration of upload %s failed", upload_id)
+
+    def _process(self, upload_id: str) -> None:
+        db = self.session_factory()
+        try:
+            upload = db.get(UploadModel, upload_id)
+            if upload is None or upload.status != "processing":
+                return
+            try:
+                image = self.register(
+                    self.root / upload.filename,
+                    db,
+                    image_type_id=upload.image_type_id,
+                    content_hash=upload.content_hash,
+                )
+            except Exception as exc:
+                db.rollback()
+                upload = db.get(UploadModel, upload_id)
+                upload.status = "failed"
+                upload.error_message = str(exc)
+            else:
+                upload.image_id = image.id
+                upload.status = "completed"
+                invalidate_counts()
+            upload.finished_at = _utcnow()
+            db.commit()
+        finally:
+            db.close()
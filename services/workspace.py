@@ -0,0 +1,156 @@
+"""Everything the annotation workspace needs about one image, in three queries.
+
+1. the image with its type and the labels linked to that type, plus the
+   previous and next visible image ids as scalar subqueries;
+2. the questions for the image type with their options and the caller's
+   answer, outer-joined in the same statement;
+3. the caller's annotations with their labels.
+
+Images without a type fall back to every question and every label, as the
+workspace always did; that costs one more query for the labels.
+"""
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session, joinedload
+
+from models import (
+    Annotation as AnnotationModel,
+    Answer as AnswerModel,
+    Image as ImageModel,
+    ImageType as ImageTypeModel,
+    Label as LabelModel,
+    Question as QuestionModel,
+)
+from services.principals import Principal, filter_images_for_user
+
+
+def _navigable(statement, principal: Principal, unanswered: bool):
+    """Restrict ``statement`` to images the principal may step through.
+
+    With ``unanswered`` the images already answered by the principal are
+    skipped; the ``NOT EXISTS`` probe is served by the leading
+    ``(image_id, user_id)`` columns of the unique answers index.
+    """
+    statement = filter_images_for_user(statement, principal)
+    if unanswered:
+        statement = statement.where(
+            ~select(AnswerModel.id)
+            .where(AnswerModel.image_id == ImageModel.id, AnswerModel.user_id == principal.id)
+            .exists()
+        )
+    return statement
+
+
+def neighbor_ids(
+    db: Session,
+    image_id: int,
+    principal: Principal,
+    count: int,
+    direction: str = "next",
+    unanswered: bool = False,
+) -> list[int]:
+    """Ids of the next (or previous) ``count`` navigable images, nearest first."""
+    if direction == "next":
+        statement = select(ImageModel.id).where(ImageModel.id > image_id).order_by(ImageModel.id.asc())
+    else:
+        statement = select(ImageModel.id).where(ImageModel.id < image_id).order_by(ImageModel.id.desc())
+    return list(db.scalars(_navigable(statement, principal, unanswered).limit(count)))
+
+
+def load_workspace(
+    db: Session, image_id: int, principal: Principal, unanswered: bool = False
+) -> dict | None:
+    """Return the workspace data of ``image_id``, or None when it is missing or not visible.
+
+    ``prev_id`` and ``next_id`` skip images already answered by the principal
+    when ``unanswered`` is set.
+    """
+    # correlate(None): the neighbours are searched over all images, not the outer row.
+    prev_id = _navigable(
+        select(func.max(ImageModel.id)).where(ImageModel.id < image_id), principal, unanswered
+    ).correlate(None).scalar_subquery()
+    next_id = _navigable(
+        select(func.min(ImageModel.id)).where(ImageModel.id > image_id), principal, unanswered
+    ).correlate(None).scalar_subquery()
+    row = (
+        db.execute(
+            filter_images_for_user(
+                select(ImageModel, prev_id, next_id)
+                .options(joinedload(ImageModel.image_type).joinedload(ImageTypeModel.labels))
+                .where(ImageModel.id == image_id),
+                principal,
+            )
+        )
+        .unique()
+        .first()
+    )
+    if row is None:
+        return None
+    image, prev_id, next_id = row
+
+    questions_query = (
+        select(QuestionModel, AnswerModel.selected_option_id)
+        .outerjoin(
+            AnswerModel,
+            and_(
+                AnswerModel.question_id == QuestionModel.id,
+                AnswerModel.image_id == image_id,
+                AnswerModel.user_id == principal.id,
+            ),
+        )
+        .options(joinedload(QuestionModel.options))
+        .order_by(QuestionModel.id.asc())
+    )
+    if image.image_type_id:
+        questions_query = questions_query.join(QuestionModel.image_types).where(
+            ImageTypeModel.id == image.image_type_id
+        )
+    questions = []
+    answers = {}
+    for index, (question, selected_option_id) in enumerate(
+        db.execute(questions_query).unique().all()
+    ):
+        questions.append(
+            {
+                "id": question.id,
+                "text": question.question_text,
+                "options": [
+                    {"id": option.id, "text": option.option_text}
+                    for option in question.options
+                ],
+                "depends_on_question_id": question.depends_on_question_id,
+                "depends_on_option_id": question.depends_on_option_id,
+                "order": index,
+            }
+        )
+        if selected_option_id is not None:
+            answers[question.id] = selected_option_id
+
+    annotations = [
+        {
+            "id": annotation.id,
+            "label_id": annotation.label_id,
+            "label": annotation.label.name,
+            "points": annotation.points,
+        }
+        for annotation in db.scalars(
+            select(AnnotationModel)
+            .options(joinedload(AnnotationModel.label))
+            .filter_by(image_id=image_id, user_id=principal.id)
+            .order_by(AnnotationModel.id.asc())
+        )
+    ]
+
+    labels = image.image_type.labels if image.image_type else db.scalars(select(LabelModel))
+    return {
+        "image": image,
+        "prev_id": prev_id,
+        "next_id": next_id,
+        "questions": questions,
+        "answers": answers,
+        "annotations": annotations,
+        "labels": sorted(
+            ({"id": label.id, "name": label.name} for label in labels),
+            key=lambda label: label["id"],
+        ),
+    }